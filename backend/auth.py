@@ -1,19 +1,39 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, WebSocket
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from . import models, schemas, database
 
 SECRET_KEY = "[ENCRYPTION_KEY]"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Pamięć podręczna token -> użytkownik (rozmiar i maksymalny czas życia wpisu)
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL_SECONDS = 60
+
+# Koszt pbkdf2_sha256 (liczba rund); hasła z inną liczbą rund są przeliczane przy logowaniu
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "29000"))
+# Liczba wątków liczących skróty haseł (pbkdf2 w hashlib zwalnia GIL)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", pbkdf2_sha256__rounds=PBKDF2_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Osobna, ograniczona pula wątków - haszowanie nie blokuje pętli zdarzeń
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -21,6 +41,19 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _run_hashing(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _run_hashing(get_password_hash, password)
+
+# Weryfikuje hasło i zwraca (poprawne, nowy skrót lub None), gdy skrót ma nieaktualne parametry
+async def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
 # Tworzenie tokena JWT (JSON Web Token)
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -33,14 +66,77 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Weryfikacja tokena JWT (z nagłówka lub ciasteczka)
-async def get_current_user(request: Request, token: Optional[str] = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+# Ograniczona pamięć LRU z TTL: zweryfikowany token -> odłączona kopia użytkownika
+# Trafienie oznacza brak jwt.decode i brak zapytania SELECT do tabeli users
+class TokenCache:
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, models.User]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[models.User]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    # expires_at - czas wygaśnięcia tokena (sekundy epoki), wpis nie przeżyje tokena
+    def put(self, token: str, user: models.User, expires_at: Optional[float] = None):
+        lifetime = self.ttl if expires_at is None else min(self.ttl, expires_at - time.time())
+        if lifetime <= 0:
+            return
+        snapshot = models.User(id=user.id, username=user.username, hashed_password=user.hashed_password)
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (time.monotonic() + lifetime, snapshot)
+            self._tokens_by_user.setdefault(snapshot.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_token(self, token: str):
+        with self._lock:
+            self._remove(token)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[1].id]
+
+token_cache = TokenCache()
+
+# Token z nagłówka Authorization lub z ciasteczka access_token
+def token_from_request(request: Request, token: Optional[str] = None) -> Optional[str]:
     if token is None:
         cookie_auth = request.cookies.get("access_token")
         if cookie_auth:
@@ -48,10 +144,25 @@ async def get_current_user(request: Request, token: Optional[str] = Depends(oaut
                  token = cookie_auth.split(" ")[1]
             else:
                  token = cookie_auth
-        
+    return token
+
+# Weryfikacja tokena JWT (z nagłówka lub ciasteczka)
+async def get_current_user(request: Request, token: Optional[str] = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    token = token_from_request(request, token)
     if token is None:
         raise credentials_exception
 
+    cached = token_cache.get(token)
+    if cached is not None:
+        # Dołącza kopię do sesji żądania bez zapytania do bazy
+        return await db.merge(cached, load=False)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -59,7 +170,28 @@ async def get_current_user(request: Request, token: Optional[str] = Depends(oaut
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    token_cache.put(token, user, payload.get("exp"))
     return user
+
+# Użytkownik połączenia WebSocket, ustalany raz przy połączeniu
+# Token z nagłówka Authorization lub ciasteczka (nie z adresu - trafiłby do logów); None, jeśli brak lub niepoprawny
+async def websocket_user(websocket: WebSocket) -> Optional[models.User]:
+    token = None
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    token = token_from_request(websocket, token)
+    if token is None:
+        return None
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    async with database.AsyncSessionLocal() as db:
+        try:
+            return await get_current_user(websocket, token, db)
+        except HTTPException:
+            return None
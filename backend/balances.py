@@ -0,0 +1,144 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, joinedload
+from . import models
+
+# Liczba par sald wczytywanych jednym zapytaniem
+PREFETCH_CHUNK = 400
+
+# Wiersz resource_versions zwiększany, gdy salda zmieniają się bez zmiany wydatków (rebuild_balances)
+VERSION_NAME = "balances"
+
+# Pary (wierzyciel, dłużnik) -> kwota w jednostkach podrzędnych (int, bez błędów zaokrągleń);
+# dodatnia kwota oznacza, że dłużnik jest winien wierzycielowi
+Deltas = Dict[Tuple[int, int], int]
+
+# Zmiany sald wynikające z udziałów jednego wydatku (udziały: obiekty z debtor_id i amount_owed_minor)
+def share_deltas(payer_id: int, shares: Iterable, sign: int = 1, deltas: Optional[Deltas] = None) -> Deltas:
+    deltas = defaultdict(int) if deltas is None else deltas
+    for share in shares:
+        if share.debtor_id is None or share.debtor_id == payer_id:
+            continue
+        key = (payer_id, share.debtor_id)
+        deltas[key] = deltas.get(key, 0) + sign * (share.amount_owed_minor or 0)
+    return deltas
+
+def expense_deltas(expenses: Iterable[models.Expense], sign: int = 1) -> Deltas:
+    deltas: Deltas = defaultdict(int)
+    for expense in expenses:
+        share_deltas(expense.payer_id, expense.shares, sign, deltas)
+    return deltas
+
+def _adjust(db: Session, row: Optional[models.Balance], user_id: int, counterparty_id: int, delta: int):
+    if row is None:
+        if delta:
+            db.add(models.Balance(user_id=user_id, counterparty_id=counterparty_id, amount_minor=delta))
+        return
+    row.amount_minor = (row.amount_minor or 0) + delta
+    if not row.amount_minor:
+        db.delete(row)
+
+# Wczytuje istniejące wiersze sald dla podanych par jednym zapytaniem na porcję
+def _load_rows(db: Session, keys) -> Dict[Tuple[int, int], models.Balance]:
+    keys = list(keys)
+    rows = {}
+    for start in range(0, len(keys), PREFETCH_CHUNK):
+        chunk = keys[start:start + PREFETCH_CHUNK]
+        # OR par zamiast (user_id, counterparty_id) IN (VALUES ...) - SQLite przegląda przy nim całą tabelę
+        query = db.query(models.Balance).filter(
+            or_(*(and_(models.Balance.user_id == user_id, models.Balance.counterparty_id == counterparty_id) for user_id, counterparty_id in chunk))
+        )
+        rows.update(((row.user_id, row.counterparty_id), row) for row in query)
+    return rows
+
+# Nanosi zmiany sald na tabelę (obie strony każdej pary, każda para zmieniana raz)
+# Nie robi commita - wywołujący zatwierdza zmiany razem z wydatkiem
+def apply_deltas(db: Session, *deltas: Deltas):
+    totals: Deltas = defaultdict(int)
+    for part in deltas:
+        for (creditor_id, debtor_id), delta in part.items():
+            totals[(creditor_id, debtor_id)] += delta
+            totals[(debtor_id, creditor_id)] -= delta
+    rows = _load_rows(db, totals)
+    for key, delta in totals.items():
+        _adjust(db, rows.get(key), key[0], key[1], delta)
+    db.flush()
+
+# Aktualizuje saldo par użytkowników dla wydatku (sign=1 dodanie, sign=-1 wycofanie)
+def apply_expense(db: Session, expense: models.Expense, sign: int = 1):
+    apply_deltas(db, expense_deltas([expense], sign))
+
+# Saldo użytkownika - odczyt tylko jego wierszy (O(liczba kontrahentów))
+def get_user_balances(db: Session, user_id: int):
+    return (
+        db.query(models.Balance)
+        .options(joinedload(models.Balance.counterparty))
+        .filter(models.Balance.user_id == user_id)
+        .all()
+    )
+
+# Wersja sald zmienianych poza wydatkami - wspólna dla workerów (0, jeśli nigdy nie przeliczano)
+def version(db: Session) -> int:
+    return db.query(models.ResourceVersion.version).filter(models.ResourceVersion.name == VERSION_NAME).scalar() or 0
+
+def _bump_version(db: Session):
+    updated = (
+        db.query(models.ResourceVersion)
+        .filter(models.ResourceVersion.name == VERSION_NAME)
+        .update({models.ResourceVersion.version: models.ResourceVersion.version + 1}, synchronize_session=False)
+    )
+    if not updated:
+        db.add(models.ResourceVersion(name=VERSION_NAME, version=1))
+
+# Przelicza całą tabelę sald od zera na podstawie expense_shares
+# Zwraca liczbę par, których zapisane saldo różniło się od przeliczonego
+# Zwiększa wersję sald - plany rozliczeń zapamiętane przez workery przestają być aktualne
+def rebuild_balances(db: Session) -> int:
+    rows = (
+        db.query(models.Expense.payer_id, models.ExpenseShare.debtor_id, func.sum(models.ExpenseShare.amount_owed_minor))
+        .join(models.ExpenseShare, models.ExpenseShare.expense_id == models.Expense.id)
+        .filter(models.ExpenseShare.debtor_id.isnot(None))
+        .filter(models.ExpenseShare.debtor_id != models.Expense.payer_id)
+        .group_by(models.Expense.payer_id, models.ExpenseShare.debtor_id)
+        .all()
+    )
+    expected: Deltas = defaultdict(int)
+    for creditor_id, debtor_id, total in rows:
+        expected[(creditor_id, debtor_id)] += total or 0
+        expected[(debtor_id, creditor_id)] -= total or 0
+
+    current = {(b.user_id, b.counterparty_id): b.amount_minor for b in db.query(models.Balance).all()}
+    mismatches = 0
+    for key in set(expected) | set(current):
+        if expected.get(key, 0) != (current.get(key) or 0):
+            mismatches += 1
+
+    db.query(models.Balance).delete()
+    db.add_all(
+        models.Balance(user_id=user_id, counterparty_id=counterparty_id, amount_minor=amount)
+        for (user_id, counterparty_id), amount in expected.items()
+        if amount
+    )
+    _bump_version(db)
+    db.commit()
+    return mismatches
+
+# Wypełnia salda na bazie, która ma już udziały, a nie ma sald (np. baza sprzed tabeli balances:
+# tabela powstaje pusta przy create_all w migracji, zanim rewizja 0002 mogłaby ją przeliczyć)
+def ensure_balances(engine) -> bool:
+    with Session(engine) as db:
+        if db.query(models.Balance.user_id).limit(1).first() is not None:
+            return False
+        if db.query(models.ExpenseShare.id).limit(1).first() is None:
+            return False
+        rebuild_balances(db)
+    return True
+
+# Saldo netto każdego użytkownika (suma po wszystkich kontrahentach)
+def get_net_balances(db: Session):
+    return (
+        db.query(models.Balance.user_id, func.sum(models.Balance.amount_minor))
+        .group_by(models.Balance.user_id)
+        .all()
+    )
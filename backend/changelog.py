@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from . import models, schemas
+
+logger = logging.getLogger(__name__)
+
+# Rodzaje zmian zapisywanych w dzienniku
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+# Po ilu dniach usuwać wpisy o usuniętych wydatkach (nowsze wpisy o istniejących wydatkach zostają zawsze)
+CHANGELOG_RETENTION_DAYS = float(os.getenv("CHANGELOG_RETENTION_DAYS", "30"))
+# Co ile sekund kompaktować dziennik (0 wyłącza)
+CHANGELOG_COMPACT_INTERVAL = float(os.getenv("CHANGELOG_COMPACT_INTERVAL", "3600"))
+# Maksymalna liczba zmian zwracanych jednym zapytaniem
+MAX_CHANGES_PAGE = 1000
+
+# Wydatek w kształcie schemas.Expense (relacje payer i shares.debtor muszą być wczytane)
+def expense_payload(expense: models.Expense) -> dict:
+    return schemas.Expense.model_validate(expense).model_dump(mode="json")
+
+# Dopisuje zmianę w sesji - trafi do bazy razem z commitem zmiany wydatku; seq jest znany po flushu
+def record(db: Session, op: str, expense_id: int, payload: Optional[dict] = None) -> models.ExpenseChange:
+    change = models.ExpenseChange(expense_id=expense_id, op=op, payload=json.dumps(payload) if payload is not None else None)
+    db.add(change)
+    return change
+
+# Dopisuje wiele zmian jednym poleceniem executemany; zwraca seq ostatniej z nich
+def record_many(db: Session, op: str, payloads: Iterable[dict]) -> int:
+    rows = [{"expense_id": payload["id"], "op": op, "payload": json.dumps(payload)} for payload in payloads]
+    if rows:
+        db.execute(insert(models.ExpenseChange), rows)
+    return latest_seq(db)
+
+def horizon(db: Session) -> int:
+    return db.execute(select(models.ChangeLogState.horizon).where(models.ChangeLogState.id == 1)).scalar() or 0
+
+def latest_seq(db: Session) -> int:
+    return max(db.execute(select(func.max(models.ExpenseChange.seq))).scalar() or 0, horizon(db))
+
+# Zmiany po numerze since, od najstarszej
+# reset=True oznacza, że część zmian po since usunęła już retencja - klient wczytuje listę od nowa
+def changes_since(db: Session, since: int, limit: int = MAX_CHANGES_PAGE) -> dict:
+    latest = latest_seq(db)
+    if since < horizon(db):
+        return {"changes": [], "latest_seq": latest, "has_more": False, "reset": True}
+    rows = db.execute(
+        select(models.ExpenseChange)
+        .where(models.ExpenseChange.seq > since)
+        .order_by(models.ExpenseChange.seq)
+        .limit(limit + 1)
+    ).scalars().all()
+    has_more = len(rows) > limit
+    changes = [
+        {
+            "seq": row.seq,
+            "op": row.op,
+            "expense_id": row.expense_id,
+            "expense": json.loads(row.payload) if row.payload else None,
+            "timestamp": row.timestamp,
+        }
+        for row in rows[:limit]
+    ]
+    return {"changes": changes, "latest_seq": latest, "has_more": has_more, "reset": False}
+
+# Kompaktowanie dziennika:
+#  - z kilku zmian tego samego wydatku zostaje tylko ostatnia (zawiera pełny stan wydatku)
+#  - wpisy o usunięciu starsze niż retention_days są usuwane, a horyzont przesuwany za nie
+# Zwraca (liczba usuniętych zmian zastąpionych nowszymi, liczba usuniętych przeterminowanych wpisów)
+def compact(db: Session, retention_days: float = CHANGELOG_RETENTION_DAYS) -> Tuple[int, int]:
+    latest_per_expense = select(func.max(models.ExpenseChange.seq)).group_by(models.ExpenseChange.expense_id)
+    superseded = db.execute(
+        delete(models.ExpenseChange).where(models.ExpenseChange.seq.not_in(latest_per_expense.scalar_subquery()))
+    ).rowcount
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    expired_filter = (models.ExpenseChange.op == DELETED) & (models.ExpenseChange.timestamp < cutoff)
+    expired_max = db.execute(select(func.max(models.ExpenseChange.seq)).where(expired_filter)).scalar()
+    expired = 0
+    if expired_max is not None:
+        expired = db.execute(delete(models.ExpenseChange).where(expired_filter)).rowcount
+        state = db.get(models.ChangeLogState, 1)
+        if state is None:
+            db.add(models.ChangeLogState(id=1, horizon=expired_max))
+        else:
+            state.horizon = max(state.horizon or 0, expired_max)
+    db.commit()
+    return superseded, expired
+
+# Okresowe kompaktowanie dziennika (uruchamiane jako zadanie w tle aplikacji)
+async def compaction(session_factory, interval: float = CHANGELOG_COMPACT_INTERVAL):
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                superseded, expired = await db.run_sync(compact)
+            if superseded or expired:
+                logger.info(f"Change log compacted: {superseded} superseded, {expired} expired")
+        except Exception as e:
+            logger.warning(f"Change log compaction failed: {e}")
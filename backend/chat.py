@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from . import httpcache, models, pagination, publisher, schemas, serializers
+from .ids import IdAllocator
+from .database import AsyncSessionLocal
+from .protocols import MQTT_TOPIC_CHAT
+from .realtime import backplane, manager
+
+logger = logging.getLogger(__name__)
+
+# Liczba najnowszych wiadomości trzymanych w pamięci (początkowa historia czatu)
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "50"))
+# Wiadomości nie mają jeszcze pokojów - wszystkie należą do jednego
+DEFAULT_ROOM = "general"
+
+# Zapis wiadomości partiami: najwyżej CHAT_BATCH_SIZE wiadomości, zbieranych przez CHAT_FLUSH_INTERVAL sekund
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", "200"))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.005"))
+# Maksymalna liczba wiadomości czekających na zapis (pełna kolejka wstrzymuje nadawców)
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "10000"))
+# Ile identyfikatorów wiadomości worker rezerwuje naraz
+CHAT_ID_BLOCK_SIZE = int(os.getenv("CHAT_ID_BLOCK_SIZE", "1000"))
+# Ponowienia nieudanego zapisu partii i odstęp przed pierwszym z nich (sekundy, podwajany)
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "3"))
+CHAT_RETRY_BACKOFF = float(os.getenv("CHAT_RETRY_BACKOFF", "0.05"))
+
+class _Room:
+    def __init__(self):
+        # id -> wiadomość, od najstarszej do najnowszej
+        self.messages: "OrderedDict[int, schemas.Message]" = OrderedDict()
+        self.loaded = False
+        self.has_older = False
+        # Zmiany z czasu wczytywania z bazy - nanoszone po wczytaniu
+        self.pending: List[Tuple[str, tuple]] = []
+
+# Bufor cykliczny najnowszych wiadomości każdego pokoju
+# Wczytywany z bazy raz (przy pierwszym odczycie), potem aktualizowany przez /ws,
+# edycję i usuwanie wiadomości oraz zdarzenia czatu z innych workerów
+class RecentMessages:
+    def __init__(self, size: int = CHAT_HISTORY_SIZE):
+        self.size = size
+        self._rooms: Dict[str, _Room] = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def _room(self, room: str) -> _Room:
+        if room not in self._rooms:
+            self._rooms[room] = _Room()
+        return self._rooms[room]
+
+    # Najnowsze wiadomości (najwyżej limit, od najstarszej) i kursor do wcześniejszych
+    async def latest(self, db: AsyncSession, limit: Optional[int] = None, room: str = DEFAULT_ROOM) -> Tuple[List[schemas.Message], Optional[str]]:
+        state = self._room(room)
+        if state.loaded:
+            self.hits += 1
+        else:
+            async with self._lock:
+                if not state.loaded:
+                    await self._load(db, state)
+        items = list(state.messages.values())
+        has_older = state.has_older
+        if limit is not None and len(items) > limit:
+            items = items[-limit:]
+            has_older = True
+        next_cursor = pagination.encode_cursor(items[0].timestamp, items[0].id) if items and has_older else None
+        return items, next_cursor
+
+    async def _load(self, db: AsyncSession, state: _Room):
+        result = await db.execute(
+            select(models.Message)
+            .options(joinedload(models.Message.user))
+            .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+            .limit(self.size + 1)
+        )
+        rows = result.scalars().all()
+        state.messages = OrderedDict((row.id, schemas.Message.model_validate(row)) for row in reversed(rows[:self.size]))
+        state.has_older = len(rows) > self.size
+        state.loaded = True
+        self.loads += 1
+        pending, state.pending = state.pending, []
+        for operation, args in pending:
+            getattr(self, operation)(*args)
+
+    def add(self, message: schemas.Message, room: str = DEFAULT_ROOM):
+        state = self._room(room)
+        if not state.loaded:
+            state.pending.append(("add", (message, room)))
+            return
+        state.messages[message.id] = message
+        last = next(reversed(state.messages.values()))
+        if last is not message and (last.timestamp, last.id) > (message.timestamp, message.id):
+            state.messages = OrderedDict(sorted(state.messages.items(), key=lambda item: (item[1].timestamp, item[1].id)))
+        while len(state.messages) > self.size:
+            state.messages.popitem(last=False)
+            state.has_older = True
+
+    def update(self, message_id: int, content: str, room: str = DEFAULT_ROOM):
+        state = self._room(room)
+        if not state.loaded:
+            state.pending.append(("update", (message_id, content, room)))
+            return
+        message = state.messages.get(message_id)
+        if message is not None:
+            state.messages[message_id] = message.model_copy(update={"content": content})
+
+    def remove(self, message_id: int, room: str = DEFAULT_ROOM):
+        state = self._room(room)
+        if not state.loaded:
+            state.pending.append(("remove", (message_id, room)))
+            return
+        state.messages.pop(message_id, None)
+
+    # Zdarzenie czatu z innego workera (przez backplane)
+    def apply_event(self, event: dict):
+        kind = event.get("event")
+        if kind == "chat" and event.get("message_id") and event.get("user_id") and event.get("timestamp"):
+            self.add(schemas.Message(
+                id=event["message_id"],
+                user_id=event["user_id"],
+                content=event.get("msg") or "",
+                timestamp=datetime.fromisoformat(event["timestamp"]),
+                user=schemas.User(id=event["user_id"], username=event.get("user") or ""),
+            ))
+        elif kind == "update_message" and event.get("message_id"):
+            self.update(event["message_id"], event.get("content") or "")
+        elif kind == "delete_message" and event.get("message_id"):
+            self.remove(event["message_id"])
+
+    def clear(self):
+        self._rooms.clear()
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "messages": sum(len(state.messages) for state in self._rooms.values()),
+            "size": self.size,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
+
+history = RecentMessages()
+
+# Wiadomości z bazy (historia spoza bufora) od najnowszej, kursorem po (timestamp, id)
+# Wspólne dla /chat/history i sprawdzania planów zapytań; ValueError dla niepoprawnego kursora
+def page_query(limit: int, cursor: Optional[str] = None):
+    query = serializers.message_columns()
+    if cursor:
+        query = query.where(pagination.older_than(models.Message.timestamp, models.Message.id, cursor))
+    return query.order_by(models.Message.timestamp.desc(), models.Message.id.desc()).limit(limit + 1)
+
+class _PendingMessage:
+    __slots__ = ("event", "user", "timestamp", "saved")
+
+    def __init__(self, event: dict, user: models.User, timestamp: datetime):
+        self.event = event
+        self.user = user
+        self.timestamp = timestamp
+        # True po zapisie, False, jeśli wiadomości nie udało się zapisać
+        self.saved: asyncio.Future = asyncio.get_running_loop().create_future()
+
+# Zapis wiadomości po zatrzymaniu (albo w trakcie zatrzymywania) ChatWriter
+class WriterClosed(Exception):
+    pass
+
+# Zapis wiadomości czatu w tle (write-behind)
+# submit() nadaje id i czas od razu i dopisuje wiadomość do bufora historii, więc można ją
+# rozesłać przed zapisem do bazy. Zadanie w tle zapisuje zebrane wiadomości i ich wpisy
+# outboksu jednym commitem, a potem przekazuje je do MQTT/innych workerów.
+# Nieudany commit partii jest ponawiany (np. "database is locked"); wiadomości, których nie udało się
+# zapisać, znikają z bufora historii, a klienci tego workera dostają delete_message (innym workerom
+# wiadomości trafiają dopiero po zapisie).
+class ChatWriter:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = CHAT_BATCH_SIZE,
+        flush_interval: float = CHAT_FLUSH_INTERVAL,
+        queue_size: int = CHAT_QUEUE_SIZE,
+        retries: int = CHAT_WRITE_RETRIES,
+        retry_backoff: float = CHAT_RETRY_BACKOFF,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.ids = IdAllocator("messages", models.Message.id, session_factory, CHAT_ID_BLOCK_SIZE)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # id wiadomości -> wynik zapisu (_PendingMessage.saved)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    # Przestaje przyjmować wiadomości, zapisuje przyjęte i zatrzymuje zadanie w tle
+    # (przy zamykaniu aplikacji po rozłączeniu klientów WebSocket)
+    async def stop(self):
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            await self.drain()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        finally:
+            self._closing = False
+
+    # Zwraca zdarzenie czatu gotowe do rozesłania; zapis do bazy nastąpi w tle
+    async def submit(self, user: models.User, content: str) -> dict:
+        if self._closing:
+            raise WriterClosed("Chat writer is stopping")
+        if self._task is None:
+            await self.start()
+        message_id = await self.ids.next_id()
+        timestamp = models.utcnow()
+        event = {
+            "event": "chat",
+            "user": user.username,
+            "msg": content,
+            "message_id": message_id,
+            "user_id": user.id,
+            "timestamp": timestamp.isoformat(),
+        }
+        item = _PendingMessage(event, user, timestamp)
+        self._pending[message_id] = item.saved
+        await self.queue.put(item)
+        # Historia pokazuje to samo, co zostało rozesłane - także wiadomości jeszcze niezapisane
+        history.add(schemas.Message(
+            id=message_id,
+            user_id=user.id,
+            content=content,
+            timestamp=timestamp,
+            user=schemas.User(id=user.id, username=user.username),
+        ))
+        return event
+
+    def is_pending(self, message_id: int) -> bool:
+        return message_id in self._pending
+
+    # Czeka na zapis jednej wiadomości (niezależnie od reszty kolejki); False - wiadomość nie została zapisana
+    async def wait_saved(self, message_id: int) -> bool:
+        saved = self._pending.get(message_id)
+        if saved is None:
+            return True
+        return await asyncio.shield(saved)
+
+    # Czeka na zapis wiadomości przyjętych do tej chwili (późniejsze nie przedłużają czekania)
+    async def drain(self):
+        if self._pending and self._task is not None:
+            await asyncio.gather(*self._pending.values())
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.flush_interval > 0:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            saved = False
+            try:
+                saved = await self._write_with_retry(batch)
+            finally:
+                for item in batch:
+                    self._pending.pop(item.event["message_id"], None)
+                    if not item.saved.done():
+                        item.saved.set_result(saved)
+            if not saved:
+                await self._discard(batch)
+
+    # Ponawia zapis partii z wykładniczym odstępem; False, jeśli wszystkie próby się nie udały
+    async def _write_with_retry(self, batch: List[_PendingMessage]) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(batch)
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    self.failed += len(batch)
+                    logger.error(f"Failed to save {len(batch)} chat message(s) after {attempt + 1} attempt(s): {e}")
+                    return False
+                self.retried += 1
+                logger.warning(f"Saving {len(batch)} chat message(s) failed, retrying: {e}")
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        return False
+
+    # Wiadomości rozesłane, ale niezapisane - usuwane z historii i z widoku klientów tego workera
+    async def _discard(self, batch: List[_PendingMessage]):
+        for item in batch:
+            history.remove(item.event["message_id"])
+        httpcache.versions.bump(httpcache.MESSAGES)
+        for item in batch:
+            await manager.broadcast({"event": "delete_message", "message_id": item.event["message_id"], "reason": "not_saved"})
+
+    # Trzy polecenia i jeden commit na partię: wiadomości (executemany), ich wpisy outboksu i wersja historii
+    async def _write(self, batch: List[_PendingMessage]):
+        async with self.session_factory() as db:
+            await db.execute(insert(models.Message), [
+                {
+                    "id": item.event["message_id"],
+                    "user_id": item.user.id,
+                    "content": item.event["msg"],
+                    "timestamp": item.timestamp,
+                }
+                for item in batch
+            ])
+            outbox_ids = await publisher.stage_many(db, [item.event for item in batch], MQTT_TOPIC_CHAT)
+            await httpcache.versions.stage(db, httpcache.MESSAGES)
+            await db.commit()
+        self.written += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+
+        for item, outbox_id in zip(batch, outbox_ids):
+            await backplane.publish(item.event, MQTT_TOPIC_CHAT, outbox_id)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "pending": len(self._pending),
+            "written": self.written,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+        }
+
+writer = ChatWriter()
@@ -1,18 +1,112 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./expenses.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./expenses.db")
 
+# Pula połączeń asynchronicznego silnika (dla Postgresa: DATABASE_URL=postgresql://..., wymaga asyncpg)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Zamienia adres bazy na wariant ze sterownikiem asynchronicznym
+def async_database_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+_is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Profile ustawień SQLite ustawiane przy każdym nowym połączeniu (SQLITE_PROFILE)
+#  default - ustawienia domyślne SQLite (dziennik rollback, synchronous FULL, bez busy_timeout)
+#  wal     - WAL + synchronous NORMAL: równoległe odczyty podczas zapisu, jeden fsync na checkpoint
+#  durable - WAL + synchronous FULL: fsync przy każdym commicie
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "busy_timeout": 10000,
+    },
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+# Co ile sekund robić wal_checkpoint i PRAGMA optimize (0 wyłącza)
+SQLITE_MAINTENANCE_INTERVAL = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "300"))
+
+logger = logging.getLogger(__name__)
+
+# Rejestruje ustawianie PRAGMA profilu przy nawiązywaniu połączenia (silnik sync lub async.sync_engine)
+def apply_sqlite_profile(sync_engine, profile: str):
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}, use one of: {', '.join(SQLITE_PROFILES)}")
+    pragmas = SQLITE_PROFILES[profile]
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+# Silnik synchroniczny - tworzenie schematu i polecenia administracyjne (backend.manage)
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if _is_sqlite else {}
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Silnik asynchroniczny - używany przez wszystkie endpointy, nie blokuje pętli zdarzeń
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=not _is_sqlite,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if _is_sqlite:
+    apply_sqlite_profile(engine, SQLITE_PROFILE)
+    apply_sqlite_profile(async_engine.sync_engine, SQLITE_PROFILE)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Okresowy checkpoint WAL i PRAGMA optimize (uruchamiane jako zadanie w tle aplikacji)
+async def sqlite_maintenance(interval: float = SQLITE_MAINTENANCE_INTERVAL):
+    if not _is_sqlite or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_sqlite_maintenance()
+        except Exception as e:
+            logger.warning(f"SQLite maintenance failed: {e}")
+
+async def run_sqlite_maintenance():
+    if not _is_sqlite:
+        return
+    async with async_engine.connect() as conn:
+        if SQLITE_PROFILES.get(SQLITE_PROFILE, {}).get("journal_mode") == "WAL":
+            await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        await conn.exec_driver_sql("PRAGMA optimize")
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
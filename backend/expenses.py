@@ -0,0 +1,47 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import balances, changelog, httpcache, models, pagination, publisher, reports, serializers
+from . import search as fulltext
+from .models import OutboxEvent
+
+# Zapytania i zmiany wydatków wspólne dla tras (routes/expenses.py) i sprawdzania planów zapytań
+# (queryplan.py) - sprawdzane są dokładnie te polecenia SQL, które wykonuje endpoint.
+
+# Strona listy od najnowszych, kursorem po (timestamp, id); ValueError dla niepoprawnego kursora
+def page_query(limit: int, cursor: Optional[str] = None, search: Optional[str] = None):
+    query = serializers.expense_columns()
+    if search:
+        match = fulltext.match_query(search) if fulltext.enabled() else None
+        if match:
+            # Wyszukiwanie pełnotekstowe (FTS5, słowa jako prefiksy)
+            query = query.where(models.Expense.id.in_(fulltext.expense_ids_matching(match)))
+        else:
+            # Wyszukiwanie wzorcowe
+            query = query.where(models.Expense.description.contains(search))
+    if cursor:
+        query = query.where(pagination.older_than(models.Expense.timestamp, models.Expense.id, cursor))
+    return query.order_by(models.Expense.timestamp.desc(), models.Expense.id.desc()).limit(limit + 1)
+
+# Wykonuje zapytanie z page_query: (seq, wydatki, nazwy użytkowników, kursor następnej strony)
+# Numer zmiany odczytany przed listą - klient synchronizuje się od niego przez /expenses/changes
+async def read_page(db: AsyncSession, query, limit: int, shape: str = serializers.FULL) -> Tuple[int, List[dict], Dict[int, str], Optional[str]]:
+    seq = await db.run_sync(changelog.latest_seq)
+    result = await db.execute(query)
+    rows, next_cursor = pagination.page(result.all(), limit)
+    items, names = await serializers.expense_dicts(db, rows, shape)
+    return seq, items, names, next_cursor
+
+# Usuwa wydatek w sesji: salda, zestawienia, dziennik zmian, outboks i wersja listy (commit robi wywołujący)
+# Zwraca zdarzenie do rozesłania po commicie i jego wpis outboksu
+async def delete(db: AsyncSession, expense: models.Expense) -> Tuple[dict, Optional[OutboxEvent]]:
+    expense_id = expense.id
+    await db.run_sync(balances.apply_expense, expense, -1)
+    await db.run_sync(reports.apply_expense, expense, -1)
+    await db.delete(expense)
+    change = changelog.record(db, changelog.DELETED, expense_id)
+    await db.flush()
+    message = {"event": "delete_expense", "expense_id": expense_id, "seq": change.seq}
+    outbox = publisher.stage(db, message)
+    await httpcache.versions.stage(db, httpcache.EXPENSES)
+    await db.flush()
+    return message, outbox
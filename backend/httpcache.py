@@ -0,0 +1,258 @@
+import gzip
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import Depends, Request
+from fastapi.responses import Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, models
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Warunkowe GET dla list (użytkownicy, wydatki, historia czatu): wersja zasobu to licznik w bazie
+# (tabela resource_versions, zwiększany w transakcji każdej zmiany - wspólny dla wszystkich workerów,
+# także bez backplane). Słaby ETag tylko z tego licznika jest taki sam w każdym workerze, więc 304
+# (po jednym zapytaniu o wersję) działa także za load balancerem. Gotowe odpowiedzi (także
+# skompresowane gzip/brotli) są trzymane w pamięci podręcznej LRU tego procesu do zmiany wersji
+# w bazie albo licznika w tym procesie (zmiany tylko w pamięci, np. usunięcie niezapisanej wiadomości
+# z bufora historii czatu, oraz zdarzenia innych workerów z backplane).
+# Wersja jest odczytywana przed zapytaniami trasy (w tej samej transakcji), więc wpis nigdy nie ma
+# danych starszych niż jego wersja.
+
+# Liczba zapamiętanych odpowiedzi i ich łączny rozmiar w bajtach (z wariantami skompresowanymi); 0 wyłącza
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "256"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Odpowiedzi od tego rozmiaru są kompresowane, jeśli klient to akceptuje (Accept-Encoding)
+HTTP_COMPRESS_MIN_SIZE = int(os.getenv("HTTP_COMPRESS_MIN_SIZE", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+
+USERS = "users"
+EXPENSES = "expenses"
+MESSAGES = "messages"
+RESOURCES = (USERS, EXPENSES, MESSAGES)
+
+# Przeglądarka zawsze pyta serwer (If-None-Match), ale może użyć swojej kopii po 304
+CACHE_CONTROL = "private, no-cache"
+
+# Zasoby zmieniane przez zdarzenia backplane (także od innych workerów)
+EVENT_RESOURCES = {
+    "new_expense": (EXPENSES,),
+    "update_expense": (EXPENSES,),
+    "delete_expense": (EXPENSES,),
+    "import_expenses": (EXPENSES,),
+    "chat": (MESSAGES,),
+    "update_message": (MESSAGES,),
+    "delete_message": (MESSAGES,),
+    "new_user": (USERS,),
+    # Wydatki i wiadomości zawierają nazwę użytkownika
+    "delete_user": (USERS, EXPENSES, MESSAGES),
+}
+
+# Wersja zasobu: (licznik w bazie, licznik w tym procesie)
+Version = Tuple[int, int]
+
+class ResourceVersions:
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+
+    # Licznik w tym procesie
+    def get(self, resource: str) -> int:
+        return self._versions.get(resource, 0)
+
+    # Zmiana widoczna tylko w tym procesie albo już zatwierdzona (po commicie)
+    def bump(self, *resources: str):
+        for resource in resources:
+            self._versions[resource] = self._versions.get(resource, 0) + 1
+
+    # Zwiększa licznik w bazie w transakcji zmiany (przed commitem) - widoczny dla wszystkich workerów
+    async def stage(self, db: AsyncSession, *resources: str):
+        await db.execute(
+            update(models.ResourceVersion)
+            .where(models.ResourceVersion.name.in_(resources))
+            .values(version=models.ResourceVersion.version + 1)
+        )
+
+    async def current(self, db: AsyncSession, resource: str) -> Version:
+        stored = (await db.execute(select(models.ResourceVersion.version).where(models.ResourceVersion.name == resource))).scalar()
+        return (stored or 0, self.get(resource))
+
+    # Tylko z licznika w bazie - ten sam ETag w każdym workerze
+    def etag(self, resource: str, version: Version) -> str:
+        return f'W/"{resource}.{version[0]}"'
+
+    # Zdarzenie z innego workera (backplane.remote_listeners)
+    def apply_event(self, event: dict):
+        self.bump(*EVENT_RESOURCES.get(event.get("event"), ()))
+
+versions = ResourceVersions()
+
+class _Entry:
+    __slots__ = ("version", "body", "media_type", "encoded", "size")
+
+    def __init__(self, version: Version, body: bytes, media_type: str):
+        self.version = version
+        self.body = body
+        self.media_type = media_type
+        self.encoded: Dict[str, bytes] = {}
+        self.size = len(body)
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+
+# Kodowania z Accept-Encoding (bez tych z q=0)
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def choose_encoding(header: str) -> Optional[str]:
+    accepted = _accepted_encodings(header)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+# Weak comparison (RFC 9110): W/ jest pomijane
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+# Odpowiedzi list według (trasa, parametry zapytania); wpis z inną wersją zasobu jest nieaktualny
+class ResponseCache:
+    def __init__(self, maxsize: int = HTTP_CACHE_SIZE, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.not_modified = 0
+        self.compressed = 0
+
+    def get(self, key: tuple, version: Version) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.version != version:
+            self._remove(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, entry: _Entry):
+        if not self.maxsize or entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        self._evict()
+
+    # Wariant skompresowany liczony raz na wpis
+    def encode(self, key: tuple, entry: _Entry, encoding: str) -> bytes:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = _compress(entry.body, encoding)
+            self.compressed += 1
+            entry.size += len(body)
+            if self._entries.get(key) is entry:
+                self.bytes += len(body)
+                self._evict()
+        return body
+
+    def _remove(self, key: tuple):
+        self.bytes -= self._entries.pop(key).size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.maxsize or self.bytes > self.max_bytes):
+            self.bytes -= self._entries.popitem(last=False)[1].size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+            "compressed": self.compressed,
+        }
+
+cache = ResponseCache()
+
+# Odczyt listy z pamięci podręcznej w trasie (zależność FastAPI, po uwierzytelnieniu):
+#   if (hit := cached.hit()) is not None: return hit
+#   ... return cached.store(odpowiedź)
+class CachedRead:
+    def __init__(self, request: Request, resource: str, version: Version):
+        self.request = request
+        self.resource = resource
+        self.version = version
+        self.etag = versions.etag(resource, self.version)
+        self.key = (resource, request.url.path, tuple(sorted(request.query_params.multi_items())))
+        self.encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+
+    def _headers(self) -> Dict[str, str]:
+        return {"ETag": self.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+    # 304 dla aktualnego If-None-Match, zapamiętana odpowiedź albo None
+    def hit(self) -> Optional[Response]:
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, self.etag):
+            cache.not_modified += 1
+            return Response(status_code=304, headers=self._headers())
+        entry = cache.get(self.key, self.version)
+        if entry is None:
+            return None
+        return self._response(entry)
+
+    def store(self, response: Response) -> Response:
+        entry = _Entry(self.version, bytes(response.body), response.media_type)
+        cache.put(self.key, entry)
+        return self._response(entry)
+
+    def _response(self, entry: _Entry) -> Response:
+        headers = self._headers()
+        body = entry.body
+        if self.encoding and len(body) >= HTTP_COMPRESS_MIN_SIZE:
+            body = cache.encode(self.key, entry, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+        return Response(content=body, media_type=entry.media_type, headers=headers)
+
+def reader(resource: str):
+    async def dependency(request: Request, db: AsyncSession = Depends(database.get_db)) -> CachedRead:
+        return CachedRead(request, resource, await versions.current(db, resource))
+    return dependency
@@ -0,0 +1,68 @@
+import asyncio
+import os
+from typing import Tuple
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from . import models
+from .database import AsyncSessionLocal
+
+# Ile identyfikatorów worker rezerwuje naraz
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "1000"))
+
+# Przydziela identyfikatory z bloków rezerwowanych w tabeli id_blocks (jedno zapytanie na blok)
+# Dzięki temu id wiersza jest znane przed zapisem, także przy wielu workerach, a wiele wierszy
+# można wstawić jednym executemany bez RETURNING.
+# Wiersze tabeli name nie mogą być wstawiane z autoinkrementacją, bo mogłyby zająć zarezerwowane numery.
+# Rezerwacja to osobna transakcja - wywoływać przed pierwszym zapisem w sesji żądania (SQLite ma jednego pisarza).
+class IdAllocator:
+    def __init__(self, name: str, id_column, session_factory=AsyncSessionLocal, block_size: int = ID_BLOCK_SIZE):
+        self.name = name
+        self.id_column = id_column
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    self._next, self._end = await self._reserve(self.block_size)
+        value = self._next
+        self._next += 1
+        return value
+
+    # count kolejnych identyfikatorów; reszta bieżącego bloku przepada, jeśli jest za mała
+    async def next_ids(self, count: int) -> range:
+        async with self._lock:
+            if self._end - self._next < count:
+                self._next, self._end = await self._reserve(max(count, self.block_size))
+            start = self._next
+            self._next += count
+        return range(start, start + count)
+
+    async def _reserve(self, size: int) -> Tuple[int, int]:
+        async with self.session_factory() as db:
+            end = (await db.execute(
+                update(models.IdBlock)
+                .where(models.IdBlock.name == self.name)
+                .values(next_value=models.IdBlock.next_value + size)
+                .returning(models.IdBlock.next_value)
+            )).scalar()
+            if end is not None:
+                await db.commit()
+                return end - size, end
+            # Pierwsza rezerwacja - numeracja zaczyna się za największym istniejącym id
+            start = ((await db.execute(select(func.max(self.id_column)))).scalar() or 0) + 1
+            db.add(models.IdBlock(name=self.name, next_value=start + size))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Inny worker utworzył wiersz w tym samym czasie
+                await db.rollback()
+                return await self._reserve(size)
+            return start, start + size
+
+# Wydatki - pojedyncze i importowane partiami
+expense_ids = IdAllocator("expenses", models.Expense.id)
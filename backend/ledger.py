@@ -0,0 +1,196 @@
+import codecs
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy import select
+from . import models, money
+
+# Eksport i import całej księgi wydatków (CSV albo NDJSON) strumieniowo:
+# eksport czyta wiersze kursorem po stronie serwera porcjami po EXPORT_CHUNK i od razu je wysyła,
+# import parsuje treść żądania w miarę jej nadchodzenia - pamięć nie zależy od liczby wydatków.
+
+CSV = "csv"
+NDJSON = "ndjson"
+MEDIA_TYPES = {CSV: "text/csv", NDJSON: "application/x-ndjson"}
+
+# Liczba wierszy pobieranych z kursora bazy naraz (i wysyłanych jednym kawałkiem odpowiedzi)
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "2000"))
+# Liczba wydatków zapisywanych w jednej transakcji importu
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Ile błędnych rekordów opisywać w wyniku importu (pozostałe są tylko liczone)
+MAX_IMPORT_ERRORS = 100
+
+# Kwoty w CSV jako dokładny zapis dziesiętny w jednostkach głównych (12.34), w walucie z kolumny currency
+CSV_COLUMNS = ["id", "timestamp", "payer_id", "payer", "amount", "currency", "description", "shares"]
+
+# Format z parametru albo z nagłówka Content-Type; None, jeśli nie da się go ustalić
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    if requested:
+        return requested if requested in MEDIA_TYPES else None
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in ("text/csv", "application/csv"):
+        return CSV
+    if media_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return NDJSON
+    return None
+
+# Udziały w kolumnie CSV: "dłużnik:kwota;dłużnik:kwota" (kwoty udziałów w jednostkach podrzędnych)
+def format_shares(shares: List[Tuple[int, int]], currency: str = money.CURRENCY) -> str:
+    return ";".join(f"{debtor_id}:{money.format_minor(amount_owed or 0, currency)}" for debtor_id, amount_owed in shares)
+
+def parse_shares(text: str) -> List[dict]:
+    shares = []
+    for part in (text or "").split(";"):
+        if not part.strip():
+            continue
+        debtor_id, separator, amount_owed = part.partition(":")
+        if not separator:
+            raise ValueError(f"shares: expected debtor_id:amount, got {part.strip()!r}")
+        shares.append({"debtor_id": debtor_id.strip(), "amount_owed": amount_owed.strip()})
+    return shares
+
+def _export_query():
+    expense, share = models.Expense, models.ExpenseShare
+    return (
+        select(
+            expense.id, expense.timestamp, expense.payer_id, expense.amount_minor, expense.currency, expense.description,
+            share.id, share.debtor_id, share.amount_owed_minor,
+        )
+        .outerjoin(share, share.expense_id == expense.id)
+        .order_by(expense.id, share.id)
+    )
+
+class _Writer:
+    def __init__(self, fmt: str, usernames: dict):
+        self.fmt = fmt
+        self.usernames = usernames
+        self.buffer = io.StringIO()
+        self.csv = csv.writer(self.buffer, lineterminator="\n") if fmt == CSV else None
+        if self.csv is not None:
+            self.csv.writerow(CSV_COLUMNS)
+
+    def write(self, expense_id, timestamp, payer_id, amount_minor, currency, description, shares):
+        timestamp = timestamp.isoformat() if timestamp is not None else None
+        currency = currency or money.CURRENCY
+        if self.csv is not None:
+            amount = money.format_minor(amount_minor, currency) if amount_minor is not None else ""
+            self.csv.writerow([expense_id, timestamp or "", payer_id, self.usernames.get(payer_id, ""), amount, currency, description or "", format_shares(shares, currency)])
+            return
+        self.buffer.write(json.dumps({
+            "id": expense_id,
+            "timestamp": timestamp,
+            "payer_id": payer_id,
+            "payer": self.usernames.get(payer_id),
+            "amount": money.to_major(amount_minor, currency),
+            "amount_minor": amount_minor,
+            "currency": currency,
+            "description": description,
+            "shares": [
+                {"debtor_id": debtor_id, "amount_owed": money.to_major(amount_owed, currency), "amount_owed_minor": amount_owed}
+                for debtor_id, amount_owed in shares
+            ],
+        }, ensure_ascii=False, separators=(",", ":")))
+        self.buffer.write("\n")
+
+    def take(self) -> bytes:
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+# Kolejne kawałki eksportu; sesja jest otwierana tu, bo generator działa dłużej niż obsługa żądania
+async def export_chunks(session_factory, fmt: str, chunk: int = EXPORT_CHUNK) -> AsyncIterator[bytes]:
+    async with session_factory() as db:
+        usernames = dict((await db.execute(select(models.User.id, models.User.username))).all())
+        writer = _Writer(fmt, usernames)
+        current = None
+        result = await db.stream(_export_query().execution_options(yield_per=chunk))
+        async for rows in result.partitions():
+            for expense_id, timestamp, payer_id, amount_minor, currency, description, share_id, debtor_id, amount_owed in rows:
+                # Wiersze jednego wydatku (po jednym na udział) są kolejne - skleja je w jeden rekord
+                if current is None or current[0] != expense_id:
+                    if current is not None:
+                        writer.write(*current)
+                    current = (expense_id, timestamp, payer_id, amount_minor, currency, description, [])
+                if share_id is not None:
+                    current[6].append((debtor_id, amount_owed))
+            data = writer.take()
+            if data:
+                yield data
+        if current is not None:
+            writer.write(*current)
+        data = writer.take()
+        if data:
+            yield data
+
+# Linie tekstu z kolejnych kawałków bajtów (UTF-8, opcjonalny BOM)
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for data in chunks:
+        pending += decoder.decode(data)
+        if "\n" not in pending:
+            continue
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def _csv_item(row: dict) -> dict:
+    return {
+        "amount": row.get("amount"),
+        "currency": row.get("currency") or None,
+        "description": row.get("description") or "",
+        "timestamp": row.get("timestamp") or None,
+        "shares": parse_shares(row.get("shares", "")),
+    }
+
+# Rekordy importu w miarę nadchodzenia danych: (numer linii, dane wydatku albo None, błędy)
+# Kolumny CSV są rozpoznawane po nagłówku (id, payer_id i payer są pomijane - płacącym jest importujący)
+# Zgłasza ValueError, jeśli nagłówek CSV nie ma kolumny amount
+async def records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Optional[dict], List[str]]]:
+    number = 0
+    if fmt == NDJSON:
+        async for line in _lines(chunks):
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield number, None, [f"invalid JSON: {e}"]
+                continue
+            yield number, item, []
+        return
+
+    header = None
+    record, first = "", 0
+    async for line in _lines(chunks):
+        number += 1
+        if not record:
+            first = number
+        record = line if not record else record + "\n" + line
+        # Nieparzysta liczba cudzysłowów - pole w cudzysłowie zawiera znak nowej linii
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            if "amount" not in header:
+                raise ValueError("CSV header must contain an amount column")
+            continue
+        try:
+            item = _csv_item(dict(zip(header, values)))
+        except ValueError as e:
+            yield first, None, [str(e)]
+            continue
+        yield first, item, []
+    if record:
+        yield first, None, ["unterminated quoted field"]
@@ -0,0 +1,42 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Logi aplikacji bez blokowania pętli zdarzeń: procedury obsługi żądań tylko wkładają rekord
+# do kolejki (QueueHandler), a zapis do pliku i na konsolę robi osobny wątek (QueueListener).
+
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+# Ustawia logowanie przez kolejkę dla głównego loggera (raz na proces); pusty LOG_FILE - tylko konsola
+def configure() -> QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [QueueHandler(records)]
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop)
+    return _listener
+
+# Zapisuje rekordy pozostałe w kolejce i zatrzymuje wątek zapisu
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,33 +1,71 @@
-from fastapi import FastAPI, Request
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .routes import users, expenses
+from .database import engine, async_engine, AsyncSessionLocal, sqlite_maintenance, run_sqlite_maintenance
+from .routes import users, expenses, balances, reports as reports_routes, search as search_routes, metrics as metrics_routes, receipts as receipts_routes
+from . import changelog, chat, httpcache, logs, metrics, migrations, profiler, receipts, search
+from .realtime import manager, backplane
 import logging
-from datetime import datetime
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+
+# Import tego modułu nie łączy się z bazą ani z brokerem MQTT i nie uruchamia wątków (testy, skrypty,
+# szybki start workerów) - praca startowa jest w lifespan. Schemat bazy zmienia tylko jawny krok
+# python -m backend.manage migrate; aplikacja przy starcie sprawdza, czy baza jest na najnowszej rewizji.
+
+# Migracja przy starcie zamiast odmowy startu (tylko jeden worker, np. środowisko deweloperskie)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+
 logger = logging.getLogger(__name__)
 
-Base.metadata.create_all(bind=engine)
+# Zapytania SQL liczone na żądanie i w sumie (/metrics)
+metrics.instrument_engine(async_engine.sync_engine)
 
-app = FastAPI()
+# Zdarzenia czatu z innych workerów aktualizują lokalny bufor historii
+backplane.remote_listeners.append(chat.history.apply_event)
+# Zmiany z innych workerów unieważniają ETagi i odpowiedzi list w pamięci podręcznej
+backplane.remote_listeners.append(httpcache.versions.apply_event)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = datetime.now()
-    response = await call_next(request)
-    duration = (datetime.now() - start_time).total_seconds()
-    
-    logger.info(f"{request.method} {request.url.path} - {response.status_code} - {duration:.3f}s")
-    return response
+# Sprawdza schemat (albo migruje przy AUTO_MIGRATE) i włącza wyszukiwanie FTS, jeśli indeks istnieje
+def prepare_database():
+    if AUTO_MIGRATE:
+        from .manage import migrate_database
+        applied, rebuilt = migrate_database(engine)
+        if applied or rebuilt:
+            logger.info(f"Database migrated on startup: {len(applied)} migration(s) applied")
+    else:
+        migrations.require_head(engine)
+    search.detect(engine)
+
+# Start i zatrzymanie workera: logi, baza, zadania w tle, połączenie MQTT (backplane)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Logi zapisywane w osobnym wątku (backend/logs.py) - obsługa żądania nie czeka na zapis do pliku
+    logs.configure()
+    await asyncio.to_thread(prepare_database)
+    maintenance = asyncio.create_task(sqlite_maintenance())
+    compaction = asyncio.create_task(changelog.compaction(AsyncSessionLocal))
+    await backplane.start(manager)
+    await chat.writer.start()
+    logger.info("Application started")
+    try:
+        yield
+    finally:
+        maintenance.cancel()
+        compaction.cancel()
+        # Najpierw rozłączenie klientów (nie wysyłają już wiadomości), potem zapis przyjętych wiadomości
+        await manager.close_all()
+        await chat.writer.stop()
+        await backplane.stop()
+        profiler.slow_requests.stop()
+        await asyncio.to_thread(receipts.thumbnail_pool.stop)
+        try:
+            await run_sqlite_maintenance()
+        except Exception as e:
+            logger.warning(f"SQLite maintenance on shutdown failed: {e}")
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,9 +75,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Czas odpowiedzi na trasę, zapytania SQL na żądanie i linia logu dostępu (backend/metrics.py)
+# Dodany jako ostatni, więc jest zewnętrzny i mierzy też pracę CORS
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(users.router, tags=["users"])
 app.include_router(expenses.router, tags=["expenses"])
+app.include_router(balances.router, tags=["balances"])
+app.include_router(search_routes.router, tags=["search"])
+app.include_router(reports_routes.router, tags=["reports"])
+app.include_router(receipts_routes.router, tags=["receipts"])
+app.include_router(metrics_routes.router, tags=["metrics"])
 
 app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
-
-logger.info("Application started")
@@ -0,0 +1,153 @@
+import argparse
+import sys
+from typing import List, Tuple
+from sqlalchemy import select
+from .database import SessionLocal, engine
+from . import balances, changelog, migrations, models, queryplan, receipts, reports, search
+from .database import SQLALCHEMY_DATABASE_URL
+
+# Narzędzia administracyjne: python -m backend.manage <polecenie>
+
+# Jawny krok przed startem aplikacji (i po każdym wdrożeniu): tabele i rewizje schematu, indeks FTS,
+# salda i zestawienia raportów. Zwraca zastosowane rewizje i nazwy przeliczonych danych pochodnych.
+def migrate_database(engine, revision: str = migrations.HEAD) -> Tuple[List[str], List[str]]:
+    applied = migrations.upgrade(engine, revision)
+    search.install(engine)
+    # Salda i zestawienia raportów puste po migracji (nowe tabele, 0002) - liczone od nowa z wydatków
+    rebuilt = []
+    if balances.ensure_balances(engine):
+        rebuilt.append("Balances")
+    if reports.ensure_rollups(engine):
+        rebuilt.append("Report rollups")
+    return applied, rebuilt
+
+def _require_schema():
+    try:
+        migrations.require_head(engine)
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+def rebuild_balances_command(args):
+    _require_schema()
+    db = SessionLocal()
+    try:
+        mismatches = balances.rebuild_balances(db)
+    finally:
+        db.close()
+    print(f"Balances rebuilt, {mismatches} pair(s) were out of sync")
+
+def reindex_search_command(args):
+    _require_schema()
+    if not search.install(engine):
+        print("Full-text search (SQLite FTS5) is not available for this database")
+        return
+    db = SessionLocal()
+    try:
+        search.reindex(db)
+    finally:
+        db.close()
+    print("Search index rebuilt")
+
+def rebuild_reports_command(args):
+    _require_schema()
+    db = SessionLocal()
+    try:
+        rows = reports.rebuild(db)
+    finally:
+        db.close()
+    print(f"Report rollups rebuilt, {rows} row(s)")
+
+def compact_changes_command(args):
+    _require_schema()
+    db = SessionLocal()
+    try:
+        superseded, expired = changelog.compact(db, args.retention_days)
+    finally:
+        db.close()
+    print(f"Change log compacted: {superseded} superseded, {expired} expired change(s) removed")
+
+def gc_receipts_command(args):
+    _require_schema()
+    db = SessionLocal()
+    try:
+        referenced = set(db.execute(select(models.Receipt.sha256).distinct()).scalars())
+    finally:
+        db.close()
+    removed = receipts.collect_garbage(referenced, args.grace_minutes * 60)
+    print(
+        f"Receipt storage cleaned: {removed['blobs']} unreferenced file(s), {removed['thumbnails']} thumbnail(s), "
+        f"{removed['uploads']} interrupted upload(s), {removed['bytes']} byte(s) freed"
+    )
+
+def migrate_command(args):
+    applied, rebuilt = migrate_database(engine, args.revision)
+    print(f"Schema at revision {migrations.current(engine)}, {len(applied)} migration(s) applied")
+    for name in rebuilt:
+        print(f"{name} rebuilt from expenses")
+
+def downgrade_command(args):
+    reverted = migrations.downgrade(engine, args.revision)
+    print(f"Schema at revision {migrations.current(engine) or migrations.BASE}, {len(reverted)} migration(s) reverted")
+
+def schema_version_command(args):
+    print(f"Current revision: {migrations.current(engine) or migrations.BASE} (head: {migrations.head()})")
+    for migration in migrations.pending(engine):
+        print(f"  pending {migration.revision}: {migration.description}")
+
+def check_query_plans_command(args):
+    try:
+        results = queryplan.check(SQLALCHEMY_DATABASE_URL if args.current else None)
+    except ValueError as e:
+        sys.exit(str(e))
+    failed = 0
+    for path, statement, plan, problems in results:
+        failed += bool(problems)
+        if problems or args.verbose:
+            print(f"{'FAIL' if problems else 'ok  '} {path}")
+            print("       " + " ".join(statement.split()))
+            for detail in plan:
+                print(f"       | {detail}")
+            for problem in problems:
+                print(f"       ! {problem}")
+    print(f"{len(results)} statement(s) checked, {failed} with problems")
+    if failed:
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-balances", help="recompute the balances table from expense_shares").set_defaults(func=rebuild_balances_command)
+
+    subparsers.add_parser("reindex-search", help="rebuild the full-text search index").set_defaults(func=reindex_search_command)
+
+    subparsers.add_parser("rebuild-reports", help="recompute the report rollup tables from expenses").set_defaults(func=rebuild_reports_command)
+
+    compact = subparsers.add_parser("compact-changes", help="compact the expense change log and apply retention")
+    compact.add_argument("--retention-days", type=float, default=changelog.CHANGELOG_RETENTION_DAYS)
+    compact.set_defaults(func=compact_changes_command)
+
+    gc = subparsers.add_parser("gc-receipts", help="remove receipt files no longer referenced by any receipt")
+    gc.add_argument("--grace-minutes", type=float, default=receipts.STALE_UPLOAD_SECONDS / 60, help="keep files modified more recently than this")
+    gc.set_defaults(func=gc_receipts_command)
+
+    migrate = subparsers.add_parser("migrate", help="create missing tables, apply pending schema migrations and set up the search index (run before starting the app)")
+    migrate.add_argument("revision", nargs="?", default=migrations.HEAD)
+    migrate.set_defaults(func=migrate_command)
+
+    downgrade = subparsers.add_parser("downgrade", help="revert schema migrations newer than the given revision")
+    downgrade.add_argument("revision", help=f"target revision or {migrations.BASE}")
+    downgrade.set_defaults(func=downgrade_command)
+
+    subparsers.add_parser("schema-version", help="show the current schema revision and pending migrations").set_defaults(func=schema_version_command)
+
+    plans = subparsers.add_parser("check-query-plans", help="check that the hot query paths use indexes (SQLite)")
+    plans.add_argument("--current", action="store_true", help="check the configured database instead of a fresh migrated one")
+    plans.add_argument("--verbose", action="store_true", help="print every statement and its plan")
+    plans.set_defaults(func=check_query_plans_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
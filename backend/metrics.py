@@ -0,0 +1,233 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from starlette.routing import Mount
+from . import profiler
+
+logger = logging.getLogger(__name__)
+
+# Pomiary w procesie (bez zależności od prometheus_client): histogramy czasu odpowiedzi na trasę,
+# liczba zapytań SQL i czas bazy na żądanie, liczniki z komponentów czasu rzeczywistego.
+# Każdy worker ma własne wartości - Prometheus zbiera /metrics z każdego osobno.
+
+# Żądanie z większą liczbą zapytań SQL jest zapisywane w logu (typowy objaw N+1); 0 wyłącza
+REQUEST_QUERY_WARN = int(os.getenv("REQUEST_QUERY_WARN", "50"))
+# Jedna linia logu na żądanie (metoda, ścieżka, status, czas) - zapis przez kolejkę logów, nie blokuje
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1") == "1"
+
+# Granice kubełków (sekundy i liczba zapytań)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# Etykieta trasy spoza routera (404, odrzucone przed routingiem) - ścieżki nie trafiają do etykiet
+UNMATCHED = "<unmatched>"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Histogram z etykietami: dla każdej kombinacji wartości etykiet liczniki kubełków, suma i liczba obserwacji
+# Kubełki są trzymane bez kumulacji (jeden licznik na obserwację), kumulowane dopiero przy odczycie
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (buckets, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, observed in zip(self.buckets + (float("inf"),), buckets):
+                cumulative += observed
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+    def clear(self):
+        self._series.clear()
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {_number(self.value)}"]
+
+    def clear(self):
+        self.value = 0
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency from the first byte received to the last byte sent.",
+    ("method", "route", "status"),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed while handling one HTTP request.",
+    ("method", "route"), QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL statements while handling one HTTP request.",
+    ("method", "route"),
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed by this worker, in and outside requests.")
+DB_TIME = Counter("db_query_seconds_total", "Time spent executing SQL statements by this worker.")
+
+METRICS = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, DB_QUERIES, DB_TIME]
+
+# Zewnętrzne źródła liczników: (prefiks, funkcja zwracająca słownik stats(), klucze będące gauge)
+# Pozostałe klucze są licznikami narastającymi (typ counter, przyrostek _total)
+Collector = Tuple[str, Callable[[], dict], Iterable[str]]
+_collectors: List[Collector] = []
+
+def register_collector(prefix: str, stats: Callable[[], dict], gauges: Iterable[str] = ()):
+    _collectors.append((prefix, stats, frozenset(gauges)))
+
+def _render_collector(prefix: str, stats: Callable[[], dict], gauges) -> List[str]:
+    lines = []
+    try:
+        values = stats()
+    except Exception as e:
+        logger.warning(f"Metrics collector {prefix} failed: {e!r}")
+        return lines
+    for key, value in values.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if key in gauges:
+            name, kind = f"{prefix}_{key}", "gauge"
+        else:
+            name, kind = f"{prefix}_{key}_total", "counter"
+        lines += [f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+    return lines
+
+# Wszystkie pomiary w formacie tekstowym Prometheusa (wersja 0.0.4)
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for prefix, stats, gauges in _collectors:
+        lines += _render_collector(prefix, stats, gauges)
+    return "\n".join(lines) + "\n"
+
+# Zapytania SQL i czas bazy bieżącego żądania; zmienna kontekstu przechodzi do zadań i do
+# greenletów, w których SQLAlchemy wykonuje zapytania sesji asynchronicznej (także db.run_sync)
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+# Liczy zapytania i czas ich wykonania na silniku synchronicznym (dla asynchronicznego: async_engine.sync_engine)
+def instrument_engine(sync_engine):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        DB_QUERIES.inc()
+        DB_TIME.inc(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+    # Zapytanie zakończone błędem nie wywołuje after_cursor_execute
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+# Wzorzec trasy (np. /expenses/{expense_id}) zamiast ścieżki - liczba serii nie rośnie z liczbą id
+def route_label(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return UNMATCHED
+    # Zamontowane aplikacje (pliki statyczne frontendu) jako jedna seria
+    if isinstance(route, Mount):
+        return path + "/*"
+    return path
+
+# Middleware ASGI: czas żądania zegarem monotonicznym do wysłania ostatniego bajtu odpowiedzi
+# (także odpowiedzi strumieniowych), zapytania SQL żądania, opcjonalnie profil wolnych żądań
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+        sampling = profiler.slow_requests.request_started()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            _request_stats.reset(token)
+            method, route = scope["method"], route_label(scope)
+            REQUEST_DURATION.observe(duration, method, route, str(status))
+            REQUEST_QUERIES.observe(stats.queries, method, route)
+            REQUEST_DB_TIME.observe(stats.db_time, method, route)
+            if ACCESS_LOG:
+                logger.info(f"{method} {scope['path']} - {status} - {duration:.3f}s")
+            if REQUEST_QUERY_WARN and stats.queries > REQUEST_QUERY_WARN:
+                logger.warning(f"{method} {route} ran {stats.queries} SQL queries ({stats.db_time * 1000:.1f} ms) - possible N+1")
+            if sampling:
+                profiler.slow_requests.request_finished(f"{method} {route} {status}", started, duration)
@@ -0,0 +1,254 @@
+import logging
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy import Column, MetaData, String, Table, delete, insert, inspect, select, text
+from . import money
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# Wersjonowane migracje schematu (w stylu Alembica, bez dodatkowej zależności)
+# Base.metadata.create_all tworzy brakujące tabele razem z ich indeksami, ale nie zmienia tabel,
+# które już istnieją - każda zmiana istniejących tabel jest kolejną rewizją w MIGRATIONS.
+# Numer ostatniej zastosowanej rewizji jest w tabeli schema_version (jeden wiersz).
+# Rewizje muszą być idempotentne: na nowej bazie create_all zrobił już to, co one dodają,
+# a kilka workerów startujących naraz może zastosować tę samą rewizję dwa razy.
+# Polecenia: python -m backend.manage migrate | downgrade <rewizja> | schema-version
+
+HEAD = "head"
+BASE = "base"
+
+version_table = Table("schema_version", MetaData(), Column("version_num", String, primary_key=True))
+
+class Migration(NamedTuple):
+    revision: str
+    description: str
+    upgrade: Callable
+    downgrade: Callable
+
+# Indeksy gorących ścieżek (nazwa, tabela, kolumny) - takie same jak w models.py
+HOT_PATH_INDEXES = [
+    # Lista wydatków od najnowszych, stronicowana kursorem po (timestamp, id)
+    ("ix_expenses_timestamp_id", "expenses", ("timestamp", "id")),
+    # Wydatki płacącego w zakresie czasu (raporty bez zestawień, saldo z wydatków użytkownika)
+    ("ix_expenses_payer_id_timestamp", "expenses", ("payer_id", "timestamp")),
+    # Udziały wydatku: wczytywanie udziałów strony, kaskadowe usuwanie w delete_expense, eksport
+    ("ix_expense_shares_expense_id", "expense_shares", ("expense_id",)),
+    # Udziały dłużnika ze złączeniem z expenses bez sięgania do tabeli udziałów
+    ("ix_expense_shares_debtor_id_expense_id", "expense_shares", ("debtor_id", "expense_id")),
+    # Historia czatu od najnowszych, stronicowana kursorem po (timestamp, id)
+    ("ix_messages_timestamp_id", "messages", ("timestamp", "id")),
+]
+
+def _create_indexes(conn, indexes):
+    for name, table, columns in indexes:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+def _drop_indexes(conn, indexes):
+    for name, _, _ in indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+# Kwoty zmiennoprzecinkowe -> liczby całkowite w jednostkach podrzędnych (tabela, stara kolumna, nowa kolumna)
+MINOR_UNIT_COLUMNS = [
+    ("expenses", "amount", "amount_minor"),
+    ("expense_shares", "amount_owed", "amount_owed_minor"),
+]
+# Tabele liczone z wydatków - ich wiersze są usuwane i liczone od nowa z kwot całkowitych
+# (salda w tej migracji, zestawienia raportów przez reports.ensure_rollups przy starcie)
+DERIVED_AMOUNT_COLUMNS = [
+    ("balances", "amount", "amount_minor"),
+    ("report_user_spend", "paid", "paid_minor"),
+    ("report_user_spend", "share", "share_minor"),
+    ("report_pairs", "amount", "amount_minor"),
+    ("report_descriptions", "total", "total_minor"),
+    ("report_group_descriptions", "total", "total_minor"),
+]
+
+def _columns(conn, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+# Zaokrąglenie połówek od zera jak money.to_minor; w SQLite najpierw do 6 miejsc,
+# żeby 0.285 * 100 = 28.499999... dało 29, a nie 28
+def _to_minor_sql(conn, column: str, factor: int) -> str:
+    if conn.dialect.name == "sqlite":
+        return f"CAST(ROUND(ROUND({column} * {factor}, 6)) AS INTEGER)"
+    return f"CAST(ROUND(CAST({column} AS NUMERIC) * {factor}) AS BIGINT)"
+
+def _drop_column(conn, table: str, column: str):
+    conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+# Salda z udziałów (obie strony każdej pary), jak balances.rebuild_balances
+BALANCES_FROM_SHARES = """
+INSERT INTO balances (user_id, counterparty_id, amount_minor)
+SELECT user_id, counterparty_id, SUM(amount) FROM (
+    SELECT e.payer_id AS user_id, s.debtor_id AS counterparty_id, s.amount_owed_minor AS amount
+    FROM expense_shares s JOIN expenses e ON e.id = s.expense_id
+    WHERE s.debtor_id IS NOT NULL AND e.payer_id IS NOT NULL AND s.debtor_id != e.payer_id
+    UNION ALL
+    SELECT s.debtor_id, e.payer_id, -s.amount_owed_minor
+    FROM expense_shares s JOIN expenses e ON e.id = s.expense_id
+    WHERE s.debtor_id IS NOT NULL AND e.payer_id IS NOT NULL AND s.debtor_id != e.payer_id
+) AS pairs
+GROUP BY user_id, counterparty_id
+HAVING SUM(amount) != 0
+"""
+
+def _minor_units_upgrade(conn):
+    factor = 10 ** money.exponent()
+    for table, old, new in MINOR_UNIT_COLUMNS:
+        columns = _columns(conn, table)
+        if new not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} INTEGER"))
+        if old in columns:
+            conn.execute(text(f"UPDATE {table} SET {new} = {_to_minor_sql(conn, old, factor)} WHERE {old} IS NOT NULL"))
+            _drop_column(conn, table, old)
+    if "currency" not in _columns(conn, "expenses"):
+        conn.execute(text(f"ALTER TABLE expenses ADD COLUMN currency VARCHAR(3) DEFAULT '{money.CURRENCY}'"))
+    rebuilt = set()
+    for table, old, new in DERIVED_AMOUNT_COLUMNS:
+        columns = _columns(conn, table)
+        if old not in columns:
+            continue
+        if table not in rebuilt:
+            conn.execute(text(f"DELETE FROM {table}"))
+            rebuilt.add(table)
+        if new not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} INTEGER DEFAULT 0"))
+        _drop_column(conn, table, old)
+    if "balances" in rebuilt:
+        conn.execute(text(BALANCES_FROM_SHARES))
+
+def _minor_units_downgrade(conn):
+    factor = 10 ** money.exponent()
+    for table, old, new in MINOR_UNIT_COLUMNS + DERIVED_AMOUNT_COLUMNS:
+        columns = _columns(conn, table)
+        if old not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {old} FLOAT"))
+        if new in columns:
+            conn.execute(text(f"UPDATE {table} SET {old} = {new} * 1.0 / {factor}"))
+            _drop_column(conn, table, new)
+    if "currency" in _columns(conn, "expenses"):
+        _drop_column(conn, "expenses", "currency")
+
+# Tabela paragonów (models.Receipt) z indeksami; na nowej bazie tworzy ją już create_all
+def _receipts_upgrade(conn):
+    from . import models
+    models.Receipt.__table__.create(conn, checkfirst=True)
+
+def _receipts_downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS receipts"))
+
+# Przejmowanie zaległych wierszy outboksu przez jednego workera przy ponownym wysyłaniu
+OUTBOX_CLAIM_COLUMNS = [("claimed_by", "VARCHAR"), ("claimed_at", "DATETIME")]
+
+def _outbox_claims_upgrade(conn):
+    columns = _columns(conn, "outbox")
+    for column, column_type in OUTBOX_CLAIM_COLUMNS:
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE outbox ADD COLUMN {column} {column_type}"))
+
+def _outbox_claims_downgrade(conn):
+    columns = _columns(conn, "outbox")
+    for column, _ in OUTBOX_CLAIM_COLUMNS:
+        if column in columns:
+            _drop_column(conn, "outbox", column)
+
+# Wersje zasobów pamięci podręcznej HTTP - tabela z wierszem dla każdego zasobu
+def _resource_versions_upgrade(conn):
+    from . import httpcache, models
+    models.ResourceVersion.__table__.create(conn, checkfirst=True)
+    existing = set(conn.execute(select(models.ResourceVersion.name)).scalars())
+    for resource in httpcache.RESOURCES:
+        if resource not in existing:
+            conn.execute(insert(models.ResourceVersion).values(name=resource, version=0))
+
+def _resource_versions_downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS resource_versions"))
+
+# Wiadomości zapisane z domyślną wartością serwera (CURRENT_TIMESTAMP, przed czasem nadawanym przez
+# aplikację) nie mają części ułamkowej i w SQLite porównują się jako tekst niezgodnie z kursorem
+def _message_timestamps_upgrade(conn):
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("UPDATE messages SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"))
+
+# Uzupełniona część ułamkowa (.000000) nie zmienia czasu wiadomości - nie ma czego wycofywać
+def _message_timestamps_downgrade(conn):
+    pass
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        "0001",
+        "indexes for the hot query paths",
+        lambda conn: _create_indexes(conn, HOT_PATH_INDEXES),
+        lambda conn: _drop_indexes(conn, HOT_PATH_INDEXES),
+    ),
+    Migration("0002", "integer minor units and currency for amounts", _minor_units_upgrade, _minor_units_downgrade),
+    Migration("0003", "receipt attachments", _receipts_upgrade, _receipts_downgrade),
+    Migration("0004", "outbox replay claims", _outbox_claims_upgrade, _outbox_claims_downgrade),
+    Migration("0005", "shared HTTP cache versions", _resource_versions_upgrade, _resource_versions_downgrade),
+    Migration("0006", "fractional seconds in message timestamps", _message_timestamps_upgrade, _message_timestamps_downgrade),
+]
+
+def head() -> Optional[str]:
+    return MIGRATIONS[-1].revision if MIGRATIONS else None
+
+# Pozycja rewizji w MIGRATIONS (-1 dla bazy bez zastosowanych migracji)
+def _position(revision: Optional[str]) -> int:
+    if revision is None or revision == BASE:
+        return -1
+    if revision == HEAD:
+        return len(MIGRATIONS) - 1
+    for position, migration in enumerate(MIGRATIONS):
+        if migration.revision == revision:
+            return position
+    raise ValueError(f"Unknown schema revision {revision!r}")
+
+def current(engine) -> Optional[str]:
+    version_table.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return conn.execute(select(version_table.c.version_num)).scalar()
+
+def _stamp(conn, revision: Optional[str]):
+    conn.execute(delete(version_table))
+    if revision is not None:
+        conn.execute(insert(version_table).values(version_num=revision))
+
+# Tworzy brakujące tabele i stosuje rewizje nowsze niż zapisana w bazie (do target włącznie)
+# Zwraca listę zastosowanych rewizji; każda rewizja to osobna transakcja
+def upgrade(engine, target: str = HEAD) -> List[str]:
+    Base.metadata.create_all(bind=engine)
+    start = _position(current(engine)) + 1
+    stop = _position(target) + 1
+    applied = []
+    for migration in MIGRATIONS[start:stop]:
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            _stamp(conn, migration.revision)
+        logger.info(f"Schema migrated to {migration.revision}: {migration.description}")
+        applied.append(migration.revision)
+    return applied
+
+# Wycofuje rewizje nowsze niż target (BASE wycofuje wszystkie); zwraca listę wycofanych rewizji
+def downgrade(engine, target: str) -> List[str]:
+    stop = _position(target)
+    reverted = []
+    for position in range(_position(current(engine)), stop, -1):
+        migration = MIGRATIONS[position]
+        with engine.begin() as conn:
+            migration.downgrade(conn)
+            _stamp(conn, MIGRATIONS[position - 1].revision if position > 0 else None)
+        logger.info(f"Schema downgraded from {migration.revision}: {migration.description}")
+        reverted.append(migration.revision)
+    return reverted
+
+# Rewizje jeszcze niezastosowane w bazie
+def pending(engine) -> List[Migration]:
+    return MIGRATIONS[_position(current(engine)) + 1:]
+
+# Aplikacja i polecenia administracyjne nie zmieniają schematu same - wymagają wcześniejszego migrate
+def require_head(engine):
+    waiting = pending(engine)
+    if waiting:
+        raise RuntimeError(
+            f"Database schema is at revision {current(engine) or BASE}, head is {head()} "
+            f"({len(waiting)} pending migration(s)) - run: python -m backend.manage migrate"
+        )
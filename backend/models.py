@@ -1,9 +1,15 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
-from datetime import datetime
+from . import money
+from datetime import datetime, timezone
 # Do bazy danych (tylko)
+
+# Bieżący czas UTC bez strefy - tak jak CURRENT_TIMESTAMP w SQLite
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # Tabela użytkowników (login, hasło)
 class User(Base):
     __tablename__ = "users"
@@ -21,25 +27,64 @@ class Expense(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     payer_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Float)
+    # Kwota w jednostkach podrzędnych waluty (grosze) - patrz backend/money.py
+    amount_minor = Column(Integer)
+    currency = Column(String(3), default=money.CURRENCY, server_default=money.CURRENCY)
     description = Column(String)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     payer = relationship("User", foreign_keys=[payer_id])
     shares = relationship("ExpenseShare", back_populates="expense", cascade="all, delete-orphan")
+    receipts = relationship("Receipt", back_populates="expense", cascade="all, delete-orphan")
+
+    # Kwota w jednostkach głównych (tylko do odczytu - schemas.Expense)
+    @property
+    def amount(self):
+        return money.to_major(self.amount_minor, self.currency or money.CURRENCY)
+
+    # Stronicowanie kursorem po (timestamp, id); wydatki użytkownika w zakresie czasu
+    # (indeksy dodawane do istniejących baz przez migracje - backend/migrations.py)
+    __table_args__ = (
+        Index("ix_expenses_timestamp_id", "timestamp", "id"),
+        Index("ix_expenses_payer_id_timestamp", "payer_id", "timestamp"),
+    )
 
 # Tabela podziału wydatków (kto komu ile jest winien)
 class ExpenseShare(Base):
     __tablename__ = "expense_shares"
 
     id = Column(Integer, primary_key=True, index=True)
-    expense_id = Column(Integer, ForeignKey("expenses.id"))
+    # Indeks: udziały wydatku bez przeglądania całej tabeli (wczytywanie udziałów, kaskadowe usuwanie, eksport)
+    expense_id = Column(Integer, ForeignKey("expenses.id"), index=True)
     debtor_id = Column(Integer, ForeignKey("users.id"))
-    amount_owed = Column(Float)
+    amount_owed_minor = Column(Integer)
 
     expense = relationship("Expense", back_populates="shares")
     debtor = relationship("User")
 
+    @property
+    def amount_owed(self):
+        return money.to_major(self.amount_owed_minor)
+
+    # Udziały dłużnika (złączenie z expenses po expense_id bez sięgania do tabeli)
+    __table_args__ = (Index("ix_expense_shares_debtor_id_expense_id", "debtor_id", "expense_id"),)
+
+# Paragony wydatków - plik na dysku pod skrótem treści (backend/receipts.py), wiele wierszy może wskazywać ten sam plik
+class Receipt(Base):
+    __tablename__ = "receipts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    expense_id = Column(Integer, ForeignKey("expenses.id"), index=True)
+    uploader_id = Column(Integer, ForeignKey("users.id"))
+    # Indeks: odwołania do pliku (gc-receipts, ponowne przesłanie tego samego paragonu)
+    sha256 = Column(String(64), index=True)
+    content_type = Column(String)
+    size = Column(Integer)
+    filename = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+
+    expense = relationship("Expense", back_populates="receipts")
+
 # Tabela wiadomości czatu
 class Message(Base):
     __tablename__ = "messages"
@@ -47,6 +92,127 @@ class Message(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     content = Column(String)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Czas nadawany po stronie aplikacji (UTC, z mikrosekundami) - znany od razu po flushu
+    # i zapisywany w tym samym formacie co wartości porównywane w kursorze
+    timestamp = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
 
     user = relationship("User")
+
+    # Historia czatu od najnowszych, stronicowana kursorem po (timestamp, id)
+    __table_args__ = (Index("ix_messages_timestamp_id", "timestamp", "id"),)
+
+# Tabela sald (ile kontrahent jest winien użytkownikowi, netto, w jednostkach podrzędnych waluty grupy)
+class Balance(Base):
+    __tablename__ = "balances"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    counterparty_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    amount_minor = Column(Integer, default=0)
+
+    counterparty = relationship("User", foreign_keys=[counterparty_id])
+
+    @property
+    def amount(self):
+        return money.to_major(self.amount_minor)
+
+# Zdarzenia do wysłania przez MQTT, zapisywane w tej samej transakcji co zmiana danych
+# Wiersz jest usuwany po udanej publikacji; zaległe wiersze wysyła ponownie MQTTPublisher
+class OutboxEvent(Base):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String)
+    payload = Column(String)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Worker, który ostatnio przejął wiersz do ponownego wysłania, i kiedy (MQTTPublisher.replay)
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+
+# Dziennik zmian wydatków do synchronizacji przyrostowej klientów (GET /expenses/changes)
+# seq rośnie monotonicznie (AUTOINCREMENT - numery nie są używane ponownie po usunięciu wierszy)
+class ExpenseChange(Base):
+    __tablename__ = "expense_changes"
+
+    seq = Column(Integer, primary_key=True)
+    expense_id = Column(Integer, index=True)
+    op = Column(String)
+    payload = Column(String, nullable=True)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+# Stan dziennika zmian (jeden wiersz): horizon - najwyższy seq usunięty przez retencję;
+# klient z since poniżej horyzontu musi wczytać listę od nowa
+class ChangeLogState(Base):
+    __tablename__ = "expense_changes_state"
+
+    id = Column(Integer, primary_key=True)
+    horizon = Column(Integer, default=0)
+
+# Bloki identyfikatorów rezerwowane przez workery (np. wiadomości czatu numerowane przed zapisem)
+# next_value - pierwszy identyfikator, którego nie zarezerwował jeszcze żaden worker
+class IdBlock(Base):
+    __tablename__ = "id_blocks"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer)
+
+# Wersje list z pamięci podręcznej HTTP (backend/httpcache.py) - zwiększane w transakcji zmiany danych,
+# więc zmiana w dowolnym workerze unieważnia ETagi i zapamiętane odpowiedzi wszystkich workerów
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Zestawienia do raportów (/reports), aktualizowane w tej samej transakcji co wydatki
+# Kwoty w jednostkach podrzędnych waluty grupy
+# Wydatki zapłacone przez użytkownika i jego udział w wydatkach - na dzień i na miesiąc
+# grain: "day" (period RRRR-MM-DD) lub "month" (period RRRR-MM)
+class UserSpendRollup(Base):
+    __tablename__ = "report_user_spend"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    grain = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)
+    paid_minor = Column(Integer, default=0)
+    paid_count = Column(Integer, default=0)
+    share_minor = Column(Integer, default=0)
+    share_count = Column(Integer, default=0)
+
+    # Raport całej grupy za zakres miesięcy
+    __table_args__ = (Index("ix_report_user_spend_grain_period", "grain", "period"),)
+
+# Udziały dłużników w wydatkach płacącego, na miesiąc (kto komu ile pożyczył)
+class PairRollup(Base):
+    __tablename__ = "report_pairs"
+
+    payer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    debtor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    month = Column(String, primary_key=True)
+    amount_minor = Column(Integer, default=0)
+    count = Column(Integer, default=0)
+
+    __table_args__ = (Index("ix_report_pairs_debtor_month", "debtor_id", "month"),)
+
+# Wydatki według opisu, na płacącego i miesiąc
+class DescriptionRollup(Base):
+    __tablename__ = "report_descriptions"
+
+    payer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    month = Column(String, primary_key=True)
+    description = Column(String, primary_key=True)
+    total_minor = Column(Integer, default=0)
+    count = Column(Integer, default=0)
+
+    __table_args__ = (Index("ix_report_descriptions_month", "month"),)
+
+# Wydatki według opisu na miesiąc dla całej grupy (raport bez podziału na płacących)
+class GroupDescriptionRollup(Base):
+    __tablename__ = "report_group_descriptions"
+
+    month = Column(String, primary_key=True)
+    description = Column(String, primary_key=True)
+    total_minor = Column(Integer, default=0)
+    count = Column(Integer, default=0)
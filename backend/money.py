@@ -0,0 +1,95 @@
+import os
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from fractions import Fraction
+from typing import List, Optional, Sequence
+
+# Kwoty pieniężne przechowywane jako liczby całkowite w jednostkach podrzędnych waluty (grosze, centy),
+# dzięki czemu sumy sald i raportów są dokładne i liczone na liczbach całkowitych (SQL, NumPy).
+# W API kwoty są nadal podawane także w jednostkach głównych (amount, amount_owed);
+# liczba zmiennoprzecinkowa minor / 10**wykładnik ma dokładnie tę postać dziesiętną co kwota.
+
+# Waluta grupy - w niej są salda, raporty i rozliczenia (wszystkie wydatki muszą być w tej walucie)
+CURRENCY = os.getenv("CURRENCY", "PLN").upper()
+
+# Waluty, których jednostka podrzędna nie ma 2 miejsc po przecinku (ISO 4217)
+MINOR_UNIT_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0,
+    "PYG": 0, "RWF": 0, "UGX": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+
+# Sposoby podziału wydatku na udziały (POST/PUT /expenses/, pole split)
+EQUAL = "equal"
+WEIGHT = "weight"
+EXACT = "exact"
+SPLIT_METHODS = (EQUAL, WEIGHT, EXACT)
+
+def exponent(currency: str = CURRENCY) -> int:
+    return MINOR_UNIT_EXPONENTS.get(currency, 2)
+
+# Kwota w jednostkach głównych (Decimal, napis, int albo float) -> jednostki podrzędne, zaokrąglenie połówek w górę
+# float jest zamieniany przez najkrótszy zapis dziesiętny (0.285 -> 0.285, a nie 0.28499999...)
+def to_minor(value, currency: str = CURRENCY) -> int:
+    try:
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount {value!r}")
+    return int(amount.scaleb(exponent(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_major(minor: Optional[int], currency: str = CURRENCY) -> Optional[float]:
+    if minor is None:
+        return None
+    return minor / 10 ** exponent(currency)
+
+# Zapis dziesiętny bez błędów zmiennoprzecinkowych (eksport CSV): 1234 -> "12.34"
+def format_minor(minor: int, currency: str = CURRENCY) -> str:
+    places = exponent(currency)
+    return str(Decimal(minor).scaleb(-places)) if places else str(minor)
+
+# Podział total proporcjonalnie do wag metodą największych reszt: każdy dostaje część całkowitą
+# swojego udziału, a pozostałe jednostki trafiają po jednej do największych reszt
+# (przy równych resztach - w kolejności order, np. rosnącego debtor_id). Suma wyniku to zawsze total.
+def allocate(total: int, weights: Sequence, order: Optional[Sequence] = None) -> List[int]:
+    weights = [Fraction(str(weight)) for weight in weights]
+    if not weights:
+        raise ValueError("split needs at least one share")
+    if any(weight < 0 for weight in weights) or sum(weights) == 0:
+        raise ValueError("split weights must not be negative and must not all be zero")
+    if total < 0:
+        return [-part for part in allocate(-total, weights, order)]
+    weight_sum = sum(weights)
+    quotas = [total * weight / weight_sum for weight in weights]
+    parts = [int(quota) for quota in quotas]
+    order = list(range(len(weights))) if order is None else list(order)
+    ranked = sorted(range(len(weights)), key=lambda index: (-(quotas[index] - parts[index]), order[index]))
+    for index in ranked[:total - sum(parts)]:
+        parts[index] += 1
+    return parts
+
+# Udziały wydatku w jednostkach podrzędnych według sposobu podziału:
+#  equal  - po równo między wszystkie udziały
+#  weight - proporcjonalnie do weight każdego udziału
+#  exact  - kwoty podane w udziałach, muszą sumować się do total
+# shares: obiekty z debtor_id, weight i amount_owed_minor; wynik w kolejności shares
+def split(method: str, total: int, shares: Sequence) -> List[int]:
+    if method not in SPLIT_METHODS:
+        raise ValueError(f"split must be one of: {', '.join(SPLIT_METHODS)}")
+    debtor_ids = [share.debtor_id for share in shares]
+    if len(set(debtor_ids)) != len(debtor_ids):
+        raise ValueError("split: each debtor may appear only once")
+    if method == EXACT:
+        amounts = [share.amount_owed_minor for share in shares]
+        if any(amount is None for amount in amounts):
+            raise ValueError("split exact: every share needs amount_owed")
+        if sum(amounts) != total:
+            raise ValueError(f"split exact: shares add up to {sum(amounts)}, expected {total} (minor units)")
+        return amounts
+    if method == EQUAL:
+        weights = [1] * len(shares)
+    else:
+        weights = [share.weight for share in shares]
+        if any(weight is None for weight in weights):
+            raise ValueError("split weight: every share needs weight")
+    return allocate(total, weights, debtor_ids)
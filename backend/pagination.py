@@ -0,0 +1,34 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+from sqlalchemy import and_, or_
+
+# Nieprzezroczysty kursor stronicowania po (timestamp, id)
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Rzuca ValueError dla uszkodzonego kursora
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+# Warunek "starsze niż kursor" dla sortowania (timestamp DESC, id DESC)
+def older_than(timestamp_column, id_column, cursor: str):
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(
+        timestamp_column < timestamp,
+        and_(timestamp_column == timestamp, id_column < row_id),
+    )
+
+# Zwraca (elementy strony, następny kursor lub None); rows pobrane z limitem limit + 1
+def page(rows, limit: int):
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].timestamp, items[-1].id) if len(rows) > limit else None
+    return items, next_cursor
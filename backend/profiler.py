@@ -0,0 +1,108 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Profil próbkujący wolnych żądań (opcjonalny): osobny wątek co PROFILE_INTERVAL sekund zapisuje
+# stos wątku pętli zdarzeń, o ile jakieś żądanie jest w toku. Dla żądania wolniejszego niż
+# PROFILE_SLOW_REQUESTS do logu trafiają najczęstsze stosy z czasu jego trwania (format "folded",
+# jak dla flamegraph.pl). Pętla obsługuje naraz wiele żądań, więc próbki obejmują też ich pracę;
+# "<idle>" to czekanie pętli na I/O (w tym na zapytania aiosqlite wykonywane w jego wątku).
+
+# Próg wolnego żądania w sekundach (0 wyłącza profilowanie)
+PROFILE_SLOW_REQUESTS = float(os.getenv("PROFILE_SLOW_REQUESTS", "0"))
+# Odstęp między próbkami (sekundy)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Ile ostatnich próbek trzymać w pamięci i ile stosów wypisać dla wolnego żądania
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "20000"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "10"))
+# Maksymalna głębokość zapisywanego stosu (najbardziej wewnętrzne ramki)
+MAX_STACK_DEPTH = 48
+
+IDLE = "<idle>"
+
+# Stos ramek od zewnętrznej do wewnętrznej: "funkcja (plik:linia);..."
+def fold(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    # Pętla czeka w selektorze na gotowość gniazd
+    if parts and parts[0].startswith(("select (selectors.py", "poll (selectors.py", "control (selectors.py")):
+        return IDLE
+    return ";".join(reversed(parts))
+
+class SlowRequestProfiler:
+    def __init__(self, threshold: float = PROFILE_SLOW_REQUESTS, interval: float = PROFILE_INTERVAL, max_samples: int = PROFILE_MAX_SAMPLES, top: int = PROFILE_TOP):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.samples: Deque[Tuple[float, str]] = deque(maxlen=max_samples)
+        self.in_flight = 0
+        self.profiled = 0
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    # Uruchamia wątek próbkujący dla bieżącego wątku (pętli zdarzeń)
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.in_flight:
+                continue
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.samples.append((time.perf_counter(), fold(frame)))
+            del frame
+
+    # Zwraca True, jeśli żądanie jest profilowane (wtedy wywołujący musi wywołać request_finished)
+    def request_started(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self.start()
+        self.in_flight += 1
+        return True
+
+    def request_finished(self, label: str, started: float, duration: float):
+        self.in_flight -= 1
+        if duration < self.threshold:
+            return
+        stacks = Counter(stack for taken, stack in list(self.samples) if started <= taken <= started + duration)
+        if not stacks:
+            return
+        self.profiled += 1
+        total = sum(stacks.values())
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common(self.top)]
+        logger.warning(
+            f"Slow request {label} took {duration:.3f}s; {total} samples, {stacks.get(IDLE, 0)} idle; top stacks:\n" + "\n".join(lines)
+        )
+
+    def stats(self) -> dict:
+        return {"samples": len(self.samples), "profiled_requests": self.profiled, "in_flight": self.in_flight}
+
+slow_requests = SlowRequestProfiler()
@@ -1,82 +1,153 @@
+import itertools
 import json
+import logging
+import os
+import socket
 import threading
-from typing import Optional
-import paho.mqtt.client as mqtt
+import uuid
+from typing import Callable, List, Optional
 
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_TOPIC_EXPENSES = "expenses/events"
 MQTT_TOPIC_CHAT = "chat/messages"
 MQTT_CLIENT_ID = "receipt-overseer-backend"
+# Połączenie z brokerem (0 - bez MQTT: zdarzenia trafiają tylko do klientów WebSocket tego workera)
+MQTT_ENABLED = os.getenv("MQTT_ENABLED", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+# paho.mqtt.client - importowany dopiero przy pierwszym połączeniu (import pakietu nie uruchamia sieci)
+mqtt = None
+
+def _paho():
+    global mqtt
+    if mqtt is None:
+        import paho.mqtt.client as client
+        mqtt = client
+    return mqtt
+
+# Identyfikator tego procesu (workera) - dołączany do publikowanych wiadomości jako "origin"
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
 
 class MQTTHandler:
-    def __init__(self):
-        self.client: Optional[mqtt.Client] = None
+    def __init__(self, origin: str = WORKER_ID, enabled: bool = MQTT_ENABLED):
+        # paho.mqtt.client.Client po connect()
+        self.client = None
         self.connected = False
+        self.enabled = enabled
+        self.origin = origin
         self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._listeners: List[Callable[[str, dict], None]] = []
     
+    # Łączy w tle (wątek sieciowy paho); wywoływane przy starcie aplikacji, a nie przy imporcie modułu
     def connect(self):
+        if not self.enabled or self.client is not None:
+            return
+        try:
+            mqtt = _paho()
+        except ImportError:
+            logger.warning("[MQTT] paho-mqtt is not installed, MQTT disabled")
+            self.enabled = False
+            return
         try:
-            self.client = mqtt.Client(client_id=MQTT_CLIENT_ID, protocol=mqtt.MQTTv311)
+            # Każdy worker potrzebuje własnego client_id, inaczej broker rozłącza poprzednie połączenie
+            self.client = mqtt.Client(client_id=f"{MQTT_CLIENT_ID}-{self.origin}", protocol=mqtt.MQTTv311)
             self.client.on_connect = self._on_connect
             self.client.on_disconnect = self._on_disconnect
+            self.client.on_message = self._on_message
             
             self.client.connect_async(MQTT_BROKER, MQTT_PORT, keepalive=60)
             self.client.loop_start()
-            print(f"[MQTT] Connecting to {MQTT_BROKER}:{MQTT_PORT}...")
+            logger.info(f"[MQTT] Connecting to {MQTT_BROKER}:{MQTT_PORT}...")
         except Exception as e:
-            print(f"[MQTT] Failed to initialize: {e}")
+            logger.warning(f"[MQTT] Failed to initialize: {e}")
+            self.client = None
     
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
-            print(f"[MQTT] Connected to broker successfully")
+            logger.info("[MQTT] Connected to broker successfully")
             client.subscribe(MQTT_TOPIC_EXPENSES)
             client.subscribe(MQTT_TOPIC_CHAT)
         else:
-            print(f"[MQTT] Connection failed with code {rc}")
+            logger.warning(f"[MQTT] Connection failed with code {rc}")
     
     def _on_disconnect(self, client, userdata, rc):
         self.connected = False
-        print(f"[MQTT] Disconnected from broker (rc={rc})")
+        logger.info(f"[MQTT] Disconnected from broker (rc={rc})")
+
+    # Słuchacze dostają (topic, wiadomość) z innych workerów; wywoływani z wątku paho
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, dict], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _on_message(self, client, userdata, msg):
+        self.dispatch(msg.topic, msg.payload)
+
+    # Przekazuje wiadomość z brokera słuchaczom, pomijając wiadomości wysłane przez ten proces
+    def dispatch(self, topic: str, payload: bytes):
+        try:
+            message = json.loads(payload)
+        except (ValueError, UnicodeDecodeError):
+            return
+        if not isinstance(message, dict) or message.get("origin") == self.origin:
+            return
+        for listener in list(self._listeners):
+            listener(topic, message)
     
-    def publish(self, message: dict, topic: str = MQTT_TOPIC_EXPENSES):
+    # Koperta publikowanej wiadomości: origin i origin_seq (ten proces) oraz outbox_id - id wiersza outboksu,
+    # ten sam przy każdym ponownym wysłaniu zdarzenia (także przez inny worker), więc odbiorca po nim odrzuca powtórzenia
+    def envelope(self, message: dict, outbox_id: Optional[int] = None) -> dict:
+        envelope = {**message, "origin": self.origin, "origin_seq": next(self._seq)}
+        if outbox_id is not None:
+            envelope["outbox_id"] = outbox_id
+        return envelope
+
+    # Publikuje synchronicznie (wywoływane z wątku MQTTPublisher); zwraca True, jeśli paho przyjął wiadomość
+    def publish(self, message: dict, topic: str = MQTT_TOPIC_EXPENSES, outbox_id: Optional[int] = None) -> bool:
         with self._lock:
-            if self.client and self.connected:
-                try:
-                    payload = json.dumps(message)
-                    result = self.client.publish(topic, payload, qos=1)
-                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                        print(f"[MQTT] Published to {topic}: {message.get('event', 'unknown')}")
-                    else:
-                        print(f"[MQTT] Publish failed with rc={result.rc}")
-                except Exception as e:
-                    print(f"[MQTT] Publish error: {e}")
-            else:
-                print(f"[MQTT] Not connected, skipping publish: {message.get('event', 'unknown')}")
+            if not (self.client and self.connected):
+                logger.debug(f"[MQTT] Not connected, skipping publish: {message.get('event', 'unknown')}")
+                return False
+            try:
+                payload = json.dumps(self.envelope(message, outbox_id))
+                result = self.client.publish(topic, payload, qos=1)
+            except Exception as e:
+                logger.warning(f"[MQTT] Publish error: {e}")
+                return False
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.warning(f"[MQTT] Publish failed with rc={result.rc}")
+                return False
+            logger.debug(f"[MQTT] Published to {topic}: {message.get('event', 'unknown')}")
+            return True
     
-    def publish_expense_event(self, event_type: str, expense_id: int, **kwargs):
+    def publish_expense_event(self, event_type: str, expense_id: int, **kwargs) -> bool:
         message = {
             "event": event_type,
             "expense_id": expense_id,
             **kwargs
         }
-        self.publish(message, MQTT_TOPIC_EXPENSES)
+        return self.publish(message, MQTT_TOPIC_EXPENSES)
     
-    def publish_chat_message(self, username: str, content: str):
+    def publish_chat_message(self, username: str, content: str) -> bool:
         message = {
             "event": "chat",
             "user": username,
             "msg": content
         }
-        self.publish(message, MQTT_TOPIC_CHAT)
+        return self.publish(message, MQTT_TOPIC_CHAT)
     
     def disconnect(self):
         if self.client:
             self.client.loop_stop()
             self.client.disconnect()
-            print("[MQTT] Disconnected")
+            self.client = None
+            self.connected = False
+            logger.info("[MQTT] Disconnected")
 
 mqtt_handler = MQTTHandler()
-
-mqtt_handler.connect()
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from . import models
+from .database import AsyncSessionLocal
+from .protocols import MQTT_TOPIC_EXPENSES, WORKER_ID, mqtt_handler
+
+logger = logging.getLogger(__name__)
+
+# Maksymalna liczba zdarzeń czekających na wysłanie do brokera
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", "1000"))
+# Ile zdarzeń wysyłać jednym przebiegiem wątku publikującego
+MQTT_BATCH_SIZE = int(os.getenv("MQTT_BATCH_SIZE", "100"))
+# Ile sekund czekać po pierwszym zdarzeniu na kolejne, żeby wysłać je razem
+MQTT_LINGER = float(os.getenv("MQTT_LINGER", "0.005"))
+# Co ile sekund sprawdzać zaległe wiersze outboksu (0 wyłącza ponawianie)
+OUTBOX_RETRY_INTERVAL = float(os.getenv("OUTBOX_RETRY_INTERVAL", "10"))
+# Wiersz starszy niż tyle sekund uznajemy za niewysłany (wysyłka bieżących trwa milisekundy)
+OUTBOX_RETRY_AFTER = float(os.getenv("OUTBOX_RETRY_AFTER", "30"))
+# Ile zaległych wierszy wczytywać w jednym przebiegu ponawiania
+OUTBOX_REPLAY_LIMIT = 500
+# Retencja wierszy, których nie udaje się wysłać (broker nieosiągalny): starsze niż tyle sekund są usuwane,
+# a ponad limit wierszy - najstarsze (0 wyłącza dany limit)
+OUTBOX_MAX_AGE = float(os.getenv("OUTBOX_MAX_AGE", str(24 * 3600)))
+OUTBOX_MAX_ROWS = int(os.getenv("OUTBOX_MAX_ROWS", "100000"))
+
+# Bez MQTT (MQTT_ENABLED=0 albo brak paho) zdarzeń nie ma komu wysłać - outbox nie jest zapisywany
+def outbox_enabled() -> bool:
+    return mqtt_handler.enabled
+
+# Zapisuje zdarzenie w outboksie - trafi do bazy razem z commitem zmiany, której dotyczy
+# (działa z Session i AsyncSession; id wiersza jest znane po flushu/commicie); None, gdy MQTT jest wyłączone
+def stage(db: Session, message: dict, topic: str = MQTT_TOPIC_EXPENSES) -> Optional[models.OutboxEvent]:
+    if not outbox_enabled():
+        return None
+    event = models.OutboxEvent(topic=topic, payload=json.dumps(message), attempts=0)
+    db.add(event)
+    return event
+
+# Zdarzenia wielu zmian naraz (AsyncSession): jedno wielowierszowe INSERT ... RETURNING na porcję
+# Zwraca id wierszy w kolejności zdarzeń (dopasowane po treści - kolejność RETURNING nie jest gwarantowana,
+# więc każde zdarzenie musi być inne, np. mieć własne id wiadomości)
+STAGE_CHUNK = 500
+
+async def stage_many(db, messages: List[dict], topic: str = MQTT_TOPIC_EXPENSES) -> List[Optional[int]]:
+    if not outbox_enabled():
+        return [None] * len(messages)
+    payloads = [json.dumps(message) for message in messages]
+    ids = {}
+    for start in range(0, len(payloads), STAGE_CHUNK):
+        chunk = payloads[start:start + STAGE_CHUNK]
+        result = await db.execute(
+            insert(models.OutboxEvent)
+            .values([{"topic": topic, "payload": payload, "attempts": 0} for payload in chunk])
+            .returning(models.OutboxEvent.id, models.OutboxEvent.payload)
+        )
+        ids.update((payload, row_id) for row_id, payload in result.all())
+    return [ids[payload] for payload in payloads]
+
+class _Pending:
+    __slots__ = ("message", "topic", "outbox_id", "queued_at")
+
+    def __init__(self, message: dict, topic: str, outbox_id: Optional[int]):
+        self.message = message
+        self.topic = topic
+        self.outbox_id = outbox_id
+        self.queued_at = time.perf_counter()
+
+# Wysyłanie zdarzeń do MQTT poza pętlą zdarzeń
+# submit() tylko wkłada zdarzenie do ograniczonej kolejki; zadanie w tle zbiera serię zdarzeń
+# i publikuje ją w wątku, a potem jednym zapytaniem usuwa wysłane wiersze outboksu.
+# Zdarzenia z outboksu, które nie zostały wysłane (brak brokera, pełna kolejka, restart),
+# są wysyłane ponownie - doręczenie jest co najmniej jednokrotne.
+class MQTTPublisher:
+    def __init__(
+        self,
+        handler,
+        session_factory=AsyncSessionLocal,
+        queue_size: int = MQTT_QUEUE_SIZE,
+        batch_size: int = MQTT_BATCH_SIZE,
+        linger: float = MQTT_LINGER,
+        retry_interval: float = OUTBOX_RETRY_INTERVAL,
+        retry_after: float = OUTBOX_RETRY_AFTER,
+    ):
+        self.handler = handler
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger
+        self.retry_interval = retry_interval
+        self.retry_after = retry_after
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._in_flight = set()
+        self._sender: Optional[asyncio.Task] = None
+        self._retry: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.replayed = 0
+        self.expired = 0
+        self.batches = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    async def start(self):
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._run())
+        if self._retry is None and self.retry_interval > 0:
+            self._retry = asyncio.create_task(self._retry_loop())
+
+    # Wysyła to, co zostało w kolejce (najwyżej timeout sekund), i zatrzymuje zadania w tle
+    async def stop(self, timeout: float = 5.0):
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        if self._sender is None:
+            return
+        deadline = time.monotonic() + timeout
+        while not self.queue.empty() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self._sender.cancel()
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+        self._sender = None
+
+    # Nie blokuje; zwraca False, jeśli kolejka jest pełna (zdarzenie z outboksu zostanie wysłane ponownie)
+    def submit(self, message: dict, topic: str = MQTT_TOPIC_EXPENSES, outbox_id: Optional[int] = None) -> bool:
+        if outbox_id is not None and outbox_id in self._in_flight:
+            return True
+        try:
+            self.queue.put_nowait(_Pending(message, topic, outbox_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        if outbox_id is not None:
+            self._in_flight.add(outbox_id)
+        return True
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.linger > 0:
+                await asyncio.sleep(self.linger)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._send(batch)
+            except Exception as e:
+                logger.warning(f"MQTT publish batch failed: {e}")
+            finally:
+                for item in batch:
+                    self._in_flight.discard(item.outbox_id)
+
+    async def _send(self, batch: List[_Pending]):
+        results = await asyncio.to_thread(self._publish_batch, batch)
+        now = time.perf_counter()
+        sent_ids = []
+        for item, ok in zip(batch, results):
+            if not ok:
+                self.failed += 1
+                continue
+            self.published += 1
+            latency = now - item.queued_at
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            if item.outbox_id is not None:
+                sent_ids.append(item.outbox_id)
+        self.batches += 1
+        if sent_ids:
+            async with self.session_factory() as db:
+                await db.execute(delete(models.OutboxEvent).where(models.OutboxEvent.id.in_(sent_ids)))
+                await db.commit()
+
+    # Wykonywane w wątku - klient paho jest synchroniczny
+    def _publish_batch(self, batch: List[_Pending]) -> List[bool]:
+        return [self.handler.publish(item.message, item.topic, item.outbox_id) for item in batch]
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            try:
+                await self.expire()
+                await self.replay()
+            except Exception as e:
+                logger.warning(f"Outbox replay failed: {e}")
+
+    # Usuwa wiersze starsze niż max_age sekund i najstarsze ponad max_rows (także bez połączenia z brokerem)
+    # Zwraca liczbę usuniętych wierszy
+    async def expire(self, max_age: float = OUTBOX_MAX_AGE, max_rows: int = OUTBOX_MAX_ROWS) -> int:
+        removed = 0
+        async with self.session_factory() as db:
+            if max_age > 0:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+                removed += (await db.execute(delete(models.OutboxEvent).where(models.OutboxEvent.created_at < cutoff))).rowcount
+            if max_rows > 0:
+                # id najstarszego wiersza, który jeszcze mieści się w limicie
+                oldest_kept = (await db.execute(
+                    select(models.OutboxEvent.id).order_by(models.OutboxEvent.id.desc()).offset(max_rows - 1).limit(1)
+                )).scalar()
+                if oldest_kept is not None:
+                    removed += (await db.execute(delete(models.OutboxEvent).where(models.OutboxEvent.id < oldest_kept))).rowcount
+            await db.commit()
+        if removed:
+            self.expired += removed
+            logger.warning(f"Dropped {removed} undelivered outbox event(s) past retention")
+        return removed
+
+    # Ponownie wysyła zaległe wiersze outboksu (starsze niż retry_after sekund); zwraca ich liczbę
+    # Każdy worker ponawia co retry_interval, więc wiersze są najpierw przejmowane jednym UPDATE ... RETURNING:
+    # wiersz przejęty przez jeden worker inne pomijają przez retry_after sekund (potem może go przejąć
+    # dowolny worker, np. gdy pierwszy zakończył pracę przed wysłaniem)
+    async def replay(self, retry_after: Optional[float] = None) -> int:
+        if not self.handler.connected:
+            return 0
+        retry_after = self.retry_after if retry_after is None else retry_after
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=retry_after)
+        claimable = and_(
+            models.OutboxEvent.created_at <= cutoff,
+            or_(models.OutboxEvent.claimed_at.is_(None), models.OutboxEvent.claimed_at <= cutoff),
+        )
+        async with self.session_factory() as db:
+            candidates = (
+                select(models.OutboxEvent.id)
+                .where(claimable, models.OutboxEvent.id.not_in(self._in_flight))
+                .order_by(models.OutboxEvent.id)
+                .limit(OUTBOX_REPLAY_LIMIT)
+            )
+            rows = (await db.execute(
+                update(models.OutboxEvent)
+                .where(models.OutboxEvent.id.in_(candidates.scalar_subquery()), claimable)
+                .values(claimed_by=WORKER_ID, claimed_at=now, attempts=models.OutboxEvent.attempts + 1)
+                .returning(models.OutboxEvent.id, models.OutboxEvent.topic, models.OutboxEvent.payload)
+            )).all()
+            await db.commit()
+        submitted = 0
+        # Wiersze niewysłane z powodu pełnej kolejki przejmie ponownie następny przebieg po retry_after
+        for row_id, topic, payload in sorted(rows):
+            if not self.submit(json.loads(payload), topic, row_id):
+                break
+            submitted += 1
+        self.replayed += submitted
+        return submitted
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "in_flight": len(self._in_flight),
+            "submitted": self.submitted,
+            "published": self.published,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+            "expired": self.expired,
+            "batches": self.batches,
+            "avg_latency_ms": round(self._latency_total / self.published * 1000, 3) if self.published else 0.0,
+            "max_latency_ms": round(self._latency_max * 1000, 3),
+        }
+
+# Liczba zdarzeń w outboksie, które nie zostały jeszcze wysłane
+async def outbox_backlog(db) -> int:
+    return (await db.execute(select(func.count()).select_from(models.OutboxEvent))).scalar_one()
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from . import balances, changelog, chat, expenses, ledger, migrations, models, pagination, reports
+from .database import async_database_url
+
+# Sprawdzenie planów zapytań gorących ścieżek (tylko SQLite, EXPLAIN QUERY PLAN)
+# Każda ścieżka wywołuje te same funkcje co jej endpoint (expenses.page_query, expenses.delete itd.),
+# wykonane polecenia SQL są przechwytywane, a dla każdego sprawdzany jest plan:
+#  SCAN <tabela> bez USING      - przeglądanie całej tabeli zamiast indeksu
+#  AUTOMATIC ... INDEX          - indeks budowany przez SQLite na czas zapytania (brakuje stałego)
+#  TEMP B-TREE FOR ORDER BY     - sortowanie całego wyniku zamiast odczytu w kolejności indeksu (strony listy)
+# Zapisy ścieżek są wycofywane. Domyślnie sprawdzana jest nowa baza utworzona przez migracje.
+# Uruchomienie: python -m backend.manage check-query-plans [--current] [--verbose]
+
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+
+class Fixture(NamedTuple):
+    user_id: int
+    expense_id: int
+    expense_cursor: str
+    message_cursor: str
+    month: str
+    day: str
+
+class HotPath(NamedTuple):
+    name: str
+    run: Callable
+    # Tabele, które ścieżka celowo czyta w całości (np. eksport)
+    allow_scan: Tuple[str, ...] = ()
+    # Wynik ma przychodzić w kolejności indeksu (strony listy, eksport)
+    ordered: bool = False
+
+async def _expenses_page(db, fixture: Fixture, cursor: Optional[str] = None):
+    await expenses.read_page(db, expenses.page_query(100, cursor), 100)
+
+async def _export(db, fixture: Fixture):
+    chunks = ledger.export_chunks(lambda: _Borrowed(db), ledger.CSV, chunk=100)
+    await chunks.__anext__()
+    await chunks.aclose()
+
+# Sesja ścieżki podana do export_chunks zamiast fabryki sesji (nie jest zamykana przez eksport)
+class _Borrowed:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        return False
+
+async def _delete_expense(db, fixture: Fixture):
+    expense = await db.get(models.Expense, fixture.expense_id)
+    if expense is not None:
+        await expenses.delete(db, expense)
+
+async def _chat_latest(db, fixture: Fixture):
+    await chat.RecentMessages().latest(db)
+
+async def _chat_page(db, fixture: Fixture):
+    await db.execute(chat.page_query(50, fixture.message_cursor))
+
+def _run(fn, args, **kwargs):
+    async def run(db, fixture: Fixture):
+        await db.run_sync(lambda session: fn(session, *args(fixture), **kwargs))
+    return run
+
+HOT_PATHS: List[HotPath] = [
+    HotPath("GET /expenses/", _expenses_page, ordered=True),
+    HotPath("GET /expenses/?cursor=", lambda db, fixture: _expenses_page(db, fixture, fixture.expense_cursor), ordered=True),
+    HotPath("GET /expenses/changes", _run(changelog.changes_since, lambda f: (0,)), ordered=True),
+    HotPath("GET /expenses/export", _export, allow_scan=("users", "expenses"), ordered=True),
+    HotPath("DELETE /expenses/{id}", _delete_expense),
+    HotPath("GET /chat/history", _chat_latest, ordered=True),
+    HotPath("GET /chat/history?cursor=", _chat_page, ordered=True),
+    HotPath("GET /balances/", _run(balances.get_user_balances, lambda f: (f.user_id,))),
+    HotPath("GET /reports/monthly", _run(reports.monthly_spend, lambda f: (f.month, f.month))),
+    HotPath("GET /reports/monthly?mine", _run(reports.monthly_spend, lambda f: (f.month, f.month, f.user_id))),
+    HotPath("GET /reports/daily", _run(reports.daily_spend, lambda f: (f.user_id, f.day, f.day))),
+    HotPath("GET /reports/counterparties", _run(reports.counterparties, lambda f: (f.user_id, f.month, f.month))),
+    HotPath("GET /reports/descriptions", _run(reports.top_descriptions, lambda f: (f.month, f.month))),
+    HotPath("GET /reports/descriptions?mine", _run(reports.top_descriptions, lambda f: (f.month, f.month, 10, f.user_id))),
+    # Te same raporty liczone wprost z expenses/expense_shares (bez zestawień)
+    HotPath("reports.daily_spend(rollups=False)", _run(reports.daily_spend, lambda f: (f.user_id, f.day, f.day), rollups=False)),
+    HotPath("reports.counterparties(rollups=False)", _run(reports.counterparties, lambda f: (f.user_id, f.month, f.month), rollups=False)),
+]
+
+# Problemy w planie jednego polecenia
+def plan_problems(plan: List[str], allow_scan=(), ordered: bool = False) -> List[str]:
+    problems = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match:
+            table, rest = match.groups()
+            if "USING" not in rest and "VIRTUAL TABLE" not in rest and "CONSTANT ROW" not in detail and table not in allow_scan:
+                problems.append(f"full table scan: {detail}")
+        if "AUTOMATIC" in detail:
+            problems.append(f"automatic index: {detail}")
+        if ordered and "TEMP B-TREE" in detail and "ORDER BY" in detail:
+            problems.append(f"sort instead of index order: {detail}")
+    return problems
+
+# Dane do sprawdzenia: kilku użytkowników, wydatki z udziałami, wiadomości i zestawienia
+def seed(engine, expenses: int = 30):
+    now = datetime(2024, 1, 1)
+    with Session(engine) as db:
+        users = [models.User(username=f"plan-check-{number}", hashed_password="") for number in range(3)]
+        db.add_all(users)
+        db.flush()
+        for number in range(expenses):
+            payer, debtor = users[number % 3], users[(number + 1) % 3]
+            expense = models.Expense(payer_id=payer.id, amount_minor=1000 + 100 * number, description=f"item {number % 5}", timestamp=now + timedelta(hours=number))
+            expense.shares = [models.ExpenseShare(debtor_id=payer.id, amount_owed_minor=500), models.ExpenseShare(debtor_id=debtor.id, amount_owed_minor=500 + 100 * number)]
+            db.add(expense)
+            db.add(models.Message(user_id=payer.id, content=f"message {number}", timestamp=now + timedelta(minutes=number)))
+        db.commit()
+        balances.rebuild_balances(db)
+        reports.rebuild(db)
+
+# Parametry ścieżek z najnowszego wydatku i wiadomości w bazie; plan nie zależy od danych,
+# więc przy pustych tabelach wystarczą dowolne wartości (ścieżka usuwania nie ma wtedy czego usunąć)
+def _fixture(engine) -> Fixture:
+    with Session(engine) as db:
+        expense = db.execute(
+            select(models.Expense).order_by(models.Expense.timestamp.desc(), models.Expense.id.desc()).limit(1)
+        ).scalar()
+        message = db.execute(
+            select(models.Message).order_by(models.Message.timestamp.desc(), models.Message.id.desc()).limit(1)
+        ).scalar()
+        user_id = db.execute(select(models.User.id).limit(1)).scalar() or 1
+    placeholder = datetime(2024, 1, 1)
+    timestamp = expense.timestamp if expense is not None and expense.timestamp is not None else placeholder
+    return Fixture(
+        user_id=expense.payer_id if expense is not None else user_id,
+        expense_id=expense.id if expense is not None else 0,
+        expense_cursor=pagination.encode_cursor(timestamp, expense.id if expense is not None else 0),
+        message_cursor=pagination.encode_cursor(message.timestamp, message.id) if message is not None else pagination.encode_cursor(placeholder, 0),
+        month=timestamp.strftime("%Y-%m"),
+        day=timestamp.strftime("%Y-%m-%d"),
+    )
+
+# Wykonuje ścieżki i zwraca listę (ścieżka, polecenie SQL, plan, problemy) dla każdego polecenia
+async def _explain_paths(url: str, fixture: Fixture, paths: List[HotPath]) -> List[tuple]:
+    async_engine = create_async_engine(async_database_url(url))
+    plan_engine = create_engine(url)
+    statements: List[Tuple[str, tuple]] = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        statements.append((statement, tuple(parameters or ())))
+
+    results = []
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    try:
+        with plan_engine.connect() as plan_conn:
+            for path in paths:
+                statements.clear()
+                async with session_factory() as db:
+                    try:
+                        await path.run(db, fixture)
+                    finally:
+                        await db.rollback()
+                for statement, parameters in statements:
+                    if not statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+                        continue
+                    rows = plan_conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                    plan = [row[-1] for row in rows]
+                    results.append((path.name, statement, plan, plan_problems(plan, path.allow_scan, path.ordered)))
+    finally:
+        await async_engine.dispose()
+        plan_engine.dispose()
+    return results
+
+# Sprawdza plany na bazie url albo (url=None) na nowej bazie tymczasowej utworzonej przez migracje
+def check(url: Optional[str] = None, paths: Optional[List[HotPath]] = None) -> List[tuple]:
+    paths = HOT_PATHS if paths is None else paths
+    if url is not None:
+        if not url.startswith("sqlite"):
+            raise ValueError("Query plan checks need a SQLite database")
+        engine = create_engine(url)
+        try:
+            fixture = _fixture(engine)
+        finally:
+            engine.dispose()
+        return asyncio.run(_explain_paths(url, fixture, paths))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+        engine = create_engine(url)
+        try:
+            migrations.upgrade(engine)
+            seed(engine)
+            fixture = _fixture(engine)
+        finally:
+            engine.dispose()
+        return asyncio.run(_explain_paths(url, fixture, paths))
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
+from fastapi import WebSocket
+from .models import OutboxEvent
+from .protocols import MQTT_TOPIC_EXPENSES, mqtt_handler
+from .publisher import MQTTPublisher
+
+logger = logging.getLogger(__name__)
+
+# Maksymalna liczba wiadomości czekających w kolejce jednego klienta
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+# Maksymalny czas wysłania jednej wiadomości do klienta (sekundy)
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Co zrobić z klientem, którego kolejka jest pełna:
+#  disconnect  - zamknąć połączenie (klient połączy się ponownie i przeładuje dane)
+#  drop_oldest - usunąć najstarszą wiadomość z kolejki
+#  drop_newest - nie dokładać nowej wiadomości
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest", "drop_newest")
+
+# Kod zamknięcia WebSocket "Try Again Later"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# Połączony klient: kolejka wychodząca i zadanie, które ją opróżnia
+class _Client:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task = None
+
+# Nadzorca połączeń WebSocket i wysyłaniem wiadomości w czasie rzeczywistym
+# Broadcast tylko wkłada wiadomość do kolejek - wolny lub martwy klient nie wstrzymuje pozostałych
+class ConnectionManager:
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT, slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {slow_consumer_policy!r}, use one of: {', '.join(SLOW_CONSUMER_POLICIES)}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.active_connections: Dict[WebSocket, _Client] = {}
+        self.broadcasts = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.register(websocket)
+
+    # Rejestruje już zaakceptowane połączenie i uruchamia jego zadanie wysyłające
+    def register(self, websocket: WebSocket):
+        client = _Client(websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._writer(client))
+        self.active_connections[websocket] = client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if client is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    # Wiadomość (dict lub gotowy JSON) jest serializowana raz i trafia do kolejki każdego klienta
+    async def broadcast(self, message: Union[str, dict]):
+        payload = message if isinstance(message, str) else json.dumps(message)
+        self.broadcasts += 1
+        slow = []
+        for client in list(self.active_connections.values()):
+            if not self._enqueue(client, payload):
+                slow.append(client)
+        if slow:
+            await asyncio.gather(*(self._close(client, CLOSE_TRY_AGAIN_LATER) for client in slow))
+
+    def _enqueue(self, client: _Client, payload: str) -> bool:
+        try:
+            client.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.slow_consumer_policy == "drop_newest":
+            self.messages_dropped += 1
+            return True
+        if self.slow_consumer_policy == "drop_oldest":
+            client.queue.get_nowait()
+            client.queue.put_nowait(payload)
+            self.messages_dropped += 1
+            return True
+        self.slow_disconnects += 1
+        return False
+
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                payload = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(payload), self.send_timeout)
+                self.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Martwe lub zbyt wolne połączenie - usuwamy je z listy aktywnych
+            self.send_errors += 1
+            logger.info(f"Dropping WebSocket client after send failure: {e!r}")
+            await self._close(client)
+
+    async def _close(self, client: _Client, code: int = 1000):
+        self.disconnect(client.websocket)
+        try:
+            await client.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def close_all(self):
+        clients = list(self.active_connections.values())
+        await asyncio.gather(*(self._close(client, 1001) for client in clients))
+        await asyncio.gather(*(client.writer for client in clients), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "queued": sum(client.queue.qsize() for client in self.active_connections.values()),
+            "broadcasts": self.broadcasts,
+            "sent": self.messages_sent,
+            "dropped": self.messages_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+        }
+
+manager = ConnectionManager()
+
+# Szyna zdarzeń między workerami. Każdy worker ma własną listę połączeń (ConnectionManager),
+# więc zdarzenie z jednego workera musi dotrzeć do klientów podłączonych do pozostałych.
+# Wybór implementacji: REALTIME_BACKPLANE=inprocess|mqtt
+REALTIME_BACKPLANE = os.getenv("REALTIME_BACKPLANE", "inprocess")
+
+class Backplane(ABC):
+    def __init__(self):
+        # Wywoływane dla każdego zdarzenia od innych workerów, przed rozesłaniem go lokalnym klientom
+        # (np. aktualizacja bufora historii czatu)
+        self.remote_listeners: List[Callable[[dict], None]] = []
+
+    async def start(self, manager: ConnectionManager):
+        pass
+
+    # Przekazuje zdarzenie poza ten proces (lokalni klienci dostali je już z ConnectionManager)
+    # outbox_id - wiersz outboksu z tym zdarzeniem, usuwany po udanej publikacji
+    @abstractmethod
+    async def publish(self, message: dict, topic: str, outbox_id: Optional[int] = None):
+        pass
+
+    async def stop(self):
+        pass
+
+# Jeden worker: zdarzenia trafiają tylko do lokalnych klientów, do MQTT wysyłane są
+# jak dotąd wyłącznie dla zewnętrznych odbiorców (w tle, przez MQTTPublisher)
+class InProcessBackplane(Backplane):
+    def __init__(self, handler=mqtt_handler, publisher: Optional[MQTTPublisher] = None):
+        super().__init__()
+        self.handler = handler
+        self.publisher = publisher or MQTTPublisher(handler)
+
+    # Połączenie z brokerem powstaje dopiero tutaj (lifespan aplikacji)
+    # Bez MQTT (MQTT_ENABLED=0 albo brak paho) zdarzenia nie trafiają do MQTTPublisher - jak outboks
+    async def start(self, manager: ConnectionManager):
+        self.handler.connect()
+        if self.handler.enabled:
+            await self.publisher.start()
+
+    async def publish(self, message: dict, topic: str, outbox_id: Optional[int] = None):
+        if self.handler.enabled:
+            self.publisher.submit(message, topic, outbox_id)
+
+    async def stop(self):
+        await self.publisher.stop()
+        self.handler.disconnect()
+
+# Wiele workerów: zdarzenia innych workerów przychodzą z subskrypcji MQTTHandler
+# i są przekazywane lokalnym klientom. Własne wiadomości (to samo "origin") odrzuca
+# MQTTHandler, powtórzenia odrzuca backplane: zdarzenia z outboksu po outbox_id (to samo przy ponownym
+# wysłaniu z outboksu, także przez inny worker; zdarzenia opublikowane tutaj są zapamiętywane od razu),
+# pozostałe po (origin, origin_seq), np. przy ponownym doręczeniu QoS 1.
+class MQTTBackplane(InProcessBackplane):
+    def __init__(self, handler=mqtt_handler, publisher: Optional[MQTTPublisher] = None, dedup_window: int = 4096):
+        super().__init__(handler, publisher)
+        self.dedup_window = dedup_window
+        self.manager: Optional[ConnectionManager] = None
+        self.relayed = 0
+        self.duplicates = 0
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self, manager: ConnectionManager):
+        self.manager = manager
+        self._loop = asyncio.get_running_loop()
+        self.handler.add_listener(self._on_remote)
+        await super().start(manager)
+
+    async def stop(self):
+        self.handler.remove_listener(self._on_remote)
+        await super().stop()
+
+    async def publish(self, message: dict, topic: str, outbox_id: Optional[int] = None):
+        if outbox_id is not None:
+            # Klienci tego workera już je dostali - ponowne wysłanie przez inny worker wróci tu jako powtórzenie
+            self._remember(("outbox", outbox_id))
+        await super().publish(message, topic, outbox_id)
+
+    # True, jeśli klucz był już widziany
+    def _remember(self, key: tuple) -> bool:
+        if key in self._seen:
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+        return False
+
+    # Wywoływane z wątku klienta MQTT - przenosimy obsługę do pętli zdarzeń
+    def _on_remote(self, topic: str, message: dict):
+        self._loop.call_soon_threadsafe(self._relay, message)
+
+    def _relay(self, message: dict):
+        key = (message.pop("origin", None), message.pop("origin_seq", None))
+        outbox_id = message.pop("outbox_id", None)
+        if outbox_id is not None:
+            key = ("outbox", outbox_id)
+        if self._remember(key):
+            self.duplicates += 1
+            return
+        self.relayed += 1
+        for listener in self.remote_listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.warning(f"Remote event listener failed: {e}")
+        self._loop.create_task(self.manager.broadcast(message))
+
+def create_backplane(kind: str = REALTIME_BACKPLANE) -> Backplane:
+    if kind == "mqtt":
+        return MQTTBackplane()
+    if kind == "inprocess":
+        return InProcessBackplane()
+    raise ValueError(f"Unknown backplane {kind!r}, use 'inprocess' or 'mqtt'")
+
+backplane = create_backplane()
+
+# Wysyła zdarzenie do klientów tego workera i przez backplane do pozostałych
+# Zdarzenia zmian danych są wcześniej zapisywane w outboksie (publisher.stage) - przekazujemy ten wiersz
+# (None, gdy outbox jest wyłączony)
+async def publish(message: dict, topic: str = MQTT_TOPIC_EXPENSES, outbox: Optional[OutboxEvent] = None):
+    await manager.broadcast(message)
+    await backplane.publish(message, topic, outbox.id if outbox is not None else None)
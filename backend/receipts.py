@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, NamedTuple, Optional
+from . import thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Paragony (zdjęcia i PDF) dołączane do wydatków, zapisywane na dysku pod skrótem SHA-256 treści
+# (content-addressed): ten sam plik wysłany kilka razy zajmuje miejsce raz, a wiersze receipts
+# tylko się do niego odwołują. Przesyłanie jest strumieniowe - porcje trafiają do pliku tymczasowego
+# i są haszowane na bieżąco (w wątkach receipt-io), więc pamięć nie rośnie z rozmiarem pliku.
+# Pliki bez odwołań usuwa python -m backend.manage gc-receipts (nie trasa DELETE - ten sam plik
+# może właśnie wysyłać inne żądanie).
+
+RECEIPTS_DIR = os.getenv("RECEIPTS_DIR", "receipts")
+# Maksymalny rozmiar jednego pliku (bajty)
+RECEIPT_MAX_BYTES = int(os.getenv("RECEIPT_MAX_BYTES", str(20 * 1024 * 1024)))
+# Porcje ciała żądania są łączone do tego rozmiaru przed zapisem i haszowaniem (jedno przejście do wątku)
+RECEIPT_WRITE_CHUNK = int(os.getenv("RECEIPT_WRITE_CHUNK", str(1024 * 1024)))
+# Wątki zapisu plików (wspólne dla wszystkich przesyłań workera)
+RECEIPT_IO_WORKERS = int(os.getenv("RECEIPT_IO_WORKERS", "4"))
+# Procesy liczące miniatury (0 wyłącza miniatury) i ich rozmiar / jakość JPEG
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+# Obsługiwane typy rozpoznawane po pierwszych bajtach pliku (nagłówek Content-Type nie jest wiarygodny)
+PDF = "application/pdf"
+SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"%PDF-", PDF),
+]
+SNIFF_BYTES = 16
+
+# Plik tymczasowy starszy niż to (sekundy) to pozostałość przerwanego przesyłania
+STALE_UPLOAD_SECONDS = 3600
+
+class UploadTooLarge(Exception):
+    pass
+
+def sniff(head: bytes) -> Optional[str]:
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(RECEIPTS_DIR, sha256[:2], sha256[2:4], sha256)
+
+def thumbnail_path(sha256: str) -> str:
+    return os.path.join(RECEIPTS_DIR, "thumbnails", sha256[:2], f"{sha256}.jpg")
+
+def _tmp_dir() -> str:
+    return os.path.join(RECEIPTS_DIR, "tmp")
+
+_io_executor = ThreadPoolExecutor(max_workers=RECEIPT_IO_WORKERS, thread_name_prefix="receipt-io")
+
+async def _run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, fn, *args)
+
+class StoredBlob(NamedTuple):
+    sha256: str
+    size: int
+    content_type: str
+    # False - taki plik już był zapisany (duplikat)
+    created: bool
+
+# Plik tymczasowy przesyłania; metody wywoływane w wątkach receipt-io
+class _Upload:
+    def __init__(self):
+        os.makedirs(_tmp_dir(), exist_ok=True)
+        self.path = os.path.join(_tmp_dir(), uuid.uuid4().hex)
+        self.file = open(self.path, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        # hashlib i zapis zwalniają GIL dla dużych porcji
+        self.hash.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    # Przenosi plik pod docelową nazwę; jeśli już istnieje - usuwa kopię tymczasową
+    def finish(self) -> StoredBlob:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        sha256 = self.hash.hexdigest()
+        target = blob_path(sha256)
+        if os.path.exists(target):
+            os.remove(self.path)
+            # Świeży czas modyfikacji - gc-receipts nie usunie pliku, zanim powstanie wiersz z odwołaniem
+            os.utime(target)
+            return StoredBlob(sha256, self.size, "", False)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self.path, target)
+        return StoredBlob(sha256, self.size, "", True)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Zapisuje strumień (np. request.stream()) jako plik paragonu
+# ValueError - nieobsługiwany typ pliku, UploadTooLarge - plik większy niż max_bytes
+async def store(chunks: AsyncIterator[bytes], max_bytes: int = RECEIPT_MAX_BYTES) -> StoredBlob:
+    upload = await _run_io(_Upload)
+    content_type = None
+    buffer = bytearray()
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge(f"Receipt is larger than {max_bytes} bytes")
+            buffer += chunk
+            if content_type is None and len(buffer) >= SNIFF_BYTES:
+                content_type = _require_type(buffer)
+            if len(buffer) >= RECEIPT_WRITE_CHUNK:
+                await _run_io(upload.write, bytes(buffer))
+                buffer.clear()
+        if content_type is None:
+            content_type = _require_type(buffer)
+        if buffer:
+            await _run_io(upload.write, bytes(buffer))
+        blob = await _run_io(upload.finish)
+    except BaseException:
+        await _run_io(upload.abort)
+        raise
+    return blob._replace(content_type=content_type)
+
+def _require_type(head: bytes) -> str:
+    content_type = sniff(bytes(head[:SNIFF_BYTES]))
+    if content_type is None:
+        raise ValueError("Unsupported receipt file, send a JPEG, PNG or WebP image or a PDF")
+    return content_type
+
+# Miniatury w puli procesów (dekodowanie obrazu to praca CPU - poza pętlą zdarzeń i poza GIL workera)
+# Pula powstaje przy pierwszej miniaturze; zadania dla tego samego pliku są łączone
+class ThumbnailPool:
+    def __init__(self, workers: int = THUMBNAIL_WORKERS, size: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY):
+        self.workers = workers
+        self.size = size
+        self.quality = quality
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.generated = 0
+        self.failed = 0
+        self._available: Optional[bool] = None
+
+    @property
+    def enabled(self) -> bool:
+        if self._available is None:
+            self._available = thumbnails.available()
+        return self.workers > 0 and self._available
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn - proces roboczy nie dziedziczy wątków i pętli zdarzeń workera (bezpieczne przy wątkach)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    # Ścieżka miniatury (liczonej teraz, jeśli jej brak) albo None, gdy miniatury nie ma i nie będzie
+    async def ensure(self, sha256: str, content_type: str) -> Optional[str]:
+        target = thumbnail_path(sha256)
+        if os.path.exists(target):
+            return target
+        if not self.enabled or not content_type.startswith("image/"):
+            return None
+        future = self._in_flight.get(sha256)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool(), thumbnails.make_thumbnail, blob_path(sha256), target, self.size, self.quality)
+            self._in_flight[sha256] = future
+            future.add_done_callback(lambda done: self._finished(sha256, done))
+        try:
+            created = await asyncio.shield(future)
+        except Exception:
+            return None
+        return target if created else None
+
+    def _finished(self, sha256: str, future: asyncio.Future):
+        self._in_flight.pop(sha256, None)
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+            if not future.cancelled():
+                logger.warning(f"Thumbnail for receipt {sha256} failed: {future.exception()!r}")
+        else:
+            self.generated += 1
+
+    # Miniatura liczona w tle zaraz po przesłaniu (bez czekania w żądaniu)
+    def schedule(self, sha256: str, content_type: str):
+        if self.enabled and content_type.startswith("image/"):
+            asyncio.get_running_loop().create_task(self.ensure(sha256, content_type))
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"enabled": int(self.enabled), "in_flight": len(self._in_flight), "generated": self.generated, "failed": self.failed}
+
+thumbnail_pool = ThumbnailPool()
+
+# Usuwa pliki, do których nie odwołuje się żaden wiersz receipts (z ich miniaturami),
+# i pozostałości przerwanych przesyłań; pomija pliki młodsze niż grace_seconds
+def collect_garbage(referenced: Iterable[str], grace_seconds: float = STALE_UPLOAD_SECONDS) -> Dict[str, int]:
+    referenced = set(referenced)
+    cutoff = time.time() - grace_seconds
+    removed = {"blobs": 0, "thumbnails": 0, "uploads": 0, "bytes": 0}
+    if not os.path.isdir(RECEIPTS_DIR):
+        return removed
+    for directory, subdirectories, files in os.walk(RECEIPTS_DIR):
+        relative = os.path.relpath(directory, RECEIPTS_DIR).split(os.sep)
+        for name in files:
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            if relative[0] == "tmp":
+                kind = "uploads"
+            elif relative[0] == "thumbnails":
+                if name.split(".")[0] in referenced:
+                    continue
+                kind = "thumbnails"
+            elif name not in referenced:
+                kind = "blobs"
+            else:
+                continue
+            os.remove(path)
+            removed[kind] += 1
+            removed["bytes"] += stat.st_size
+    return removed
@@ -0,0 +1,426 @@
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import String, and_, cast, delete, func, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import models, money
+
+# Raporty wydatków (/reports): wydatki miesięczne i dzienne użytkowników, rozliczenia z kontrahentami
+# i najczęstsze opisy. Dane pochodzą z tabel zestawień (models.*Rollup), które trasy wydatków
+# aktualizują przyrostowo w tej samej transakcji co wydatek - raport nie czyta całej historii.
+# Wersje liczone bezpośrednio z expenses/expense_shares (rollups=False) służą do porównań i testów zgodności.
+
+DAY = "day"
+MONTH = "month"
+
+# Pamięć podręczna raportów (liczba wpisów i maksymalny czas życia wpisu w sekundach)
+REPORTS_CACHE_SIZE = int(os.getenv("REPORTS_CACHE_SIZE", "1000"))
+REPORTS_CACHE_TTL = float(os.getenv("REPORTS_CACHE_TTL", "300"))
+# Domyślna i maksymalna liczba opisów w raporcie najczęstszych opisów
+TOP_DESCRIPTIONS = 10
+MAX_TOP_DESCRIPTIONS = 100
+
+# Liczba kluczy w jednym zapytaniu sprzątającym puste wiersze zestawień
+CLEANUP_CHUNK = 300
+
+# Dzień i miesiąc wydatku w takim formacie, w jakim SQLite zapisuje datę (czas bez strefy)
+def periods(timestamp: Optional[datetime]) -> Tuple[str, str]:
+    timestamp = timestamp or models.utcnow()
+    return timestamp.strftime("%Y-%m-%d"), timestamp.strftime("%Y-%m")
+
+# Zmiany zestawień wynikające z wydatków - odpowiednik balances.Deltas dla raportów
+# Kwoty w jednostkach podrzędnych (int), więc sumy są dokładne
+class Rollups:
+    def __init__(self):
+        # (user_id, grain, period) -> [paid, paid_count, share, share_count]
+        self.spend: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0, 0])
+        # (payer_id, debtor_id, month) -> [amount, count]
+        self.pairs: Dict[tuple, list] = defaultdict(lambda: [0, 0])
+        # (payer_id, month, description) -> [total, count]
+        self.descriptions: Dict[tuple, list] = defaultdict(lambda: [0, 0])
+        # (month, description) -> [total, count]
+        self.group_descriptions: Dict[tuple, list] = defaultdict(lambda: [0, 0])
+
+    def parts(self) -> Tuple[dict, ...]:
+        return self.spend, self.pairs, self.descriptions, self.group_descriptions
+
+    def merge(self, other: "Rollups"):
+        for target, source in zip(self.parts(), other.parts()):
+            for key, row in source.items():
+                merged = target[key]
+                for position, value in enumerate(row):
+                    merged[position] += value
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts())
+
+# Dopisuje do rollups zmiany dla jednego wydatku (sign=1 dodanie, sign=-1 wycofanie)
+# amount_minor i amount_owed_minor udziałów w jednostkach podrzędnych
+# shares: obiekty z debtor_id i amount_owed_minor (modele albo schematy)
+def expense_rollups(
+    payer_id: int,
+    amount_minor: Optional[int],
+    description: Optional[str],
+    timestamp: Optional[datetime],
+    shares: Iterable,
+    sign: int = 1,
+    rollups: Optional[Rollups] = None,
+) -> Rollups:
+    rollups = Rollups() if rollups is None else rollups
+    day, month = periods(timestamp)
+    for grain, period in ((DAY, day), (MONTH, month)):
+        row = rollups.spend[(payer_id, grain, period)]
+        row[0] += sign * (amount_minor or 0)
+        row[1] += sign
+    for share in shares:
+        if share.debtor_id is None:
+            continue
+        owed = sign * (share.amount_owed_minor or 0)
+        for grain, period in ((DAY, day), (MONTH, month)):
+            row = rollups.spend[(share.debtor_id, grain, period)]
+            row[2] += owed
+            row[3] += sign
+        if share.debtor_id != payer_id:
+            row = rollups.pairs[(payer_id, share.debtor_id, month)]
+            row[0] += owed
+            row[1] += sign
+    for row in (rollups.descriptions[(payer_id, month, description or "")], rollups.group_descriptions[(month, description or "")]):
+        row[0] += sign * (amount_minor or 0)
+        row[1] += sign
+    return rollups
+
+# Tabele zestawień w kolejności Rollups.parts(): model, kolumny klucza, kolumny sumowane, warunek pustego wiersza
+TABLES = (
+    (models.UserSpendRollup, ["user_id", "grain", "period"], ["paid_minor", "paid_count", "share_minor", "share_count"],
+     and_(models.UserSpendRollup.paid_count <= 0, models.UserSpendRollup.share_count <= 0)),
+    (models.PairRollup, ["payer_id", "debtor_id", "month"], ["amount_minor", "count"], models.PairRollup.count <= 0),
+    (models.DescriptionRollup, ["payer_id", "month", "description"], ["total_minor", "count"], models.DescriptionRollup.count <= 0),
+    (models.GroupDescriptionRollup, ["month", "description"], ["total_minor", "count"], models.GroupDescriptionRollup.count <= 0),
+)
+
+def _rows(keys: List[str], values: List[str], changes: Dict[tuple, list]) -> List[dict]:
+    return [dict(zip(keys + values, key + tuple(row))) for key, row in changes.items()]
+
+def _insert_for(db: Session):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+# INSERT ... ON CONFLICT DO UPDATE dodające zmiany do istniejących wierszy (jedno executemany na tabelę)
+def _upsert(db: Session, model, keys: List[str], values: List[str], changes: Dict[tuple, list]):
+    if not changes:
+        return
+    stmt = _insert_for(db)(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in values},
+    )
+    db.execute(stmt, _rows(keys, values, changes))
+
+# Usuwa wiersze, w których nie został żaden wydatek (po wycofaniu wydatków)
+def _cleanup(db: Session, model, keys: List[str], empty, changes: Dict[tuple, list]):
+    touched = [key for key, row in changes.items() if any(value < 0 for value in row)]
+    columns = [getattr(model, name) for name in keys]
+    # OR kluczy zamiast krotki IN (VALUES ...) - przy kilku krotkach SQLite przegląda całą tabelę
+    for start in range(0, len(touched), CLEANUP_CHUNK):
+        chunk = touched[start:start + CLEANUP_CHUNK]
+        db.execute(delete(model).where(empty, or_(*(and_(*(column == value for column, value in zip(columns, key))) for key in chunk))))
+
+# Nanosi zmiany na tabele zestawień; nie robi commita - wywołujący zatwierdza je razem z wydatkiem
+def apply_rollups(db: Session, *parts: Rollups):
+    total = Rollups()
+    for part in parts:
+        total.merge(part)
+    for (model, keys, values, empty), changes in zip(TABLES, total.parts()):
+        _upsert(db, model, keys, values, changes)
+        _cleanup(db, model, keys, empty, changes)
+
+# Zestawienia dla wydatku z wczytanymi udziałami (sign=1 dodanie, sign=-1 wycofanie)
+def apply_expense(db: Session, expense: models.Expense, sign: int = 1):
+    apply_rollups(db, expense_rollups(expense.payer_id, expense.amount_minor, expense.description, expense.timestamp, expense.shares, sign))
+
+def _day_of(column):
+    return func.substr(cast(column, String), 1, 10)
+
+def _month_of(column):
+    return func.substr(cast(column, String), 1, 7)
+
+# Przelicza wszystkie zestawienia od zera zapytaniami GROUP BY na expenses/expense_shares
+# Zwraca liczbę zapisanych wierszy zestawień
+def rebuild(db: Session) -> int:
+    expense, share = models.Expense, models.ExpenseShare
+    rollups = Rollups()
+    for grain, period_of in ((DAY, _day_of), (MONTH, _month_of)):
+        period = period_of(expense.timestamp)
+        for payer_id, key, paid, count in db.execute(
+            select(expense.payer_id, period, func.sum(expense.amount_minor), func.count()).group_by(expense.payer_id, period)
+        ):
+            row = rollups.spend[(payer_id, grain, key)]
+            row[0] += paid or 0
+            row[1] += count
+        for debtor_id, key, owed, count in db.execute(
+            select(share.debtor_id, period, func.sum(share.amount_owed_minor), func.count())
+            .join(expense, share.expense_id == expense.id)
+            .where(share.debtor_id.isnot(None))
+            .group_by(share.debtor_id, period)
+        ):
+            row = rollups.spend[(debtor_id, grain, key)]
+            row[2] += owed or 0
+            row[3] += count
+    month = _month_of(expense.timestamp)
+    for payer_id, debtor_id, key, owed, count in db.execute(
+        select(expense.payer_id, share.debtor_id, month, func.sum(share.amount_owed_minor), func.count())
+        .join(expense, share.expense_id == expense.id)
+        .where(share.debtor_id.isnot(None), share.debtor_id != expense.payer_id)
+        .group_by(expense.payer_id, share.debtor_id, month)
+    ):
+        rollups.pairs[(payer_id, debtor_id, key)] = [owed or 0, count]
+    description = func.coalesce(expense.description, "")
+    for payer_id, key, text, total, count in db.execute(
+        select(expense.payer_id, month, description, func.sum(expense.amount_minor), func.count())
+        .group_by(expense.payer_id, month, description)
+    ):
+        rollups.descriptions[(payer_id, key, text)] = [total or 0, count]
+        row = rollups.group_descriptions[(key, text)]
+        row[0] += total or 0
+        row[1] += count
+
+    # Tabele są puste - zwykłe INSERT zamiast upsertu
+    for (model, keys, values, _), changes in zip(TABLES, rollups.parts()):
+        db.execute(delete(model))
+        if changes:
+            db.execute(insert(model), _rows(keys, values, changes))
+    db.commit()
+    return len(rollups)
+
+# Wypełnia zestawienia przy pierwszym uruchomieniu na bazie, która ma już wydatki
+def ensure_rollups(engine) -> bool:
+    with Session(engine) as db:
+        if db.execute(select(models.UserSpendRollup.user_id).limit(1)).first() is not None:
+            return False
+        if db.execute(select(models.Expense.id).limit(1)).first() is None:
+            return False
+        rebuild(db)
+    return True
+
+# Zakres miesięcy RRRR-MM (włącznie) jako granice czasu [od, do) dla zapytań na expenses
+def _month_bounds(start: Optional[str], end: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    lower = datetime.strptime(start, "%Y-%m") if start else None
+    upper = None
+    if end:
+        year, month = map(int, end.split("-"))
+        upper = datetime(year + month // 12, month % 12 + 1, 1)
+    return lower, upper
+
+def _day_bounds(start: Optional[str], end: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    lower = datetime.strptime(start, "%Y-%m-%d") if start else None
+    upper = datetime.fromordinal(datetime.strptime(end, "%Y-%m-%d").toordinal() + 1) if end else None
+    return lower, upper
+
+def _between(column, start, end):
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if end is not None:
+        conditions.append(column <= end)
+    return conditions
+
+def _in_time_range(column, bounds):
+    lower, upper = bounds
+    conditions = []
+    if lower is not None:
+        conditions.append(column >= lower)
+    if upper is not None:
+        conditions.append(column < upper)
+    return conditions
+
+def _usernames(db: Session, user_ids) -> Dict[int, str]:
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    return dict(db.execute(select(models.User.id, models.User.username).where(models.User.id.in_(user_ids))).all())
+
+def _spend_rows(rows, period_name: str) -> List[dict]:
+    return [
+        {
+            period_name: period,
+            "user_id": user_id,
+            "paid": money.to_major(paid or 0),
+            "paid_count": paid_count or 0,
+            "share": money.to_major(share or 0),
+            "share_count": share_count or 0,
+        }
+        for (period, user_id), (paid, paid_count, share, share_count) in sorted(rows.items())
+    ]
+
+# Wydatki bezpośrednio z expenses/expense_shares: (okres, użytkownik) -> [paid, paid_count, share, share_count]
+def _spend_raw(db: Session, period_of, bounds, user_id: Optional[int]) -> Dict[tuple, list]:
+    expense, share = models.Expense, models.ExpenseShare
+    period = period_of(expense.timestamp)
+    rows: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0, 0])
+    paid = select(period, expense.payer_id, func.sum(expense.amount_minor), func.count()).where(*_in_time_range(expense.timestamp, bounds))
+    if user_id is not None:
+        paid = paid.where(expense.payer_id == user_id)
+    for key, uid, total, count in db.execute(paid.group_by(period, expense.payer_id)):
+        rows[(key, uid)][0:2] = [total, count]
+    owed = (
+        select(period, share.debtor_id, func.sum(share.amount_owed_minor), func.count())
+        .join(expense, share.expense_id == expense.id)
+        .where(share.debtor_id.isnot(None), *_in_time_range(expense.timestamp, bounds))
+    )
+    if user_id is not None:
+        owed = owed.where(share.debtor_id == user_id)
+    for key, uid, total, count in db.execute(owed.group_by(period, share.debtor_id)):
+        rows[(key, uid)][2:4] = [total, count]
+    return rows
+
+def _spend_rollups(db: Session, grain: str, start, end, user_id: Optional[int]) -> Dict[tuple, list]:
+    rollup = models.UserSpendRollup
+    query = select(rollup.period, rollup.user_id, rollup.paid_minor, rollup.paid_count, rollup.share_minor, rollup.share_count).where(
+        rollup.grain == grain, *_between(rollup.period, start, end)
+    )
+    if user_id is not None:
+        query = query.where(rollup.user_id == user_id)
+    return {(period, uid): values for period, uid, *values in db.execute(query)}
+
+# Wydatki miesięczne użytkowników (całej grupy albo jednego użytkownika) w zakresie miesięcy RRRR-MM
+def monthly_spend(db: Session, start: Optional[str] = None, end: Optional[str] = None, user_id: Optional[int] = None, rollups: bool = True) -> List[dict]:
+    if rollups:
+        rows = _spend_rollups(db, MONTH, start, end, user_id)
+    else:
+        rows = _spend_raw(db, _month_of, _month_bounds(start, end), user_id)
+    result = _spend_rows(rows, "month")
+    names = _usernames(db, (row["user_id"] for row in result))
+    for row in result:
+        row["username"] = names.get(row["user_id"])
+    return result
+
+# Wydatki dzienne jednego użytkownika w zakresie dni RRRR-MM-DD
+def daily_spend(db: Session, user_id: int, start: Optional[str] = None, end: Optional[str] = None, rollups: bool = True) -> List[dict]:
+    if rollups:
+        rows = _spend_rollups(db, DAY, start, end, user_id)
+    else:
+        rows = _spend_raw(db, _day_of, _day_bounds(start, end), user_id)
+    result = _spend_rows(rows, "day")
+    for row in result:
+        del row["user_id"]
+    return result
+
+# Rozliczenia użytkownika z każdym kontrahentem w zakresie miesięcy:
+# lent - udziały kontrahenta w wydatkach użytkownika, borrowed - udziały użytkownika w wydatkach kontrahenta
+def counterparties(db: Session, user_id: int, start: Optional[str] = None, end: Optional[str] = None, rollups: bool = True) -> List[dict]:
+    totals: Dict[int, list] = defaultdict(lambda: [0, 0, 0])
+    if rollups:
+        pair = models.PairRollup
+        lent = (
+            select(pair.debtor_id, func.sum(pair.amount_minor), func.sum(pair.count))
+            .where(pair.payer_id == user_id, *_between(pair.month, start, end))
+            .group_by(pair.debtor_id)
+        )
+        borrowed = (
+            select(pair.payer_id, func.sum(pair.amount_minor), func.sum(pair.count))
+            .where(pair.debtor_id == user_id, *_between(pair.month, start, end))
+            .group_by(pair.payer_id)
+        )
+    else:
+        expense, share = models.Expense, models.ExpenseShare
+        in_range = _in_time_range(expense.timestamp, _month_bounds(start, end))
+        lent = (
+            select(share.debtor_id, func.sum(share.amount_owed_minor), func.count())
+            .join(expense, share.expense_id == expense.id)
+            .where(expense.payer_id == user_id, share.debtor_id.isnot(None), share.debtor_id != user_id, *in_range)
+            .group_by(share.debtor_id)
+        )
+        borrowed = (
+            select(expense.payer_id, func.sum(share.amount_owed_minor), func.count())
+            .join(expense, share.expense_id == expense.id)
+            .where(share.debtor_id == user_id, expense.payer_id != user_id, *in_range)
+            .group_by(expense.payer_id)
+        )
+    for counterparty_id, amount, count in db.execute(lent):
+        totals[counterparty_id][0] += amount or 0
+        totals[counterparty_id][2] += count or 0
+    for counterparty_id, amount, count in db.execute(borrowed):
+        totals[counterparty_id][1] += amount or 0
+        totals[counterparty_id][2] += count or 0
+    names = _usernames(db, totals)
+    result = [
+        {
+            "counterparty_id": counterparty_id,
+            "username": names.get(counterparty_id),
+            "lent": money.to_major(lent_total),
+            "borrowed": money.to_major(borrowed_total),
+            "net": money.to_major(lent_total - borrowed_total),
+            "count": count,
+        }
+        for counterparty_id, (lent_total, borrowed_total, count) in totals.items()
+    ]
+    result.sort(key=lambda row: (-(row["lent"] + row["borrowed"]), row["counterparty_id"]))
+    return result
+
+# Opisy wydatków o największej łącznej kwocie (całej grupy albo zapłacone przez payer_id)
+def top_descriptions(db: Session, start: Optional[str] = None, end: Optional[str] = None, limit: int = TOP_DESCRIPTIONS, payer_id: Optional[int] = None, rollups: bool = True) -> List[dict]:
+    if rollups:
+        rollup = models.GroupDescriptionRollup if payer_id is None else models.DescriptionRollup
+        total, count = func.sum(rollup.total_minor), func.sum(rollup.count)
+        query = select(rollup.description, total, count).where(*_between(rollup.month, start, end))
+        if payer_id is not None:
+            query = query.where(rollup.payer_id == payer_id)
+        query = query.group_by(rollup.description)
+    else:
+        expense = models.Expense
+        description = func.coalesce(expense.description, "")
+        total, count = func.sum(expense.amount_minor), func.count()
+        query = select(description, total, count).where(*_in_time_range(expense.timestamp, _month_bounds(start, end)))
+        if payer_id is not None:
+            query = query.where(expense.payer_id == payer_id)
+        query = query.group_by(description)
+    rows = db.execute(query.order_by(total.desc(), count.desc()).limit(limit))
+    return [{"description": text, "total": money.to_major(amount or 0), "count": number} for text, amount, number in rows]
+
+# Pamięć podręczna wyników raportów: klucz (użytkownik, raport, parametry) -> (seq, wynik)
+# seq to numer ostatniej zmiany wydatków (changelog.latest_seq) - każdy zapis wydatku w dowolnym
+# workerze zwiększa go, więc wpis zapisany przy starszym seq jest nieaktualny i liczony od nowa.
+class ReportCache:
+    def __init__(self, maxsize: int = REPORTS_CACHE_SIZE, ttl: float = REPORTS_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[int, float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple, seq: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry_seq, stored_at, value = entry
+        if entry_seq != seq or time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, seq: int, value):
+        self._entries[key] = (seq, time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+cache = ReportCache()
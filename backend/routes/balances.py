@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, database, auth, balances, money
+
+router = APIRouter()
+
+# Pobiera saldo zalogowanego użytkownika względem pozostałych (READ)
+@router.get("/balances/", response_model=schemas.BalanceSummary)
+async def read_balances(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    rows = await db.run_sync(balances.get_user_balances, current_user.id)
+    # Sumy na liczbach całkowitych (jednostki podrzędne), zamiana na jednostki główne na końcu
+    owed_to_me = sum(row.amount_minor for row in rows if row.amount_minor > 0)
+    i_owe = -sum(row.amount_minor for row in rows if row.amount_minor < 0)
+    return {
+        "user_id": current_user.id,
+        "currency": money.CURRENCY,
+        "owed_to_me": money.to_major(owed_to_me),
+        "i_owe": money.to_major(i_owe),
+        "net": money.to_major(owed_to_me - i_owe),
+        "balances": rows,
+    }
+
+# Wylicza minimalny zestaw przelewów rozliczających całą grupę (READ)
+# Moduł rozliczeń (NumPy) jest importowany przy pierwszym wywołaniu - nie wydłuża startu workera
+@router.get("/balances/settle-up", response_model=schemas.SettlementPlan)
+async def settle_up(method: str = "auto", db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    from .. import settlement
+    if method not in settlement.METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown method, use one of: {', '.join(settlement.METHODS)}")
+    try:
+        return await db.run_sync(settlement.settle_up, method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,197 +1,435 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import Any, Dict, List, Optional
 import json
 from datetime import datetime
-from .. import models, schemas, database, auth
-from ..protocols import mqtt_handler
+from .. import models, schemas, database, auth, balances, changelog, chat, ids, ledger, pagination, reports
+from .. import expenses, httpcache, publisher, realtime, serializers
+from ..realtime import manager
 
 router = APIRouter()
 
-# Nadzorca połączeń WebSocket i wysyłaniem wiadomości w czasie rzeczywistym
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# Opcje ładowania relacji zwracanych w schemas.Expense (sesja asynchroniczna nie ładuje ich leniwie)
+def expense_load_options():
+    return (
+        joinedload(models.Expense.payer),
+        selectinload(models.Expense.shares).joinedload(models.ExpenseShare.debtor),
+    )
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+async def _load_expense(db: AsyncSession, expense_id: int) -> Optional[models.Expense]:
+    result = await db.execute(
+        select(models.Expense)
+        .options(*expense_load_options())
+        .where(models.Expense.id == expense_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# id z ids.expense_ids (wydatki nie są wstawiane z autoinkrementacją)
+def _new_expense(expense_id: int, expense: schemas.ExpenseCreate, payer_id: int, timestamp: Optional[datetime] = None) -> models.Expense:
+    return models.Expense(
+        id=expense_id,
+        payer_id=payer_id,
+        amount_minor=expense.amount_minor,
+        currency=expense.currency,
+        description=expense.description,
+        timestamp=timestamp or datetime.now(),
+    )
+
+# Wstawia udziały wielu wydatków jednym poleceniem executemany
+# pairs: (id wydatku, lista udziałów ze schematu - kwoty już w jednostkach podrzędnych)
+async def _insert_shares(db: AsyncSession, pairs):
+    rows = [
+        {"expense_id": expense_id, "debtor_id": share_data.debtor_id, "amount_owed_minor": share_data.amount_owed_minor}
+        for expense_id, shares_data in pairs
+        for share_data in shares_data
+    ]
+    if rows:
+        await db.execute(insert(models.ExpenseShare), rows)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+# Porównuje stare i nowe udziały - zapisywane są tylko wiersze, które się zmieniły
+def _sync_shares(db_expense: models.Expense, shares_data: List[schemas.ExpenseShareCreate]):
+    existing: Dict[int, List[models.ExpenseShare]] = {}
+    for share in db_expense.shares:
+        existing.setdefault(share.debtor_id, []).append(share)
 
-manager = ConnectionManager()
+    kept = []
+    for share_data in shares_data:
+        matches = existing.get(share_data.debtor_id)
+        if matches:
+            share = matches.pop()
+            if share.amount_owed_minor != share_data.amount_owed_minor:
+                share.amount_owed_minor = share_data.amount_owed_minor
+        else:
+            share = models.ExpenseShare(debtor_id=share_data.debtor_id, amount_owed_minor=share_data.amount_owed_minor)
+        kept.append(share)
+    # Udziały, których nie ma w nowej liście, usuwa kaskada delete-orphan
+    db_expense.shares = kept
 
 # Tworzy nowy wydatek (CREATE)
 @router.post("/expenses/", response_model=schemas.Expense)
-async def create_expense(expense: schemas.ExpenseCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_expense = models.Expense(
-        payer_id=current_user.id,
-        amount=expense.amount,
-        description=expense.description,
-        timestamp=datetime.now()
-    )
+async def create_expense(expense: schemas.ExpenseCreate, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_expense = _new_expense(await ids.expense_ids.next_id(), expense, current_user.id)
     db.add(db_expense)
-    db.commit()
-    db.refresh(db_expense)
-
-    for share_data in expense.shares:
-        db_share = models.ExpenseShare(
-            expense_id=db_expense.id,
-            debtor_id=share_data.debtor_id,
-            amount_owed=share_data.amount_owed
-        )
-        db.add(db_share)
-    
-    db.commit()
-    db.refresh(db_expense)
-    
-    message = {"event": "new_expense", "expense_id": db_expense.id, "amount": db_expense.amount, "description": db_expense.description, "payer": current_user.username}
-    mqtt_handler.publish(message)
-    await manager.broadcast(json.dumps(message))
+
+    # Wydatek, udziały i salda w jednej transakcji (jeden commit)
+    await db.flush()
+    await _insert_shares(db, [(db_expense.id, expense.shares)])
+    await db.run_sync(balances.apply_deltas, balances.share_deltas(current_user.id, expense.shares))
+    await db.run_sync(reports.apply_rollups, reports.expense_rollups(current_user.id, expense.amount_minor, expense.description, db_expense.timestamp, expense.shares))
+    db_expense = await _load_expense(db, db_expense.id)
+    payload = changelog.expense_payload(db_expense)
+    change = changelog.record(db, changelog.CREATED, db_expense.id, payload)
+    await db.flush()
+    message = {"event": "new_expense", "expense_id": db_expense.id, "amount": db_expense.amount, "description": db_expense.description, "payer": current_user.username, "seq": change.seq, "expense": payload}
+    outbox = publisher.stage(db, message)
+    await httpcache.versions.stage(db, httpcache.EXPENSES)
+    await db.commit()
+    httpcache.versions.bump(httpcache.EXPENSES)
+
+    await realtime.publish(message, outbox=outbox)
 
     return db_expense
 
+# Maksymalna liczba wydatków w jednym imporcie
+MAX_BATCH_SIZE = 5000
+
+def _validate_import_item(item: Any, user_ids: set):
+    try:
+        expense = schemas.ExpenseImport.model_validate(item)
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors()]
+
+    errors = []
+    if expense.amount_minor < 0:
+        errors.append("amount: must not be negative")
+    for position, share in enumerate(expense.shares):
+        if share.debtor_id not in user_ids:
+            errors.append(f"shares.{position}.debtor_id: user {share.debtor_id} does not exist")
+        if share.amount_owed_minor < 0:
+            errors.append(f"shares.{position}.amount_owed: must not be negative")
+    return (None if errors else expense), errors
+
+# Zapisuje poprawne wydatki importu w jednej transakcji (płacącym jest importujący) i zwraca ich id
+# id są rezerwowane z góry (ids.expense_ids), więc wydatki są wstawiane jednym executemany bez RETURNING
+# (INSERT ... RETURNING z wieloma wierszami SQLAlchemy wykonuje w SQLite osobno dla każdego wiersza)
+async def _store_imported(db: AsyncSession, current_user: models.User, expenses: List[schemas.ExpenseImport]) -> List[int]:
+    expense_ids = list(await ids.expense_ids.next_ids(len(expenses)))
+    now = datetime.now()
+    rows = [
+        {"id": expense_id, "payer_id": current_user.id, "amount_minor": expense.amount_minor, "currency": expense.currency, "description": expense.description, "timestamp": expense.timestamp or now}
+        for expense_id, expense in zip(expense_ids, expenses)
+    ]
+    await db.execute(insert(models.Expense), rows)
+    await _insert_shares(db, [(expense_id, expense.shares) for expense_id, expense in zip(expense_ids, expenses)])
+    deltas = {}
+    rollups = reports.Rollups()
+    for row, expense in zip(rows, expenses):
+        balances.share_deltas(current_user.id, expense.shares, 1, deltas)
+        reports.expense_rollups(current_user.id, expense.amount_minor, expense.description, row["timestamp"], expense.shares, 1, rollups)
+    await db.run_sync(balances.apply_deltas, deltas)
+    await db.run_sync(reports.apply_rollups, rollups)
+    # Zaimportowane wydatki trafiają do dziennika zmian; klienci pobierają je przez /expenses/changes
+    loaded = await db.execute(
+        select(models.Expense)
+        .options(*expense_load_options())
+        .where(models.Expense.id.in_(expense_ids))
+        .order_by(models.Expense.id)
+    )
+    payloads = [changelog.expense_payload(db_expense) for db_expense in loaded.scalars().all()]
+    seq = await db.run_sync(changelog.record_many, changelog.CREATED, payloads)
+    message = {"event": "import_expenses", "count": len(expense_ids), "payer": current_user.username, "seq": seq}
+    outbox = publisher.stage(db, message)
+    await httpcache.versions.stage(db, httpcache.EXPENSES)
+    await db.commit()
+    httpcache.versions.bump(httpcache.EXPENSES)
+
+    await realtime.publish(message, outbox=outbox)
+    return expense_ids
+
+# Importuje wiele wydatków naraz (np. z wyciągu bankowego) w jednej transakcji (CREATE)
+# Niepoprawne pozycje są pomijane i opisane w wyniku, poprawne zapisywane
+@router.post("/expenses/batch", response_model=schemas.ExpenseBatchResult)
+async def create_expenses_batch(items: List[Any] = Body(..., embed=True), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} expenses per batch")
+
+    user_ids = set((await db.execute(select(models.User.id))).scalars().all())
+    results = []
+    created = []
+    for index, item in enumerate(items):
+        expense, errors = _validate_import_item(item, user_ids)
+        if expense is None:
+            results.append(schemas.ExpenseBatchItemResult(index=index, ok=False, errors=errors))
+            continue
+        created.append((index, expense))
+        results.append(None)
+
+    if created:
+        created_ids = await _store_imported(db, current_user, [expense for _, expense in created])
+        for (index, _), expense_id in zip(created, created_ids):
+            results[index] = schemas.ExpenseBatchItemResult(index=index, ok=True, expense_id=expense_id)
+
+    return {"created": len(created), "failed": len(items) - len(created), "results": results}
+
 # Pobiera listę wydatków (READ) i wyszukuje
-@router.get("/expenses/", response_model=List[schemas.Expense])
-def read_expenses(
-    skip: int = 0, 
-    limit: int = 100, 
+# Stronicowanie kursorem po (timestamp, id), od najnowszych
+# shape=compact - udziały bez zagnieżdżonych użytkowników, nazwy w mapie users {id: username}
+# Warunkowe GET (ETag) i gotowe odpowiedzi z pamięci podręcznej do zmiany wydatków (backend/httpcache.py)
+@router.get("/expenses/", response_model=schemas.ExpensePage)
+async def read_expenses(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     search: Optional[str] = None, 
-    db: Session = Depends(database.get_db), 
+    shape: str = Query(serializers.FULL, pattern=serializers.SHAPE_PATTERN),
+    db: AsyncSession = Depends(database.get_db), 
+    current_user: models.User = Depends(auth.get_current_user),
+    cached: httpcache.CachedRead = Depends(httpcache.reader(httpcache.EXPENSES)),
+):
+    if (hit := cached.hit()) is not None:
+        return hit
+    try:
+        query = expenses.page_query(limit, cursor, search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    seq, items, names, next_cursor = await expenses.read_page(db, query, limit, shape)
+    return cached.store(serializers.page_response(items, shape, names, next_cursor=next_cursor, seq=seq))
+
+# Zmiany wydatków po numerze since (synchronizacja przyrostowa zamiast ponownego pobierania listy)
+@router.get("/expenses/changes", response_model=schemas.ExpenseChangeFeed)
+async def read_expense_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(changelog.MAX_CHANGES_PAGE, ge=1, le=changelog.MAX_CHANGES_PAGE),
+    db: AsyncSession = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    query = db.query(models.Expense)
-    if search:
-        # Wyszukiwanie wzorcowe
-        query = query.filter(models.Expense.description.contains(search))
-    
-    expenses = query.offset(skip).limit(limit).all()
-    return expenses
+    return await db.run_sync(changelog.changes_since, since, limit)
+
+# Eksportuje wszystkie wydatki z udziałami jako CSV albo NDJSON (READ)
+# Odpowiedź jest wysyłana strumieniowo w miarę czytania bazy - bez wczytywania całej księgi do pamięci
+@router.get("/expenses/export")
+async def export_expenses(format: str = Query(ledger.CSV, pattern=f"^({ledger.CSV}|{ledger.NDJSON})$"), current_user: models.User = Depends(auth.get_current_user)):
+    return StreamingResponse(
+        ledger.export_chunks(database.AsyncSessionLocal, format),
+        media_type=ledger.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="expenses.{format}"'},
+    )
+
+# Importuje wydatki z CSV albo NDJSON przesyłanego strumieniowo (CREATE)
+# Format z parametru format albo z nagłówka Content-Type; poprawne rekordy są zapisywane
+# transakcjami po ledger.IMPORT_BATCH_SIZE w trakcie odbierania danych, błędne pomijane i opisane w wyniku
+@router.post("/expenses/import", response_model=schemas.ExpenseImportSummary)
+async def import_expenses(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    fmt = ledger.detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail=f"Send text/csv or application/x-ndjson, or use ?format={ledger.CSV}|{ledger.NDJSON}")
+
+    user_ids = set((await db.execute(select(models.User.id))).scalars().all())
+    summary = {"created": 0, "failed": 0, "batches": 0, "errors": []}
+    pending: List[schemas.ExpenseImport] = []
+
+    async def flush():
+        await _store_imported(db, current_user, pending)
+        summary["created"] += len(pending)
+        summary["batches"] += 1
+        pending.clear()
+        # Zapisane wydatki nie są już potrzebne w sesji
+        db.expunge_all()
+
+    try:
+        async for line, item, errors in ledger.records(request.stream(), fmt):
+            expense = None
+            if item is not None:
+                expense, errors = _validate_import_item(item, user_ids)
+            if expense is None:
+                summary["failed"] += 1
+                if len(summary["errors"]) < ledger.MAX_IMPORT_ERRORS:
+                    summary["errors"].append(schemas.ExpenseBatchItemResult(index=line, ok=False, errors=errors))
+                continue
+            pending.append(expense)
+            if len(pending) >= ledger.IMPORT_BATCH_SIZE:
+                await flush()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if pending:
+        await flush()
+    return summary
 
 # Aktualizuje wydatek (UPDATE)
 @router.put("/expenses/{expense_id}", response_model=schemas.Expense)
-async def update_expense(expense_id: int, expense_update: schemas.ExpenseCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_expense = db.query(models.Expense).filter(models.Expense.id == expense_id).first()
+async def update_expense(expense_id: int, expense_update: schemas.ExpenseCreate, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_expense = await db.get(models.Expense, expense_id, options=[selectinload(models.Expense.shares)])
     if not db_expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
     if db_expense.payer_id != current_user.id:
          raise HTTPException(status_code=403, detail="Not authorized to edit this expense")
 
-    db_expense.amount = expense_update.amount
+    old_deltas = balances.expense_deltas([db_expense], -1)
+    old_rollups = reports.expense_rollups(db_expense.payer_id, db_expense.amount_minor, db_expense.description, db_expense.timestamp, db_expense.shares, -1)
+
+    db_expense.amount_minor = expense_update.amount_minor
+    db_expense.currency = expense_update.currency
     db_expense.description = expense_update.description
-    
-    db.query(models.ExpenseShare).filter(models.ExpenseShare.expense_id == expense_id).delete()
-    
-    for share_data in expense_update.shares:
-        db_share = models.ExpenseShare(
-            expense_id=db_expense.id,
-            debtor_id=share_data.debtor_id,
-            amount_owed=share_data.amount_owed
-        )
-        db.add(db_share)
-
-    db.commit()
-    db.refresh(db_expense)
-    
-    message = {"event": "update_expense", "expense_id": db_expense.id}
-    mqtt_handler.publish(message)
-    await manager.broadcast(json.dumps(message))
+    _sync_shares(db_expense, expense_update.shares)
+
+    await db.flush()
+    await db.run_sync(balances.apply_deltas, old_deltas, balances.share_deltas(db_expense.payer_id, expense_update.shares))
+    new_rollups = reports.expense_rollups(db_expense.payer_id, expense_update.amount_minor, expense_update.description, db_expense.timestamp, expense_update.shares)
+    await db.run_sync(reports.apply_rollups, old_rollups, new_rollups)
+    db_expense = await _load_expense(db, db_expense.id)
+    payload = changelog.expense_payload(db_expense)
+    change = changelog.record(db, changelog.UPDATED, db_expense.id, payload)
+    await db.flush()
+    message = {"event": "update_expense", "expense_id": db_expense.id, "seq": change.seq, "expense": payload}
+    outbox = publisher.stage(db, message)
+    await httpcache.versions.stage(db, httpcache.EXPENSES)
+    await db.commit()
+    httpcache.versions.bump(httpcache.EXPENSES)
+
+    await realtime.publish(message, outbox=outbox)
 
     return db_expense
 
 # Usuwa wydatek (DELETE)
 @router.delete("/expenses/{expense_id}")
-async def delete_expense(expense_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_expense = db.query(models.Expense).filter(models.Expense.id == expense_id).first()
+async def delete_expense(expense_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_expense = await db.get(models.Expense, expense_id)
     if not db_expense:
         raise HTTPException(status_code=404, detail="Expense not found")
         
     if db_expense.payer_id != current_user.id:
          raise HTTPException(status_code=403, detail="Not authorized to delete this expense")
 
-    db.delete(db_expense)
-    db.commit()
+    message, outbox = await expenses.delete(db, db_expense)
+    await db.commit()
+    httpcache.versions.bump(httpcache.EXPENSES)
 
-    message = {"event": "delete_expense", "expense_id": expense_id}
-    mqtt_handler.publish(message)
-    await manager.broadcast(json.dumps(message))
+    await realtime.publish(message, outbox=outbox)
 
     return {"detail": "Expense deleted"}
 
-# Pobiera historię czatu (READ)
-@router.get("/chat/history", response_model=List[schemas.Message])
-def get_chat_history(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    messages = db.query(models.Message).order_by(models.Message.timestamp.asc()).limit(50).all()
-    return messages
+# Pobiera historię czatu (READ), od najstarszej do najnowszej wiadomości na stronie
+# Bez kursora - najnowsze wiadomości z bufora w pamięci; z kursorem - wcześniejsze wiadomości z bazy
+@router.get("/chat/history", response_model=schemas.MessagePage)
+async def get_chat_history(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    shape: str = Query(serializers.FULL, pattern=serializers.SHAPE_PATTERN),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+    cached: httpcache.CachedRead = Depends(httpcache.reader(httpcache.MESSAGES)),
+):
+    if (hit := cached.hit()) is not None:
+        return hit
+    if not cursor and (limit is None or limit <= chat.history.size):
+        messages, next_cursor = await chat.history.latest(db, limit)
+    else:
+        limit = limit or chat.history.size
+        try:
+            query = chat.page_query(limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result = await db.execute(query)
+        messages, next_cursor = pagination.page(result.all(), limit)
+        messages = list(reversed(messages))
+    items = [serializers.message_dict(message, shape) for message in messages]
+    return cached.store(serializers.page_response(items, shape, serializers.message_users(messages), next_cursor=next_cursor))
+
+# Wiadomość rozesłana chwilę temu może jeszcze czekać na zapis w tle (czekamy tylko na nią)
+async def _wait_for_message(message_id: int):
+    await chat.writer.wait_saved(message_id)
 
 # Usuwa wiadomość z czatu (DELETE)
 @router.delete("/messages/{message_id}")
-async def delete_message(message_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    message = db.query(models.Message).filter(models.Message.id == message_id).first()
+async def delete_message(message_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    await _wait_for_message(message_id)
+    message = await db.get(models.Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     if message.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this message")
     
-    db.delete(message)
-    db.commit()
-    
+    await db.delete(message)
     event = {"event": "delete_message", "message_id": message_id}
-    mqtt_handler.publish(event)
-    await manager.broadcast(json.dumps(event))
+    outbox = publisher.stage(db, event)
+    await httpcache.versions.stage(db, httpcache.MESSAGES)
+    await db.commit()
+    chat.history.remove(message_id)
+    httpcache.versions.bump(httpcache.MESSAGES)
+
+    await realtime.publish(event, outbox=outbox)
     
     return {"detail": "Message deleted"}
 
 # Edytuje wiadomość z czatu (UPDATE)
 @router.put("/messages/{message_id}", response_model=schemas.Message)
-async def update_message(message_id: int, message_update: schemas.MessageCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    message = db.query(models.Message).filter(models.Message.id == message_id).first()
+async def update_message(message_id: int, message_update: schemas.MessageCreate, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    await _wait_for_message(message_id)
+    message = await db.get(models.Message, message_id, options=[joinedload(models.Message.user)])
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     if message.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to edit this message")
     
     message.content = message_update.content
-    db.commit()
-    db.refresh(message)
-    
     event = {"event": "update_message", "message_id": message_id, "content": message.content, "user": current_user.username}
-    mqtt_handler.publish(event)
-    await manager.broadcast(json.dumps(event))
+    outbox = publisher.stage(db, event)
+    await httpcache.versions.stage(db, httpcache.MESSAGES)
+    await db.commit()
+    chat.history.update(message_id, message.content)
+    httpcache.versions.bump(httpcache.MESSAGES)
+
+    await realtime.publish(event, outbox=outbox)
     
     return message
 
+# Statystyki wysyłania w czasie rzeczywistym: kolejki WebSocket, publikacja MQTT i zaległy outbox
+@router.get("/realtime/stats")
+async def get_realtime_stats(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return {
+        "websocket": manager.stats(),
+        "mqtt": realtime.backplane.publisher.stats(),
+        "chat_writer": chat.writer.stats(),
+        "chat_history": chat.history.stats(),
+        "outbox_backlog": await publisher.outbox_backlog(db),
+    }
+
 # Obsługuje połączenie WebSocket dla czatu
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(database.get_db)):
+# Użytkownik jest ustalany raz, z tokenu przy połączeniu; wiadomości czatu są rozsyłane od razu,
+# a zapisywane partiami w tle (chat.writer)
+async def websocket_endpoint(websocket: WebSocket):
+    user = await auth.websocket_user(websocket)
+    if user is None:
+        # Zamknięcie po accept - przeglądarka dostaje kod 1008 (odrzucony handshake widzi tylko jako 1006)
+        # i frontend wraca do logowania
+        await websocket.accept()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+        return
     await manager.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            
+
             try:
                 payload = json.loads(data)
-                if payload.get('event') == 'chat':
-                    username = payload.get('user')
-                    content = payload.get('msg')
-                    
-                    user = db.query(models.User).filter(models.User.username == username).first()
-                    if user:
-                        msg_entry = models.Message(user_id=user.id, content=content)
-                        db.add(msg_entry)
-                        db.commit()
-                        db.refresh(msg_entry)
-                        mqtt_handler.publish_chat_message(username, content)
-                        payload['message_id'] = msg_entry.id
             except json.JSONDecodeError:
-                pass
-            
-            await manager.broadcast(json.dumps(payload) if isinstance(payload, dict) else data)
-    except WebSocketDisconnect:
+                payload = None
+
+            # Klient może tylko wysłać wiadomość czatu; zdarzenia zmian danych powstają wyłącznie w trasach
+            # (pozostałe ramki są pomijane - nie trafiają do innych klientów ani do backplane)
+            if isinstance(payload, dict) and payload.get('event') == 'chat':
+                content = payload.get('msg')
+                if isinstance(content, str) and content:
+                    event = await chat.writer.submit(user, content)
+                    httpcache.versions.bump(httpcache.MESSAGES)
+                    await manager.broadcast(event)
+    except (WebSocketDisconnect, chat.WriterClosed):
+        pass
+    finally:
         manager.disconnect(websocket)
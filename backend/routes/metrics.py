@@ -0,0 +1,32 @@
+import os
+import secrets
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from .. import chat, httpcache, metrics, profiler, receipts, reports
+from ..realtime import backplane, manager
+
+router = APIRouter()
+
+# Token wymagany do odczytu /metrics (nagłówek Authorization: Bearer ...); pusty - bez uwierzytelniania
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Liczniki komponentów (te same co w /realtime/stats); wymienione klucze to wartości chwilowe
+metrics.register_collector("websocket", manager.stats, ("connections", "queued"))
+metrics.register_collector("mqtt_publisher", lambda: backplane.publisher.stats(), ("queue_depth", "in_flight", "avg_latency_ms", "max_latency_ms"))
+metrics.register_collector("chat_writer", chat.writer.stats, ("queue_depth", "pending", "max_batch"))
+metrics.register_collector("chat_history", chat.history.stats, ("rooms", "messages", "size"))
+metrics.register_collector("reports_cache", reports.cache.stats, ("size",))
+metrics.register_collector("http_cache", httpcache.cache.stats, ("size", "bytes"))
+metrics.register_collector("receipt_thumbnails", receipts.thumbnail_pool.stats, ("enabled", "in_flight"))
+metrics.register_collector("profiler", profiler.slow_requests.stats, ("samples", "in_flight"))
+
+# Pomiary workera w formacie tekstowym Prometheusa
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics(request: Request):
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,103 @@
+import mimetypes
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, schemas, database, auth, httpcache, receipts
+
+router = APIRouter()
+
+# Pliki są niezmienne (nazwa to skrót treści) - przeglądarka może je trzymać bez ponownego pytania
+FILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+async def _get_expense(db: AsyncSession, expense_id: int) -> models.Expense:
+    expense = await db.get(models.Expense, expense_id)
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return expense
+
+async def _get_receipt(db: AsyncSession, receipt_id: int) -> models.Receipt:
+    receipt = await db.get(models.Receipt, receipt_id)
+    if not receipt:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+    return receipt
+
+# Plik z obsługą Range (FileResponse) i warunkowym GET po skrócie treści
+def _file_response(request: Request, path: str, etag: str, media_type: str, filename: Optional[str] = None):
+    headers = {"ETag": etag, "Cache-Control": FILE_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and httpcache.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Receipt file is missing")
+    return FileResponse(path, media_type=media_type, filename=filename, content_disposition_type="inline", headers=headers)
+
+# Dołącza paragon do wydatku (CREATE) - surowe ciało żądania (obraz JPEG/PNG/WebP albo PDF),
+# zapisywane strumieniowo; nazwa pliku opcjonalnie w parametrze filename
+@router.post("/expenses/{expense_id}/receipts", response_model=schemas.ReceiptUpload)
+async def upload_receipt(expense_id: int, request: Request, filename: Optional[str] = None, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    expense = await _get_expense(db, expense_id)
+    if expense.payer_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to attach receipts to this expense")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > receipts.RECEIPT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Receipt is larger than {receipts.RECEIPT_MAX_BYTES} bytes")
+    # Połączenie z bazą wraca do puli na czas przesyłania pliku
+    await db.commit()
+
+    try:
+        blob = await receipts.store(request.stream())
+    except receipts.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    receipt = models.Receipt(
+        expense_id=expense_id,
+        uploader_id=current_user.id,
+        sha256=blob.sha256,
+        content_type=blob.content_type,
+        size=blob.size,
+        filename=os.path.basename(filename)[:255] if filename else None,
+    )
+    db.add(receipt)
+    await db.commit()
+    receipts.thumbnail_pool.schedule(blob.sha256, blob.content_type)
+    return schemas.ReceiptUpload.model_validate(receipt).model_copy(update={"duplicate": not blob.created})
+
+# Pobiera listę paragonów wydatku (READ)
+@router.get("/expenses/{expense_id}/receipts", response_model=List[schemas.Receipt])
+async def read_receipts(expense_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    await _get_expense(db, expense_id)
+    result = await db.execute(select(models.Receipt).where(models.Receipt.expense_id == expense_id).order_by(models.Receipt.id))
+    return result.scalars().all()
+
+# Pobiera plik paragonu (READ) - także fragmenty (nagłówek Range)
+@router.get("/receipts/{receipt_id}")
+async def download_receipt(receipt_id: int, request: Request, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    receipt = await _get_receipt(db, receipt_id)
+    filename = receipt.filename or f"receipt-{receipt.id}{mimetypes.guess_extension(receipt.content_type) or ''}"
+    return _file_response(request, receipts.blob_path(receipt.sha256), f'"{receipt.sha256}"', receipt.content_type, filename)
+
+# Pobiera miniaturę paragonu (READ) - JPEG, liczona w puli procesów przy przesłaniu albo przy pierwszym odczycie
+@router.get("/receipts/{receipt_id}/thumbnail")
+async def download_receipt_thumbnail(receipt_id: int, request: Request, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    receipt = await _get_receipt(db, receipt_id)
+    path = await receipts.thumbnail_pool.ensure(receipt.sha256, receipt.content_type)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No thumbnail for this receipt")
+    return _file_response(request, path, f'"{receipt.sha256}-thumbnail"', "image/jpeg")
+
+# Usuwa paragon (DELETE) - przesyłający albo płacący; plik bez odwołań usuwa gc-receipts
+@router.delete("/receipts/{receipt_id}")
+async def delete_receipt(receipt_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    receipt = await _get_receipt(db, receipt_id)
+    if receipt.uploader_id != current_user.id:
+        expense = await db.get(models.Expense, receipt.expense_id)
+        if expense is None or expense.payer_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized to delete this receipt")
+    await db.delete(receipt)
+    await db.commit()
+    return {"detail": "Receipt deleted"}
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, schemas, database, auth, changelog, reports
+
+router = APIRouter()
+
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+DAY_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$"
+
+def _check_range(start: Optional[str], end: Optional[str]):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+# Wynik raportu z pamięci podręcznej, o ile od jego policzenia nie zmienił się żaden wydatek
+async def _cached(db: AsyncSession, user: models.User, key: tuple, fn, *args):
+    seq = await db.run_sync(changelog.latest_seq)
+    key = (user.id,) + key
+    result = reports.cache.get(key, seq)
+    if result is None:
+        result = await db.run_sync(fn, *args)
+        reports.cache.put(key, seq, result)
+    return result
+
+# Wydatki miesięczne każdego użytkownika (albo jednego - user_id) w zakresie miesięcy RRRR-MM (READ)
+@router.get("/reports/monthly", response_model=List[schemas.MonthlySpend])
+async def monthly_report(
+    start: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    end: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    _check_range(start, end)
+    return await _cached(db, current_user, ("monthly", start, end, user_id), reports.monthly_spend, start, end, user_id)
+
+# Wydatki dzienne zalogowanego użytkownika w zakresie dni RRRR-MM-DD (READ)
+@router.get("/reports/daily", response_model=List[schemas.DailySpend])
+async def daily_report(
+    start: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    end: Optional[str] = Query(None, pattern=DAY_PATTERN),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    _check_range(start, end)
+    return await _cached(db, current_user, ("daily", start, end), reports.daily_spend, current_user.id, start, end)
+
+# Rozliczenia zalogowanego użytkownika z każdym kontrahentem w zakresie miesięcy (READ)
+@router.get("/reports/counterparties", response_model=List[schemas.CounterpartyTotal])
+async def counterparties_report(
+    start: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    end: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    _check_range(start, end)
+    return await _cached(db, current_user, ("counterparties", start, end), reports.counterparties, current_user.id, start, end)
+
+# Opisy wydatków o największej łącznej kwocie; mine=true - tylko wydatki zalogowanego użytkownika (READ)
+@router.get("/reports/descriptions", response_model=List[schemas.DescriptionTotal])
+async def descriptions_report(
+    start: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    end: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    limit: int = Query(reports.TOP_DESCRIPTIONS, ge=1, le=reports.MAX_TOP_DESCRIPTIONS),
+    mine: bool = False,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    _check_range(start, end)
+    payer_id = current_user.id if mine else None
+    return await _cached(db, current_user, ("descriptions", start, end, limit, mine), reports.top_descriptions, start, end, limit, payer_id)
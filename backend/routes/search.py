@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List
+from .. import models, schemas, database, auth, search
+from .expenses import expense_load_options
+
+router = APIRouter()
+
+def _match_or_400(q: str) -> str:
+    if not search.enabled():
+        raise HTTPException(status_code=503, detail="Full-text search is not available")
+    query = search.match_query(q)
+    if query is None:
+        raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+    return query
+
+# Wyszukuje wydatki po opisie, wyniki według trafności (READ)
+@router.get("/search/expenses", response_model=List[schemas.Expense])
+async def search_expenses(q: str, limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return await db.run_sync(search.search_expenses, _match_or_400(q), limit, expense_load_options())
+
+# Wyszukuje wiadomości czatu, wyniki według trafności (READ)
+@router.get("/search/messages", response_model=List[schemas.Message])
+async def search_messages(q: str, limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return await db.run_sync(search.search_messages, _match_or_400(q), limit, (joinedload(models.Message.user),))
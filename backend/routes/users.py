@@ -1,40 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import timedelta
-from .. import models, schemas, database, auth
+from .. import models, schemas, database, auth, httpcache, publisher, realtime, serializers
 
 router = APIRouter()
 
 # Loguje użytkownika (zwraca token)
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
+    result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+    user = result.scalars().first()
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await auth.verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Skrót z nieaktualnym kosztem - zapisujemy przeliczony
+        user.hashed_password = new_hash
+        await db.commit()
+        auth.token_cache.invalidate_user(user.id)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
+    # Ciasteczko (uwierzytelnia /ws) żyje tak długo jak token, także po ponownym uruchomieniu przeglądarki
     response.set_cookie(
         key="access_token",
         value=f"Bearer {access_token}",
         httponly=True,
+        max_age=int(access_token_expires.total_seconds()),
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Wylogowuje użytkownika (usuwa ciasteczko)
 @router.post("/logout")
-async def logout(response: Response, current_user: models.User = Depends(auth.get_current_user)):
+async def logout(request: Request, response: Response, token: Optional[str] = Depends(auth.oauth2_scheme), current_user: models.User = Depends(auth.get_current_user)):
+    auth.token_cache.invalidate_token(auth.token_from_request(request, token))
     response.delete_cookie(key="access_token")
     return {"detail": "Logged out successfully"}
 
+# Statystyki pamięci podręcznej tokenów (trafienia/chybienia)
+@router.get("/auth/cache")
+def get_token_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    return auth.token_cache.stats()
+
 # Pobiera dane zalogowanego użytkownika (READ)
 @router.get("/users/me", response_model=schemas.User)
 def get_current_user_info(current_user: models.User = Depends(auth.get_current_user)):
@@ -42,58 +60,83 @@ def get_current_user_info(current_user: models.User = Depends(auth.get_current_u
 
 # Rejestruje nowego użytkownika (CREATE)
 @router.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    event = {"event": "new_user", "user_id": db_user.id, "username": db_user.username}
+    outbox = publisher.stage(db, event)
+    await httpcache.versions.stage(db, httpcache.USERS)
+    await db.commit()
+    httpcache.versions.bump(httpcache.USERS)
+    await db.refresh(db_user)
+
+    await realtime.publish(event, outbox=outbox)
     return db_user
 
 # Zmienia hasło użytkownika (UPDATE)
 @router.put("/users/me/password", status_code=status.HTTP_200_OK)
-def change_password(
+async def change_password(
     password_update: schemas.UserPasswordUpdate, 
-    db: Session = Depends(database.get_db), 
+    db: AsyncSession = Depends(database.get_db), 
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    if not auth.verify_password(password_update.old_password, current_user.hashed_password):
+    if not await auth.verify_password_async(password_update.old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail="Incorrect old password"
         )
     
-    current_user.hashed_password = auth.get_password_hash(password_update.new_password)
-    db.commit()
+    current_user.hashed_password = await auth.get_password_hash_async(password_update.new_password)
+    await db.commit()
+    auth.token_cache.invalidate_user(current_user.id)
     return {"detail": "Password updated successfully"}
 
 # Pobiera listę wszystkich użytkowników (READ)
+# Warunkowe GET (ETag) i gotowe odpowiedzi z pamięci podręcznej do zmiany listy (backend/httpcache.py)
 @router.get("/users/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+async def read_users(
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+    cached: httpcache.CachedRead = Depends(httpcache.reader(httpcache.USERS)),
+):
+    if (hit := cached.hit()) is not None:
+        return hit
+    result = await db.execute(select(models.User.username, models.User.id).order_by(models.User.id).offset(skip).limit(limit))
+    return cached.store(serializers.ORJSONResponse([{"username": username, "id": user_id} for username, user_id in result]))
 
 # Pobiera dane konkretnego użytkownika po ID (READ)
 @router.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def read_user(user_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_user = await db.get(models.User, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 # Usuwa konto użytkownika (DELETE)
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this user")
     
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    event = {"event": "delete_user", "user_id": user_id}
+    outbox = publisher.stage(db, event)
+    await httpcache.versions.stage(db, *httpcache.EVENT_RESOURCES["delete_user"])
+    await db.commit()
+    auth.token_cache.invalidate_user(user_id)
+    httpcache.versions.bump(*httpcache.EVENT_RESOURCES["delete_user"])
+
+    await realtime.publish(event, outbox=outbox)
     return None
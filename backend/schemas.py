@@ -1,6 +1,8 @@
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime
+from decimal import Decimal
+from . import money
 
 class UserBase(BaseModel):
     username: str
@@ -18,9 +20,20 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+# Udział w nowym albo zmienianym wydatku: kwota w jednostkach głównych (amount_owed) albo podrzędnych
+# (amount_owed_minor), przy split=weight - waga udziału
+class ExpenseShareCreate(BaseModel):
+    debtor_id: int
+    amount_owed: Optional[Decimal] = None
+    amount_owed_minor: Optional[int] = None
+    weight: Optional[Decimal] = None
+
+# Kwoty w jednostkach głównych (amount, amount_owed) i podrzędnych (*_minor)
+# Starsze wpisy dziennika zmian nie mają pól *_minor i currency
 class ExpenseShareBase(BaseModel):
     debtor_id: int
     amount_owed: float
+    amount_owed_minor: Optional[int] = None
 
 class ExpenseShare(ExpenseShareBase):
     id: int
@@ -30,10 +43,35 @@ class ExpenseShare(ExpenseShareBase):
     class Config:
         from_attributes = True
 
+# Wydatek do zapisania: kwota jako amount (jednostki główne, np. 12.34) albo amount_minor (1234)
+# split - podział kwoty na udziały po stronie serwera (money.SPLIT_METHODS); bez split udziały są zapisywane
+# z podanymi kwotami. Po walidacji amount_minor i amount_owed_minor każdego udziału są zawsze ustawione.
 class ExpenseBase(BaseModel):
-    amount: float
+    amount: Optional[Decimal] = None
+    amount_minor: Optional[int] = None
+    currency: Optional[str] = None
     description: str
-    shares: List[ExpenseShareBase] = []
+    split: Optional[str] = None
+    shares: List[ExpenseShareCreate] = []
+
+    @model_validator(mode="after")
+    def _minor_units(self):
+        self.currency = (self.currency or money.CURRENCY).upper()
+        if self.currency != money.CURRENCY:
+            raise ValueError(f"currency: only {money.CURRENCY} is supported")
+        if self.amount_minor is None:
+            if self.amount is None:
+                raise ValueError("amount or amount_minor is required")
+            self.amount_minor = money.to_minor(self.amount, self.currency)
+        for share in self.shares:
+            if share.amount_owed_minor is None and share.amount_owed is not None:
+                share.amount_owed_minor = money.to_minor(share.amount_owed, self.currency)
+        if self.split is not None:
+            for share, amount in zip(self.shares, money.split(self.split, self.amount_minor, self.shares)):
+                share.amount_owed_minor = amount
+        elif any(share.amount_owed_minor is None for share in self.shares):
+            raise ValueError("shares: amount_owed is required unless split is given")
+        return self
 
 class ExpenseCreate(ExpenseBase):
     pass
@@ -42,6 +80,8 @@ class Expense(BaseModel):
     id: int
     payer_id: int
     amount: float
+    amount_minor: Optional[int] = None
+    currency: Optional[str] = None
     description: str
     timestamp: Optional[datetime] = None
     payer: Optional[User] = None
@@ -68,3 +108,119 @@ class Message(MessageBase):
 
     class Config:
         from_attributes = True
+
+class MessagePage(BaseModel):
+    items: List[Message] = []
+    next_cursor: Optional[str] = None
+
+class BalanceEntry(BaseModel):
+    counterparty_id: int
+    amount: float
+    amount_minor: int
+    counterparty: Optional[User] = None
+
+    class Config:
+        from_attributes = True
+
+class BalanceSummary(BaseModel):
+    user_id: int
+    currency: str
+    owed_to_me: float
+    i_owe: float
+    net: float
+    balances: List[BalanceEntry] = []
+
+class Transfer(BaseModel):
+    from_user_id: int
+    to_user_id: int
+    amount: float
+    amount_minor: int
+
+class SettlementPlan(BaseModel):
+    method: str
+    currency: str
+    transfers: List[Transfer] = []
+
+class ExpensePage(BaseModel):
+    items: List[Expense] = []
+    next_cursor: Optional[str] = None
+    seq: Optional[int] = None
+
+class ExpenseImport(ExpenseCreate):
+    timestamp: Optional[datetime] = None
+
+class ExpenseBatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    expense_id: Optional[int] = None
+    errors: List[str] = []
+
+class ExpenseBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[ExpenseBatchItemResult] = []
+
+class ExpenseImportSummary(BaseModel):
+    created: int
+    failed: int
+    batches: int
+    errors: List[ExpenseBatchItemResult] = []
+
+class ExpenseChange(BaseModel):
+    seq: int
+    op: str
+    expense_id: int
+    expense: Optional[Expense] = None
+    timestamp: Optional[datetime] = None
+
+class ExpenseChangeFeed(BaseModel):
+    changes: List[ExpenseChange] = []
+    latest_seq: int
+    has_more: bool = False
+    reset: bool = False
+
+class Receipt(BaseModel):
+    id: int
+    expense_id: int
+    uploader_id: Optional[int] = None
+    sha256: str
+    content_type: str
+    size: int
+    filename: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ReceiptUpload(Receipt):
+    # Ten sam plik był już zapisany - nowy wiersz wskazuje istniejący plik
+    duplicate: bool = False
+
+class MonthlySpend(BaseModel):
+    month: str
+    user_id: int
+    username: Optional[str] = None
+    paid: float
+    paid_count: int
+    share: float
+    share_count: int
+
+class DailySpend(BaseModel):
+    day: str
+    paid: float
+    paid_count: int
+    share: float
+    share_count: int
+
+class CounterpartyTotal(BaseModel):
+    counterparty_id: int
+    username: Optional[str] = None
+    lent: float
+    borrowed: float
+    net: float
+    count: int
+
+class DescriptionTotal(BaseModel):
+    description: str
+    total: float
+    count: int
@@ -0,0 +1,111 @@
+import re
+from typing import List, Optional
+from sqlalchemy import column, text
+from sqlalchemy.orm import Session
+from . import models
+
+# Indeks pełnotekstowy SQLite FTS5 dla opisów wydatków i wiadomości czatu.
+# Tabele FTS są typu "external content" - przechowują tylko indeks, a treść
+# czytają z tabel expenses/messages. Synchronizację zapewniają triggery.
+
+FTS_TABLES = {
+    "expenses_fts": ("expenses", "description"),
+    "messages_fts": ("messages", "content"),
+}
+
+_enabled = False
+
+def enabled() -> bool:
+    return _enabled
+
+def _ddl(fts_table: str, source_table: str, column: str) -> List[str]:
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{column}, content='{source_table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {source_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+# Tworzy tabele FTS i triggery (tylko SQLite z FTS5); nowo utworzony indeks jest od razu wypełniany
+def install(engine) -> bool:
+    global _enabled
+    if engine.dialect.name != "sqlite":
+        _enabled = False
+        return False
+    try:
+        with engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            for fts_table, (source_table, column) in FTS_TABLES.items():
+                for statement in _ddl(fts_table, source_table, column):
+                    conn.execute(text(statement))
+                if fts_table not in existing:
+                    conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+    except Exception:
+        # Brak modułu FTS5 w tej kompilacji SQLite - zostaje wyszukiwanie LIKE
+        _enabled = False
+        return False
+    _enabled = True
+    return True
+
+# Włącza wyszukiwanie FTS, jeśli indeks jest w bazie (przy starcie aplikacji; tworzy go install w migrate)
+def detect(engine) -> bool:
+    global _enabled
+    if engine.dialect.name != "sqlite":
+        _enabled = False
+        return False
+    with engine.connect() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    _enabled = all(fts_table in existing for fts_table in FTS_TABLES)
+    return _enabled
+
+# Przebudowuje cały indeks z tabel źródłowych
+def reindex(db: Session):
+    for fts_table in FTS_TABLES:
+        db.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        db.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')"))
+    db.commit()
+
+# Zamienia tekst użytkownika na zapytanie FTS5: każde słowo jako prefiks, wszystkie wymagane
+def match_query(search: str) -> Optional[str]:
+    terms = re.findall(r"\w+", search)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+# Podzapytanie z id wydatków pasujących do frazy (do łączenia z innymi filtrami)
+def expense_ids_matching(query: str):
+    return (
+        text("SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH :query")
+        .bindparams(query=query)
+        .columns(column("rowid"))
+    )
+
+def _ranked_ids(db: Session, fts_table: str, query: str, limit: int) -> List[int]:
+    rows = db.execute(
+        text(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH :query ORDER BY rank LIMIT :limit"),
+        {"query": query, "limit": limit},
+    )
+    return [row[0] for row in rows]
+
+def _in_rank_order(ids: List[int], objects) -> list:
+    by_id = {obj.id: obj for obj in objects}
+    return [by_id[i] for i in ids if i in by_id]
+
+# Wydatki posortowane według trafności (bm25)
+def search_expenses(db: Session, query: str, limit: int, options=()) -> List[models.Expense]:
+    ids = _ranked_ids(db, "expenses_fts", query, limit)
+    if not ids:
+        return []
+    return _in_rank_order(ids, db.query(models.Expense).options(*options).filter(models.Expense.id.in_(ids)).all())
+
+# Wiadomości posortowane według trafności (bm25)
+def search_messages(db: Session, query: str, limit: int, options=()) -> List[models.Message]:
+    ids = _ranked_ids(db, "messages_fts", query, limit)
+    if not ids:
+        return []
+    return _in_rank_order(ids, db.query(models.Message).options(*options).filter(models.Message.id.in_(ids)).all())
@@ -0,0 +1,148 @@
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
+from datetime import datetime
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, money, schemas
+
+# Szybka ścieżka odpowiedzi dla list (wydatki, użytkownicy, historia czatu): zapytania tylko o kolumny,
+# wiersze mapowane wprost na słowniki i kodowane przez orjson - bez obiektów ORM i walidacji Pydantic.
+# Kształt "full" jest taki sam jak schemas.Expense / schemas.Message; "compact" odwołuje się
+# do użytkowników tylko po id, a ich nazwy są raz na odpowiedź w mapie users {id: username}.
+
+FULL = "full"
+COMPACT = "compact"
+SHAPE_PATTERN = f"^({FULL}|{COMPACT})$"
+
+class UserDict(TypedDict):
+    username: str
+    id: int
+
+class ShareDict(TypedDict, total=False):
+    debtor_id: int
+    amount_owed: float
+    amount_owed_minor: Optional[int]
+    id: int
+    expense_id: int
+    debtor: Optional[UserDict]
+
+class ExpenseDict(TypedDict, total=False):
+    id: int
+    payer_id: int
+    amount: float
+    amount_minor: Optional[int]
+    currency: Optional[str]
+    description: str
+    timestamp: Optional[datetime]
+    payer: Optional[UserDict]
+    shares: List[ShareDict]
+
+class MessageDict(TypedDict, total=False):
+    content: str
+    id: int
+    user_id: int
+    timestamp: datetime
+    user: Optional[UserDict]
+
+# Odpowiedź JSON kodowana przez orjson (daty jako ISO 8601, klucze int zamieniane na napisy)
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Kolumny wydatku w kolejności odczytu (wiersz ma atrybuty timestamp i id - działa z pagination.page)
+def expense_columns():
+    expense = models.Expense
+    return select(expense.id, expense.payer_id, expense.amount_minor, expense.currency, expense.description, expense.timestamp)
+
+def message_columns():
+    message = models.Message
+    return (
+        select(message.id, message.user_id, message.content, message.timestamp, models.User.username)
+        .outerjoin(models.User, models.User.id == message.user_id)
+    )
+
+async def usernames(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, str]:
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    result = await db.execute(select(models.User.id, models.User.username).where(models.User.id.in_(user_ids)))
+    return dict(result.all())
+
+def _user(names: Dict[int, str], user_id: Optional[int]) -> Optional[UserDict]:
+    username = names.get(user_id)
+    return {"username": username, "id": user_id} if username is not None else None
+
+# Wydatki z wierszy expense_columns() razem z udziałami (jedno zapytanie na stronę) i mapą użytkowników
+async def expense_dicts(db: AsyncSession, rows, shape: str = FULL) -> Tuple[List[ExpenseDict], Dict[int, str]]:
+    share = models.ExpenseShare
+    shares: Dict[int, List[tuple]] = {row.id: [] for row in rows}
+    if shares:
+        result = await db.execute(
+            select(share.id, share.expense_id, share.debtor_id, share.amount_owed_minor)
+            .where(share.expense_id.in_(list(shares)))
+            .order_by(share.expense_id, share.id)
+        )
+        for share_row in result:
+            shares[share_row.expense_id].append(share_row)
+    names = await usernames(db, [row.payer_id for row in rows] + [s.debtor_id for parts in shares.values() for s in parts])
+
+    items: List[ExpenseDict] = []
+    for row in rows:
+        currency = row.currency or money.CURRENCY
+        item: ExpenseDict = {
+            "id": row.id,
+            "payer_id": row.payer_id,
+            "amount": money.to_major(row.amount_minor, currency),
+            "amount_minor": row.amount_minor,
+            "currency": row.currency,
+            "description": row.description,
+            "timestamp": row.timestamp,
+        }
+        if shape == COMPACT:
+            item["shares"] = [
+                {"id": s.id, "debtor_id": s.debtor_id, "amount_owed": money.to_major(s.amount_owed_minor, currency), "amount_owed_minor": s.amount_owed_minor}
+                for s in shares[row.id]
+            ]
+        else:
+            item["payer"] = _user(names, row.payer_id)
+            item["shares"] = [
+                {"debtor_id": s.debtor_id, "amount_owed": money.to_major(s.amount_owed_minor, currency), "amount_owed_minor": s.amount_owed_minor, "id": s.id, "expense_id": s.expense_id, "debtor": _user(names, s.debtor_id)}
+                for s in shares[row.id]
+            ]
+        items.append(item)
+    return items, names
+
+# Wiadomość z wiersza message_columns() albo z schemas.Message (bufor historii czatu)
+def message_dict(message, shape: str = FULL) -> MessageDict:
+    item: MessageDict = {
+        "content": message.content,
+        "id": message.id,
+        "user_id": message.user_id,
+        "timestamp": message.timestamp,
+    }
+    if shape != COMPACT:
+        if isinstance(message, schemas.Message):
+            item["user"] = {"username": message.user.username, "id": message.user.id} if message.user else None
+        else:
+            item["user"] = {"username": message.username, "id": message.user_id} if message.username is not None else None
+    return item
+
+def message_users(messages) -> Dict[int, str]:
+    names = {}
+    for message in messages:
+        if isinstance(message, schemas.Message):
+            if message.user:
+                names[message.user.id] = message.user.username
+        elif message.username is not None:
+            names[message.user_id] = message.username
+    return names
+
+# Strona listy w wybranym kształcie: compact dokłada mapę users
+def page_response(items: list, shape: str, names: Dict[int, str], **extra) -> ORJSONResponse:
+    content = {"items": items, **extra}
+    if shape == COMPACT:
+        content["users"] = names
+    return ORJSONResponse(content)
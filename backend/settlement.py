@@ -0,0 +1,96 @@
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from . import balances, changelog, money
+
+# Powyżej tej liczby osób z niezerowym saldem dokładny solver jest zbyt kosztowny (2^n)
+EXACT_MAX_PARTICIPANTS = 14
+
+METHODS = ("auto", "greedy", "exact")
+
+# Wynik planu rozliczeń na metodę: method -> ((seq, wersja sald), plan)
+# seq to numer ostatniej zmiany wydatków w bazie (changelog.latest_seq), a wersja sald rośnie przy
+# przeliczeniu sald bez zmiany wydatków (manage rebuild-balances) - oba są w bazie, więc zmiana
+# w dowolnym workerze lub poleceniu administracyjnym unieważnia plany wszystkich workerów
+_cache: Dict[str, Tuple[Tuple[int, int], dict]] = {}
+
+# Zachłanne dopasowanie: największy wierzyciel z największym dłużnikiem
+# Daje co najwyżej n-1 przelewów
+def greedy_transfers(cents: np.ndarray) -> List[Tuple[int, int, int]]:
+    bal = cents.copy()
+    transfers = []
+    while bal.size:
+        creditor = int(np.argmax(bal))
+        debtor = int(np.argmin(bal))
+        if bal[creditor] <= 0 or bal[debtor] >= 0:
+            break
+        amount = int(min(bal[creditor], -bal[debtor]))
+        transfers.append((debtor, creditor, amount))
+        bal[creditor] -= amount
+        bal[debtor] += amount
+    return transfers
+
+# Dokładny minimalny zbiór przelewów: liczba przelewów = n - maks. liczba
+# rozłącznych podzbiorów o zerowej sumie (programowanie dynamiczne po maskach bitowych)
+def exact_transfers(cents: np.ndarray) -> List[Tuple[int, int, int]]:
+    participants = np.flatnonzero(cents)
+    n = participants.size
+    if n > EXACT_MAX_PARTICIPANTS:
+        raise ValueError(f"Exact solver supports at most {EXACT_MAX_PARTICIPANTS} participants, got {n}")
+    if n == 0:
+        return []
+
+    values = cents[participants]
+    masks = np.arange(1 << n, dtype=np.int64)
+    bits = (masks[:, None] >> np.arange(n)) & 1
+    zero_sum = (bits @ values) == 0
+
+    groups_count = np.zeros(1 << n, dtype=np.int64)
+    removed = np.zeros(1 << n, dtype=np.int64)
+    for mask in range(1, 1 << n):
+        members = np.flatnonzero(bits[mask])
+        previous = groups_count[mask ^ (1 << members)]
+        best = int(np.argmax(previous))
+        removed[mask] = members[best]
+        groups_count[mask] = previous[best] + int(zero_sum[mask])
+
+    transfers = []
+    mask = (1 << n) - 1
+    group: List[int] = []
+    while mask:
+        index = int(removed[mask])
+        group.append(index)
+        mask ^= 1 << index
+        if zero_sum[mask]:
+            sub = greedy_transfers(values[group])
+            transfers.extend((int(participants[group[d]]), int(participants[group[c]]), amount) for d, c, amount in sub)
+            group = []
+    return transfers
+
+def choose_method(cents: np.ndarray) -> str:
+    return "exact" if np.count_nonzero(cents) <= EXACT_MAX_PARTICIPANTS else "greedy"
+
+# Plan rozliczenia całej grupy, zapamiętywany do następnej zmiany wydatków lub przeliczenia sald
+def settle_up(db: Session, method: str = "auto") -> dict:
+    key = (changelog.latest_seq(db), balances.version(db))
+    cached = _cache.get(method)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    # Salda są w jednostkach podrzędnych (int) - suma jest dokładnie zerowa, bez wyrównywania zaokrągleń
+    rows = balances.get_net_balances(db)
+    user_ids = np.fromiter((user_id for user_id, _ in rows), dtype=np.int64, count=len(rows))
+    cents = np.fromiter((amount or 0 for _, amount in rows), dtype=np.int64, count=len(rows))
+
+    chosen = choose_method(cents) if method == "auto" else method
+    solver = exact_transfers if chosen == "exact" else greedy_transfers
+    plan = {
+        "method": chosen,
+        "currency": money.CURRENCY,
+        "transfers": [
+            {"from_user_id": int(user_ids[d]), "to_user_id": int(user_ids[c]), "amount": money.to_major(amount), "amount_minor": amount}
+            for d, c, amount in solver(cents)
+        ],
+    }
+    _cache[method] = (key, plan)
+    return plan
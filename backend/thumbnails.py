@@ -0,0 +1,27 @@
+import importlib.util
+import os
+
+# Miniatury paragonów liczone w osobnych procesach (backend/receipts.py, ThumbnailPool).
+# Moduł jest importowany w procesach puli, więc nie importuje reszty aplikacji; Pillow jest
+# importowany dopiero w procesie puli (nie wydłuża startu workera). Pillow jest zależnością
+# opcjonalną (backend/requirements-optional.txt) - bez niego miniatury są wyłączone; PDF nie ma miniatury.
+
+def available() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+# Zapisuje miniaturę JPEG source w target (najpierw do pliku tymczasowego, potem rename)
+def make_thumbnail(source: str, target: str, size: int, quality: int) -> bool:
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # draft() dekoduje JPEG od razu w mniejszej skali; orientacja zdjęć z telefonu - z EXIF
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f"{target}.{os.getpid()}.tmp"
+        image.save(partial, "JPEG", quality=quality, optimize=True)
+    os.replace(partial, target)
+    return True
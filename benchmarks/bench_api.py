@@ -0,0 +1,452 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Zestaw benchmarków całego API: syntetyczna baza expenses.db w zadanej skali, prawdziwa aplikacja
+# FastAPI uruchomiona w tym procesie (httpx.ASGITransport, WebSocket przez ASGI bez sieci)
+# i scenariusze: logowanie, CRUD wydatków, wyszukiwanie, historia czatu, rozgłaszanie /ws
+# oraz MQTT przez lokalny zamiennik brokera (benchmarks/mqtt_standin.py).
+# Dla każdego scenariusza: liczba operacji, błędy, przepustowość i p50/p95/p99.
+# Wynik w JSON (--output) można porównać z poprzednim (--baseline); regresje kończą proces kodem 1.
+# Uruchomienie: python -m benchmarks.bench_api [--users 50 --expenses 20000 --output run.json]
+#               python -m benchmarks.bench_api --baseline run.json --tolerance 0.15
+#
+# Moduły backend są importowane dopiero po ustawieniu zmiennych środowiskowych (DATABASE_URL,
+# REALTIME_BACKPLANE) - silnik bazy i backplane powstają przy imporcie.
+
+PASSWORD = "bench"
+WORDS = ["pizza", "groceries", "taxi", "rent", "coffee", "cinema", "train", "hotel", "dinner", "fuel", "pharmacy", "concert"]
+SEED_CHUNK = 5000
+SCENARIOS = [
+    "POST /token",
+    "POST /expenses/",
+    "GET /expenses/",
+    "GET /expenses/?cursor=",
+    "PUT /expenses/{id}",
+    "DELETE /expenses/{id}",
+    "GET /search/expenses",
+    "GET /chat/history",
+    "GET /chat/history?cursor=",
+    "/ws fan-out",
+    "MQTT relay -> /ws",
+]
+
+def _configure_environment(database_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    # Zdarzenia innych workerów przez MQTTBackplane (tu: zamiennik brokera w pamięci)
+    os.environ.setdefault("REALTIME_BACKPLANE", "mqtt")
+    os.environ.setdefault("ACCESS_LOG", "0")
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+# Dane: użytkownicy z jednym hasłem, wydatki z udziałami (podział po równo), wiadomości czatu
+def seed(args):
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import Session
+    from backend import auth, balances, migrations, models, money, reports, search
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    migrations.upgrade(engine)
+    rng = np.random.default_rng(args.seed)
+    start = datetime(2024, 1, 1)
+    span = args.days * 86400
+    hashed = auth.get_password_hash(PASSWORD)
+    shares = min(args.shares, args.users - 1)
+    with Session(engine) as db:
+        db.execute(insert(models.User), [
+            {"id": i + 1, "username": f"bench-user-{i}", "hashed_password": hashed} for i in range(args.users)
+        ])
+        expense_id = 0
+        for offset in range(0, args.expenses, SEED_CHUNK):
+            count = min(SEED_CHUNK, args.expenses - offset)
+            payers = rng.integers(1, args.users + 1, size=count)
+            amounts = rng.integers(100, 50000, size=count)
+            words = rng.integers(0, len(WORDS), size=count)
+            seconds = np.sort(rng.integers(offset * span // args.expenses, (offset + count) * span // args.expenses, size=count))
+            shifts = rng.integers(1, args.users, size=count)
+            expense_rows, share_rows = [], []
+            for i in range(count):
+                expense_id += 1
+                payer = int(payers[i])
+                expense_rows.append({
+                    "id": expense_id,
+                    "payer_id": payer,
+                    "amount_minor": int(amounts[i]),
+                    "currency": money.CURRENCY,
+                    "description": f"{WORDS[words[i]]} {expense_id % 97}",
+                    "timestamp": start + timedelta(seconds=int(seconds[i])),
+                })
+                debtors = [payer] + [(payer - 1 + int(shifts[i]) + j) % args.users + 1 for j in range(shares)]
+                debtors = list(dict.fromkeys(debtors))
+                for debtor, part in zip(debtors, money.allocate(int(amounts[i]), [1] * len(debtors), debtors)):
+                    share_rows.append({"expense_id": expense_id, "debtor_id": debtor, "amount_owed_minor": part})
+            db.execute(insert(models.Expense), expense_rows)
+            db.execute(insert(models.ExpenseShare), share_rows)
+            db.commit()
+        users = rng.integers(1, args.users + 1, size=args.messages)
+        message_seconds = np.sort(rng.integers(0, span, size=args.messages))
+        db.execute(insert(models.Message), [
+            {"id": i + 1, "user_id": int(users[i]), "content": f"{WORDS[i % len(WORDS)]} message {i}", "timestamp": start + timedelta(seconds=int(message_seconds[i]))}
+            for i in range(args.messages)
+        ])
+        db.commit()
+        balances.rebuild_balances(db)
+        reports.rebuild(db)
+    if search.install(engine):
+        with Session(engine) as db:
+            search.reindex(db)
+    engine.dispose()
+
+# Połączenie WebSocket z aplikacją ASGI w tym samym procesie (bez gniazd i serwera)
+class ASGIWebSocket:
+    def __init__(self, app, path: str, token: str = ""):
+        self.app = app
+        self.path = path
+        self.token = token
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {self.token}".encode())], "client": ("127.0.0.1", 0), "server": ("bench", 80), "subprotocols": [],
+        }
+        self._task = asyncio.create_task(self.app(scope, self._incoming.get, self._send))
+        await self._incoming.put({"type": "websocket.connect"})
+        if await self._outgoing.get() != "accepted":
+            raise ConnectionError(f"WebSocket {self.path} rejected")
+        return self
+
+    async def _send(self, message: dict):
+        if message["type"] == "websocket.accept":
+            await self._outgoing.put("accepted")
+        elif message["type"] == "websocket.send":
+            await self._outgoing.put(message.get("text") or message.get("bytes"))
+        elif message["type"] == "websocket.close":
+            await self._outgoing.put(None)
+
+    async def send_text(self, text: str):
+        await self._incoming.put({"type": "websocket.receive", "text": text})
+
+    async def recv(self) -> str:
+        message = await self._outgoing.get()
+        if message is None:
+            raise ConnectionError("WebSocket closed")
+        return message
+
+    async def close(self):
+        await self._incoming.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+def result(samples, elapsed: float, errors: int = 0, **extra) -> dict:
+    report = {"count": len(samples), "errors": errors, "seconds": round(elapsed, 3), "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0}
+    if samples:
+        ms = np.array(samples) * 1000
+        report.update({
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        })
+    report.update(extra)
+    return report
+
+# Wykonuje count operacji przez concurrency równoległych klientów; operation(index) zwraca True przy sukcesie
+async def run_scenario(operation, count: int, concurrency: int) -> dict:
+    samples, errors = [], 0
+    indexes = itertools.count()
+
+    async def client():
+        nonlocal errors
+        for index in iter(lambda: next(indexes), None):
+            if index >= count:
+                return
+            started = time.perf_counter()
+            try:
+                ok = await operation(index)
+            except Exception:
+                ok = False
+            if ok:
+                samples.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return result(samples, time.perf_counter() - started, errors)
+
+async def wait_for(ws: ASGIWebSocket, marker: str):
+    quoted = f'"{marker}"'
+    while quoted not in await ws.recv():
+        pass
+
+async def ws_fanout(app, token: str, clients: int, messages: int) -> dict:
+    sockets = [await ASGIWebSocket(app, "/ws", token).connect() for _ in range(clients)]
+    sender = sockets[0]
+    samples = []
+    started = time.perf_counter()
+    for index in range(messages):
+        marker = f"fanout-{index}"
+        sent = time.perf_counter()
+        await sender.send_text(json.dumps({"event": "chat", "msg": marker}))
+        await asyncio.wait_for(asyncio.gather(*(wait_for(ws, marker) for ws in sockets)), 30)
+        samples.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - started
+    for ws in sockets:
+        await ws.close()
+    return result(samples, elapsed, clients=clients, deliveries_per_s=round(clients * messages / elapsed, 1))
+
+# Zdarzenie z innego workera (peer) przez zamiennik brokera -> MQTTBackplane -> klienci /ws
+async def mqtt_relay(app, peer, token: str, clients: int, messages: int) -> dict:
+    from backend.protocols import MQTT_TOPIC_CHAT
+
+    sockets = [await ASGIWebSocket(app, "/ws", token).connect() for _ in range(clients)]
+    samples = []
+    started = time.perf_counter()
+    for index in range(messages):
+        marker = f"relay-{index}"
+        sent = time.perf_counter()
+        peer.publish({"event": "chat", "user": "peer", "msg": marker}, MQTT_TOPIC_CHAT)
+        await asyncio.wait_for(asyncio.gather(*(wait_for(ws, marker) for ws in sockets)), 30)
+        samples.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - started
+    for ws in sockets:
+        await ws.close()
+    return result(samples, elapsed, clients=clients)
+
+async def drive(args) -> dict:
+    import httpx
+    from backend import publisher, realtime
+    from backend.main import app
+    from .mqtt_standin import InMemoryBroker, StandInMQTTHandler
+
+    # MQTT bez brokera: handler aplikacji i drugi "worker" (peer) na wspólnym brokerze w pamięci
+    # (podmieniony przed lifespan, więc prawdziwy klient MQTT nigdy się nie łączy)
+    broker = InMemoryBroker()
+    handler = StandInMQTTHandler(broker, origin="bench-app")
+    peer = StandInMQTTHandler(broker, origin="bench-peer")
+    received = []
+    peer.add_listener(lambda topic, message: received.append(message))
+    realtime.backplane.handler = handler
+    realtime.backplane.publisher = publisher.MQTTPublisher(handler)
+
+    rng = random.Random(args.seed)
+    report = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            usernames = [f"bench-user-{i}" for i in range(args.users)]
+            tokens = {}
+
+            async def login(index):
+                username = usernames[index % len(usernames)]
+                response = await client.post("/token", data={"username": username, "password": PASSWORD})
+                if response.status_code != 200:
+                    return False
+                tokens[username] = response.json()["access_token"]
+                return True
+
+            report["POST /token"] = await run_scenario(login, args.logins, min(args.concurrency, args.logins))
+            if not tokens:
+                raise RuntimeError("No user could log in - is the database seeded?")
+            sessions = [(int(name.rsplit("-", 1)[1]) + 1, {"Authorization": f"Bearer {token}"}) for name, token in sorted(tokens.items())]
+            created = []
+
+            def session(index):
+                return sessions[index % len(sessions)]
+
+            async def create(index):
+                user_id, headers = session(index)
+                others = rng.sample(range(1, args.users + 1), min(2, args.users))
+                participants = list(dict.fromkeys([user_id] + others))
+                response = await client.post("/expenses/", headers=headers, json={
+                    "amount": f"{rng.randint(100, 50000) / 100:.2f}", "description": f"{rng.choice(WORDS)} bench {index}",
+                    "split": "equal", "shares": [{"debtor_id": debtor_id} for debtor_id in participants],
+                })
+                if response.status_code != 200:
+                    return False
+                created.append((response.json()["id"], headers, participants))
+                return True
+
+            async def list_first(index):
+                response = await client.get("/expenses/", headers=session(index)[1], params={"limit": args.page_size})
+                return response.status_code == 200
+
+            # Kursory stron w głębi listy (po kilku stronach od najnowszych)
+            cursors = []
+            cursor = None
+            for _ in range(10):
+                page = (await client.get("/expenses/", headers=sessions[0][1], params={"limit": args.page_size, **({"cursor": cursor} if cursor else {})})).json()
+                cursor = page.get("next_cursor")
+                if not cursor:
+                    break
+                cursors.append(cursor)
+
+            async def list_deep(index):
+                if not cursors:
+                    return False
+                response = await client.get("/expenses/", headers=session(index)[1], params={"limit": args.page_size, "cursor": cursors[index % len(cursors)]})
+                return response.status_code == 200
+
+            async def update(index):
+                expense_id, headers, participants = created[index % len(created)]
+                response = await client.put(f"/expenses/{expense_id}", headers=headers, json={
+                    "amount": f"{rng.randint(100, 50000) / 100:.2f}", "description": f"{rng.choice(WORDS)} updated {index}",
+                    "split": "equal", "shares": [{"debtor_id": debtor_id} for debtor_id in participants],
+                })
+                return response.status_code == 200
+
+            async def delete(index):
+                expense_id, headers, _ = created[index]
+                return (await client.delete(f"/expenses/{expense_id}", headers=headers)).status_code == 200
+
+            async def search(index):
+                response = await client.get("/search/expenses", headers=session(index)[1], params={"q": WORDS[index % len(WORDS)]})
+                return response.status_code == 200
+
+            async def history(index):
+                return (await client.get("/chat/history", headers=session(index)[1])).status_code == 200
+
+            message_cursors = []
+            page = (await client.get("/chat/history", headers=sessions[0][1])).json()
+            if page.get("next_cursor"):
+                message_cursors.append(page["next_cursor"])
+
+            async def history_deep(index):
+                if not message_cursors:
+                    return False
+                response = await client.get("/chat/history", headers=session(index)[1], params={"cursor": message_cursors[0]})
+                return response.status_code == 200
+
+            report["POST /expenses/"] = await run_scenario(create, args.requests, args.concurrency)
+            report["GET /expenses/"] = await run_scenario(list_first, args.requests, args.concurrency)
+            report["GET /expenses/?cursor="] = await run_scenario(list_deep, args.requests, args.concurrency)
+            if created:
+                report["PUT /expenses/{id}"] = await run_scenario(update, args.requests, args.concurrency)
+                report["DELETE /expenses/{id}"] = await run_scenario(delete, len(created), args.concurrency)
+            report["GET /search/expenses"] = await run_scenario(search, args.requests, args.concurrency)
+            report["GET /chat/history"] = await run_scenario(history, args.requests, args.concurrency)
+            report["GET /chat/history?cursor="] = await run_scenario(history_deep, args.requests, args.concurrency)
+
+            token = sessions[0][1]["Authorization"].split(" ", 1)[1]
+            report["/ws fan-out"] = await ws_fanout(app, token, args.ws_clients, args.ws_messages)
+            report["MQTT relay -> /ws"] = await mqtt_relay(app, peer, token, args.ws_clients, args.ws_messages)
+
+            # Zdarzenia wydatków opublikowane w tle przez MQTTPublisher i odebrane przez peer
+            await asyncio.sleep(0.5)
+            stats = realtime.backplane.publisher.stats()
+            report["MQTT publish"] = {
+                "published": stats["published"],
+                "received_by_peer": sum(1 for message in received if message.get("event") in ("new_expense", "update_expense", "delete_expense")),
+                "failed": stats["failed"],
+                "avg_latency_ms": stats["avg_latency_ms"],
+                "max_latency_ms": stats["max_latency_ms"],
+            }
+    return report
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+# Regresje względem poprzedniego wyniku: spadek przepustowości lub wzrost p95 o więcej niż tolerance
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or "rps" not in current or "rps" not in previous:
+            continue
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['rps']} -> {current['rps']} rps")
+        if previous.get("p95_ms") and current.get("p95_ms", 0) > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current.get("errors", 0) > previous.get("errors", 0):
+            regressions.append(f"{name}: errors {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+def print_report(scenarios: dict, baseline: dict = None):
+    baseline = (baseline or {}).get("scenarios", {})
+    print(f"{'scenario':<28} {'count':>7} {'err':>4} {'rps':>9} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9} {'vs baseline':>12}")
+    for name, row in scenarios.items():
+        if "rps" not in row:
+            print(f"{name:<28} {json.dumps(row)}")
+            continue
+        previous = baseline.get(name, {}).get("rps")
+        change = f"{(row['rps'] / previous - 1) * 100:+.1f}%" if previous else ""
+        print(f"{name:<28} {row['count']:>7} {row['errors']:>4} {row['rps']:>9.1f} {row.get('p50_ms', 0):>9.2f} {row.get('p95_ms', 0):>9.2f} {row.get('p99_ms', 0):>9.2f} {change:>12}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--shares", type=int, default=3, help="debtors per seeded expense besides the payer")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--requests", type=int, default=500, help="operations per HTTP scenario")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--ws-clients", type=int, default=100)
+    parser.add_argument("--ws-messages", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="seed (if missing) and keep the database at this path instead of a temporary one")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative throughput drop / p95 increase")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.abspath(args.db) if args.db else os.path.join(tmp, "expenses.db")
+        existing = os.path.exists(database_path)
+        _configure_environment(database_path)
+        started = time.perf_counter()
+        if not existing:
+            seed(args)
+        seeded = time.perf_counter() - started
+        scenarios = asyncio.run(drive(args))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed_seconds": round(seeded, 2),
+            "scale": {name: getattr(args, name) for name in ("users", "expenses", "shares", "messages", "requests", "logins", "concurrency", "page_size", "ws_clients", "ws_messages", "seed")},
+        },
+        "scenarios": scenarios,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(scenarios, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        if baseline.get("meta", {}).get("scale") != report["meta"]["scale"]:
+            print("warning: baseline was recorded at a different scale")
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+import websockets
+
+# Test obciążeniowy: równoległy ruch REST i WebSocket na prawdziwym serwerze uvicorn.
+# Skrypt korzysta tylko z HTTP/WS, więc ten sam plik można uruchomić na starszym
+# commicie (przed przejściem na sesje asynchroniczne) i porównać wyniki.
+# Uruchomienie (z katalogu głównego repozytorium): python -m benchmarks.bench_async_load
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Baza jest migrowana jawnie przed startem serwera (jak przy wdrożeniu)
+def start_server(port: int, database_path: str, extra_env: dict = None) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}", **(extra_env or {}))
+    subprocess.run([sys.executable, "-m", "backend.manage", "migrate"], env=env, check=True, stdout=subprocess.DEVNULL)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/users/me")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+    await client.post("/users/", json={"username": username, "password": "bench"})
+    response = await client.post("/token", data={"username": username, "password": "bench"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def rest_worker(client, headers, debtor_id, deadline, samples):
+    index = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        if index % 4 == 0:
+            await client.post("/expenses/", headers=headers, json={
+                "amount": 10, "description": f"bench {index}", "shares": [{"debtor_id": debtor_id, "amount_owed": 5}],
+            })
+            samples["POST /expenses/"].append(time.perf_counter() - start)
+        else:
+            await client.get("/expenses/", headers=headers, params={"limit": 50})
+            samples["GET /expenses/"].append(time.perf_counter() - start)
+        index += 1
+
+async def ws_worker(ws_url, token, username, deadline, samples, errors):
+    try:
+        async with websockets.connect(ws_url, additional_headers={"Authorization": f"Bearer {token}"}) as ws:
+            while time.monotonic() < deadline:
+                marker = f"{username}-{time.perf_counter()}"
+                start = time.perf_counter()
+                await ws.send(json.dumps({"event": "chat", "user": username, "msg": marker}))
+                # Czekamy na własną wiadomość (round-trip przez broadcast)
+                while True:
+                    payload = json.loads(await asyncio.wait_for(ws.recv(), timeout=30))
+                    if payload.get("msg") == marker:
+                        break
+                samples["ws chat round-trip"].append(time.perf_counter() - start)
+    except (websockets.ConnectionClosed, asyncio.TimeoutError, OSError):
+        errors["ws disconnected"] += 1
+
+def summarize(samples: dict, errors: dict, duration: float) -> dict:
+    report = {"errors": errors}
+    for name, values in samples.items():
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        report[name] = {
+            "count": len(values),
+            "rps": round(len(values) / duration, 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        }
+    return report
+
+async def run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(port, os.path.join(tmp, "bench.db"))
+        try:
+            await wait_ready(base_url)
+            limits = httpx.Limits(max_connections=args.rest_clients * 2)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                headers = await login(client, "bench-payer")
+                token = headers["Authorization"].split(" ", 1)[1]
+                await login(client, "bench-debtor")
+                users = (await client.get("/users/", headers=headers)).json()
+                debtor_id = next(u["id"] for u in users if u["username"] == "bench-debtor")
+
+                samples = {"GET /expenses/": [], "POST /expenses/": [], "ws chat round-trip": []}
+                errors = {"ws disconnected": 0}
+                deadline = time.monotonic() + args.duration
+                await asyncio.gather(
+                    *(rest_worker(client, headers, debtor_id, deadline, samples) for _ in range(args.rest_clients)),
+                    *(ws_worker(f"ws://127.0.0.1:{port}/ws", token, f"bench-ws-{i}", deadline, samples, errors) for i in range(args.ws_clients)),
+                )
+        finally:
+            server.terminate()
+            server.wait()
+    return summarize(samples, errors, args.duration)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rest-clients", type=int, default=32)
+    parser.add_argument("--ws-clients", type=int, default=16)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
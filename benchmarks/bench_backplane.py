@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import threading
+import time
+from backend.protocols import MQTTHandler
+from backend.realtime import ConnectionManager, MQTTBackplane
+
+# Przepustowość rozgłaszania przez MQTTBackplane w zależności od liczby workerów.
+# Każdy worker to osobny proces z własnym ConnectionManager i symulowanymi klientami;
+# zamiast brokera MQTT działa proces przekazujący wiadomości przez kolejki multiprocessing.
+# Łączna liczba klientów i zdarzeń jest stała - rośnie tylko liczba workerów, które je obsługują.
+# Uruchomienie: python -m benchmarks.bench_backplane
+
+class CountingWebSocket:
+    def __init__(self, counter):
+        self.counter = counter
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        json.loads(payload)
+        self.counter[0] += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+# MQTTHandler, którego transportem są kolejki do procesu-brokera
+class QueueMQTTHandler(MQTTHandler):
+    def __init__(self, origin, broker_queue, inbox):
+        super().__init__(origin=origin)
+        self.broker_queue = broker_queue
+        self.connected = True
+        threading.Thread(target=self._receive, args=(inbox,), daemon=True).start()
+
+    def publish(self, message, topic="expenses/events", outbox_id=None):
+        self.broker_queue.put((topic, json.dumps(self.envelope(message, outbox_id)).encode()))
+        return True
+
+    def _receive(self, inbox):
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            self.dispatch(*item)
+
+def broker_main(broker_queue, inboxes):
+    while True:
+        item = broker_queue.get()
+        if item is None:
+            break
+        for inbox in inboxes:
+            inbox.put(item)
+    for inbox in inboxes:
+        inbox.put(None)
+
+async def worker(index, clients, events, expected, broker_queue, inbox, start_at, results):
+    counter = [0]
+    manager = ConnectionManager(queue_size=events * 4 + 16)
+    backplane = MQTTBackplane(QueueMQTTHandler(f"worker-{index}", broker_queue, inbox))
+    for _ in range(clients):
+        await manager.connect(CountingWebSocket(counter))
+    await backplane.start(manager)
+
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    for i in range(events):
+        message = {"event": "chat", "user": f"worker-{index}", "msg": f"event {i}"}
+        await manager.broadcast(message)
+        await backplane.publish(message, "chat/messages")
+        if i % 50 == 0:
+            await asyncio.sleep(0)
+    while counter[0] < expected:
+        await asyncio.sleep(0.001)
+    finished = time.time()
+    # każde zdarzenie ma dotrzeć do każdego klienta dokładnie raz - nadmiarowe dostarczenia to duplikaty
+    await asyncio.sleep(0.2)
+    results.put((finished, counter[0] - expected))
+    await backplane.stop()
+    await manager.close_all()
+
+def worker_main(*args):
+    asyncio.run(worker(*args))
+
+def run(workers, total_clients, total_events):
+    clients = total_clients // workers
+    events = total_events // workers
+    expected = clients * events * workers
+
+    broker_queue = mp.Queue()
+    inboxes = [mp.Queue() for _ in range(workers)]
+    results = mp.Queue()
+    broker = mp.Process(target=broker_main, args=(broker_queue, inboxes))
+    broker.start()
+    start_at = time.time() + 1.0 + 0.1 * workers
+    processes = [
+        mp.Process(target=worker_main, args=(i, clients, events, expected, broker_queue, inboxes[i], start_at, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    finished = max(report[0] for report in reports)
+    duplicates = sum(report[1] for report in reports)
+    for process in processes:
+        process.join()
+    broker_queue.put(None)
+    broker.join()
+    return expected * workers, finished - start_at, duplicates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=1000, help="total simulated WebSocket clients")
+    parser.add_argument("--events", type=int, default=200, help="total events published")
+    args = parser.parse_args(argv)
+
+    print(f"{'workers':>8} {'deliveries':>11} {'time [s]':>9} {'deliveries/s':>13} {'duplicates':>11}")
+    for workers in args.workers:
+        deliveries, elapsed, duplicates = run(workers, args.clients, args.events)
+        print(f"{workers:>8} {deliveries:>11} {elapsed:>9.2f} {deliveries / elapsed:>13.0f} {duplicates:>11}")
+
+if __name__ == "__main__":
+    main()
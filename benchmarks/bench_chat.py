@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import httpx
+import numpy as np
+import websockets
+from benchmarks.bench_async_load import free_port, login, start_server, wait_ready
+
+# Przepustowość czatu: wielu równoczesnych rozmówców na prawdziwym serwerze uvicorn.
+# Każdy rozmówca wysyła wiadomość, czeka na jej powrót w broadcaście i wysyła następną;
+# w tym czasie odbiera też wiadomości wszystkich pozostałych.
+# Na koniec liczymy wiadomości zapisane w bazie - każda przyjęta wiadomość ma zostać zapisana.
+# Porównanie z zapisem każdej wiadomości osobno: --batch-size 1 --flush-interval 0
+# Uruchomienie: python -m benchmarks.bench_chat [--chatters 500 --duration 20]
+
+async def chatter(ws_url, token, name, start_at, deadline, samples, errors):
+    try:
+        async with websockets.connect(ws_url, additional_headers={"Authorization": f"Bearer {token}"}, max_queue=None) as ws:
+            await asyncio.sleep(max(0.0, start_at - time.monotonic()))
+            index = 0
+            while time.monotonic() < deadline:
+                marker = f"{name}-{index}"
+                start = time.perf_counter()
+                await ws.send(json.dumps({"event": "chat", "msg": marker}))
+                # Czekamy na własną wiadomość; cudze tylko odbieramy
+                quoted = f'"{marker}"'
+                while quoted not in await asyncio.wait_for(ws.recv(), timeout=60):
+                    pass
+                samples.append(time.perf_counter() - start)
+                index += 1
+    except (websockets.ConnectionClosed, asyncio.TimeoutError, OSError):
+        errors["ws disconnected"] += 1
+
+async def run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "bench.db")
+        server = start_server(port, database_path, {
+            "CHAT_BATCH_SIZE": str(args.batch_size),
+            "CHAT_FLUSH_INTERVAL": str(args.flush_interval),
+            "WS_QUEUE_SIZE": str(max(256, args.chatters * 4)),
+        })
+        try:
+            await wait_ready(base_url)
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                tokens = []
+                for i in range(args.users):
+                    headers = await login(client, f"bench-chat-{i}")
+                    tokens.append(headers["Authorization"].split(" ", 1)[1])
+
+                samples, errors = [], {"ws disconnected": 0}
+                start_at = time.monotonic() + 2.0 + args.chatters * 0.002
+                deadline = start_at + args.duration
+                await asyncio.gather(*(
+                    chatter(f"ws://127.0.0.1:{port}/ws", tokens[i % len(tokens)], f"c{i}", start_at, deadline, samples, errors)
+                    for i in range(args.chatters)
+                ))
+                stats = (await client.get("/realtime/stats", headers={"Authorization": f"Bearer {tokens[0]}"})).json()
+        finally:
+            server.terminate()
+            server.wait()
+        with sqlite3.connect(database_path) as db:
+            stored = db.execute("SELECT count(*) FROM messages").fetchone()[0]
+
+    ms = np.array(samples) * 1000 if samples else np.zeros(1)
+    return {
+        "chatters": args.chatters,
+        "batch_size": args.batch_size,
+        "flush_interval": args.flush_interval,
+        "messages": len(samples),
+        "messages_per_s": round(len(samples) / args.duration, 1),
+        "deliveries_per_s": round(len(samples) * args.chatters / args.duration, 1),
+        "round_trip_p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "round_trip_p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "stored": stored,
+        "writer": stats.get("chat_writer"),
+        "errors": errors,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chatters", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20, help="accounts shared by the chatters")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--flush-interval", type=float, default=0.005)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import httpx
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from backend import reports, search
+from backend.database import Base, apply_sqlite_profile
+from .bench_async_load import free_port, login, start_server, wait_ready
+from .bench_reports import populate
+
+# Eksport i import całej księgi przez działający serwer (uvicorn) na syntetycznej bazie:
+# przepustowość i przyrost pamięci procesu serwera dla GET /expenses/export (CSV, NDJSON),
+# dla pobierania listy stronami przez GET /expenses/ (dotychczasowy sposób) i dla POST /expenses/import.
+# Uruchomienie: python -m benchmarks.bench_export [--expenses 1000000]
+
+def memory_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+# Pamięć procesu serwera w trakcie fazy, próbkowana w osobnym wątku:
+# RssAnon - sterta Pythona i bufory (to, co rośnie przy wczytywaniu danych do pamięci),
+# VmRSS - łącznie ze stronami pliku bazy (mmap) i pamięcią podręczną SQLite
+class Phase:
+    def __init__(self, pid: int, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_anon = max(self.peak_anon, memory_kb(self.pid, "RssAnon"))
+            self.peak_rss = max(self.peak_rss, memory_kb(self.pid, "VmRSS"))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.anon_before = self.peak_anon = memory_kb(self.pid, "RssAnon")
+        self.peak_rss = memory_kb(self.pid, "VmRSS")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, rows: int, size: int) -> dict:
+        return {
+            "rows": rows,
+            "seconds": round(self.elapsed, 2),
+            "rows_per_s": round(rows / self.elapsed) if self.elapsed else 0,
+            "mb_per_s": round(size / self.elapsed / 1e6, 1) if self.elapsed else 0,
+            "server_anon_before_mb": round(self.anon_before / 1024, 1),
+            "server_anon_peak_growth_mb": round((self.peak_anon - self.anon_before) / 1024, 1),
+            "server_rss_peak_mb": round(self.peak_rss / 1024, 1),
+        }
+
+async def export(client, headers, pid, fmt, path):
+    rows = size = 0
+    with Phase(pid) as phase, open(path, "wb") as out:
+        async with client.stream("GET", "/expenses/export", params={"format": fmt}, headers=headers) as response:
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                rows += chunk.count(b"\n")
+                out.write(chunk)
+    # CSV ma nagłówek; opisy z nowymi liniami zawyżyłyby licznik, ale dane syntetyczne ich nie mają
+    return phase.report(rows - (fmt == "csv"), size)
+
+async def paged(client, headers, pid, limit_rows, page_size):
+    rows = size = 0
+    cursor = None
+    with Phase(pid) as phase:
+        while rows < limit_rows:
+            params = {"limit": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/expenses/", params=params, headers=headers)
+            size += len(response.content)
+            page = response.json()
+            rows += len(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+    return phase.report(rows, size)
+
+async def import_csv(client, headers, pid, path, limit_rows):
+    sent = {"rows": 0, "size": 0}
+
+    async def body():
+        with open(path, "rb") as f:
+            for number, line in enumerate(f):
+                if number > limit_rows:
+                    break
+                sent["rows"] += number > 0
+                sent["size"] += len(line)
+                yield line
+
+    with Phase(pid) as phase:
+        response = await client.post("/expenses/import", content=body(), headers={**headers, "Content-Type": "text/csv"})
+    summary = response.json()
+    report = phase.report(sent["rows"], sent["size"])
+    report.update(created=summary["created"], failed=summary["failed"], batches=summary["batches"])
+    return report
+
+async def run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{database_path}")
+        apply_sqlite_profile(engine, "wal")
+        Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        populate(engine, args.expenses, args.users, 500, 3 * 365, np.random.default_rng(args.seed))
+        # Zestawienia i indeks wyszukiwania budowane tu, żeby nie liczyć ich w starcie serwera
+        with Session(engine) as db:
+            reports.rebuild(db)
+        search.install(engine)
+        engine.dispose()
+        print(f"populated {args.expenses} expenses in {time.perf_counter() - started:.1f}s")
+
+        server = start_server(port, database_path)
+        try:
+            await wait_ready(base_url, timeout=300)
+            async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+                headers = await login(client, "bench-export")
+                result = {"expenses": args.expenses}
+                csv_path = os.path.join(tmp, "export.csv")
+                result["export csv"] = await export(client, headers, server.pid, "csv", csv_path)
+                result["export ndjson"] = await export(client, headers, server.pid, "ndjson", os.path.join(tmp, "export.ndjson"))
+                result["paged GET /expenses/"] = await paged(client, headers, server.pid, args.page_rows, args.page_size)
+                result["import csv"] = await import_csv(client, headers, server.pid, csv_path, args.import_rows)
+        finally:
+            server.terminate()
+            server.wait()
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--expenses", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--page-rows", type=int, default=50_000, help="rows fetched page by page for comparison")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--import-rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
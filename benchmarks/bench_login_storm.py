@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import httpx
+from .bench_async_load import free_port, start_server, wait_ready, login, summarize
+
+# Burza logowań (pbkdf2) i jednoczesne opóźnienia niezwiązanych żądań (GET /users/me).
+# Uruchomienie: python -m benchmarks.bench_login_storm
+
+async def login_storm(client, usernames, deadline, samples):
+    index = 0
+    while time.monotonic() < deadline:
+        username = usernames[index % len(usernames)]
+        start = time.perf_counter()
+        await client.post("/token", data={"username": username, "password": "bench"})
+        samples["POST /token"].append(time.perf_counter() - start)
+        index += 1
+
+async def unrelated_requests(client, headers, deadline, samples):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        await client.get("/users/me", headers=headers)
+        samples["GET /users/me"].append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+async def run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(port, os.path.join(tmp, "bench.db"))
+        try:
+            await wait_ready(base_url)
+            async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=args.login_clients + args.readers + 4)) as client:
+                usernames = [f"storm{i}" for i in range(args.login_clients)]
+                for username in usernames:
+                    await login(client, username)
+                headers = await login(client, "reader")
+
+                samples = {"POST /token": [], "GET /users/me": []}
+                deadline = time.monotonic() + args.duration
+                await asyncio.gather(
+                    *(login_storm(client, usernames[i:] + usernames[:i], deadline, samples) for i in range(args.login_clients)),
+                    *(unrelated_requests(client, headers, deadline, samples) for _ in range(args.readers)),
+                )
+        finally:
+            server.terminate()
+            server.wait()
+    return summarize(samples, {}, args.duration)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--login-clients", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
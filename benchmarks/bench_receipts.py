@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import httpx
+import numpy as np
+from .bench_async_load import free_port, start_server, wait_ready, login
+
+# Przesyłanie paragonów: równoległe wysyłanie dużych plików (strumieniowo, porcjami) na prawdziwy
+# serwer uvicorn - przepustowość [MB/s], opóźnienia p50/p95 i szczytowa pamięć procesu serwera
+# (VmHWM z /proc, Linux). Druga runda wysyła te same pliki (duplikaty), trzecia pobiera je
+# fragmentami (nagłówek Range).
+# Uruchomienie (z katalogu głównego repozytorium): python -m benchmarks.bench_receipts [--output receipts.json]
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0"
+SEND_CHUNK = 256 * 1024
+
+def process_memory_kb(pid: int) -> dict:
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    memory[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+async def body(data: bytes):
+    for start in range(0, len(data), SEND_CHUNK):
+        yield data[start:start + SEND_CHUNK]
+
+async def upload_worker(client, headers, expense_id, files, samples, duplicates):
+    for data in files:
+        start = time.perf_counter()
+        response = await client.post(f"/expenses/{expense_id}/receipts", headers=headers, content=body(data))
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+        duplicates.append(response.json()["duplicate"])
+
+async def range_worker(client, headers, receipt_ids, range_bytes, samples):
+    for receipt_id in receipt_ids:
+        start = time.perf_counter()
+        response = await client.get(f"/receipts/{receipt_id}", headers={**headers, "Range": f"bytes=0-{range_bytes - 1}"})
+        if response.status_code != 206:
+            raise RuntimeError(f"Range request returned {response.status_code}")
+        samples.append(time.perf_counter() - start)
+
+def latency(values: list, total_bytes: int, duration: float) -> dict:
+    ms = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "mb_per_s": round(total_bytes / duration / 1e6, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+    }
+
+async def upload_round(client, headers, expense_id, batches):
+    samples, duplicates = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(upload_worker(client, headers, expense_id, files, samples, duplicates) for files in batches))
+    duration = time.perf_counter() - started
+    return latency(samples, sum(len(data) for files in batches for data in files), duration), duplicates
+
+async def run(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    size = int(args.size_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(port, os.path.join(tmp, "bench.db"), {
+            "RECEIPTS_DIR": os.path.join(tmp, "receipts"),
+            "RECEIPT_MAX_BYTES": str(size + 1024),
+            "MQTT_ENABLED": "0",
+            "LOG_FILE": "",
+        })
+        try:
+            await wait_ready(base_url)
+            idle = process_memory_kb(server.pid)
+            async with httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_connections=args.clients * 2), timeout=120) as client:
+                headers = await login(client, "bench-payer")
+                await login(client, "bench-debtor")
+                users = (await client.get("/users/", headers=headers)).json()
+                debtor_id = next(u["id"] for u in users if u["username"] == "bench-debtor")
+                expense = await client.post("/expenses/", headers=headers, json={
+                    "amount": 10, "description": "bench receipts", "shares": [{"debtor_id": debtor_id, "amount_owed": 5}],
+                })
+                expense_id = expense.json()["id"]
+
+                batches = [[JPEG_HEADER + os.urandom(size - len(JPEG_HEADER)) for _ in range(args.files_per_client)] for _ in range(args.clients)]
+                uploads, duplicates = await upload_round(client, headers, expense_id, batches)
+                if any(duplicates):
+                    raise RuntimeError("Unique files were reported as duplicates")
+                dedup, duplicates = await upload_round(client, headers, expense_id, batches)
+                if not all(duplicates):
+                    raise RuntimeError("Repeated files were not deduplicated")
+
+                receipts = (await client.get(f"/expenses/{expense_id}/receipts", headers=headers)).json()
+                receipt_ids = [receipt["id"] for receipt in receipts]
+                range_samples = []
+                started = time.perf_counter()
+                await asyncio.gather(*(range_worker(client, headers, receipt_ids[i::args.clients], args.range_kb * 1024, range_samples) for i in range(args.clients)))
+                ranges = latency(range_samples, len(range_samples) * args.range_kb * 1024, time.perf_counter() - started)
+            peak = process_memory_kb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        "params": {"clients": args.clients, "files_per_client": args.files_per_client, "size_mb": args.size_mb, "range_kb": args.range_kb},
+        "upload": uploads,
+        "upload (duplicates)": dedup,
+        "GET /receipts/{id} (Range)": ranges,
+        "server_memory_mb": {
+            "idle_rss": round(idle.get("VmRSS", 0) / 1024, 1),
+            "peak_rss": round(peak.get("VmHWM", 0) / 1024, 1),
+            "final_rss": round(peak.get("VmRSS", 0) / 1024, 1),
+            # Dane przesyłane równocześnie - serwer strumieniujący zostaje daleko poniżej
+            "in_flight_upload_data": round(args.clients * size / 1024 / 1024, 1),
+        },
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--files-per-client", type=int, default=3)
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    parser.add_argument("--range-kb", type=int, default=256)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
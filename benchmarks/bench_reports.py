@@ -0,0 +1,108 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from backend import models, reports
+from backend.database import Base, apply_sqlite_profile
+
+# Czas raportów /reports na syntetycznej bazie: zapytania GROUP BY na expenses/expense_shares
+# kontra odczyt z tabel zestawień (rollups), dla całej historii i dla jednego miesiąca.
+# Uruchomienie: python -m benchmarks.bench_reports [--expenses 1000000]
+
+INSERT_CHUNK = 50000
+
+def populate(engine, expenses: int, users: int, descriptions: int, days: int, rng: np.random.Generator):
+    start = datetime(2023, 1, 1)
+    with Session(engine) as db:
+        db.execute(insert(models.User), [{"id": i + 1, "username": f"user{i}", "hashed_password": "x"} for i in range(users)])
+        db.commit()
+        expense_id = 0
+        for offset in range(0, expenses, INSERT_CHUNK):
+            count = min(INSERT_CHUNK, expenses - offset)
+            payers = rng.integers(1, users + 1, size=count)
+            amounts = rng.integers(100, 20000, size=count)
+            texts = rng.integers(0, descriptions, size=count)
+            seconds = np.sort(rng.integers(offset * days * 86400 // expenses, (offset + count) * days * 86400 // expenses, size=count))
+            debtors = rng.integers(1, users + 1, size=(count, 2))
+            expense_rows = []
+            share_rows = []
+            for i in range(count):
+                expense_id += 1
+                expense_rows.append({
+                    "id": expense_id,
+                    "payer_id": int(payers[i]),
+                    "amount_minor": int(amounts[i]),
+                    "description": f"item {texts[i]}",
+                    "timestamp": start + timedelta(seconds=int(seconds[i])),
+                })
+                for debtor in debtors[i]:
+                    share_rows.append({"expense_id": expense_id, "debtor_id": int(debtor), "amount_owed_minor": int(amounts[i]) // 3})
+            db.execute(insert(models.Expense), expense_rows)
+            db.execute(insert(models.ExpenseShare), share_rows)
+            db.commit()
+
+def timed(fn, repeat):
+    best = float("inf")
+    rows = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--expenses", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--descriptions", type=int, default=500)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="reuse/keep the database at this path instead of a temporary one")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "reports.db")
+        fresh = not os.path.exists(path)
+        engine = create_engine(f"sqlite:///{path}")
+        apply_sqlite_profile(engine, "wal")
+        Base.metadata.create_all(bind=engine)
+        if fresh:
+            started = time.perf_counter()
+            populate(engine, args.expenses, args.users, args.descriptions, args.days, np.random.default_rng(args.seed))
+            print(f"populated {args.expenses} expenses in {time.perf_counter() - started:.1f}s")
+            with Session(engine) as db:
+                started = time.perf_counter()
+                rows = reports.rebuild(db)
+            print(f"rollups rebuilt ({rows} rows) in {time.perf_counter() - started:.1f}s")
+
+        month = (datetime(2023, 1, 1) + timedelta(days=args.days // 2)).strftime("%Y-%m")
+        cases = [
+            ("monthly, all users, all history", lambda db, r: reports.monthly_spend(db, rollups=r)),
+            (f"monthly, all users, {month}", lambda db, r: reports.monthly_spend(db, month, month, rollups=r)),
+            ("daily, one user, all history", lambda db, r: reports.daily_spend(db, 1, rollups=r)),
+            ("counterparties, all history", lambda db, r: reports.counterparties(db, 1, rollups=r)),
+            (f"counterparties, {month}", lambda db, r: reports.counterparties(db, 1, month, month, rollups=r)),
+            ("top descriptions, all history", lambda db, r: reports.top_descriptions(db, rollups=r)),
+            (f"top descriptions, {month}", lambda db, r: reports.top_descriptions(db, month, month, rollups=r)),
+        ]
+        print(f"{'report':<34} {'rows':>6} {'raw [ms]':>10} {'rollups [ms]':>13} {'speedup':>8}")
+        with Session(engine) as db:
+            for name, fn in cases:
+                raw, raw_rows = timed(lambda: fn(db, False), args.repeat)
+                rolled, rolled_rows = timed(lambda: fn(db, True), args.repeat)
+                note = "" if raw_rows == rolled_rows else "  MISMATCH"
+                print(f"{name:<34} {len(rolled_rows):>6} {raw * 1000:>10.1f} {rolled * 1000:>13.2f} {raw / rolled:>7.0f}x{note}")
+
+        cache = reports.ReportCache()
+        cache.put(("bench",), 1, rolled_rows)
+        hit, _ = timed(lambda: cache.get(("bench",), 1), 1000)
+        print(f"cache hit: {hit * 1e6:.1f} us")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
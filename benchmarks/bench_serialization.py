@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend import models, pagination, schemas, serializers
+from backend.database import Base, apply_sqlite_profile
+from backend.routes.expenses import expense_load_options
+from .bench_reports import populate
+
+# Czas przygotowania strony listy wydatków na 1000 wydatków: dotychczasowa ścieżka
+# (obiekty ORM z relacjami + walidacja schemas.ExpensePage z from_attributes + JSON z Pydantic)
+# kontra ścieżka lekka (zapytania o kolumny -> słowniki -> orjson), w kształcie full i compact.
+# Uruchomienie: python -m benchmarks.bench_serialization
+
+def _query(cursor):
+    order = (models.Expense.timestamp.desc(), models.Expense.id.desc())
+    return order, (pagination.older_than(models.Expense.timestamp, models.Expense.id, cursor),) if cursor else ()
+
+async def orm_page(db, cursor, limit):
+    order, where = _query(cursor)
+    started = time.perf_counter()
+    result = await db.execute(select(models.Expense).options(*expense_load_options()).where(*where).order_by(*order).limit(limit + 1))
+    rows = result.scalars().all()
+    items, next_cursor = pagination.page(rows, limit)
+    fetched = time.perf_counter()
+    body = schemas.ExpensePage.model_validate({"items": items, "next_cursor": next_cursor, "seq": 0}).model_dump_json().encode()
+    done = time.perf_counter()
+    db.expunge_all()
+    return fetched - started, done - fetched, len(body)
+
+async def lean_page(db, cursor, limit, shape):
+    order, where = _query(cursor)
+    started = time.perf_counter()
+    result = await db.execute(serializers.expense_columns().where(*where).order_by(*order).limit(limit + 1))
+    rows, next_cursor = pagination.page(result.all(), limit)
+    items, names = await serializers.expense_dicts(db, rows, shape)
+    fetched = time.perf_counter()
+    body = serializers.page_response(items, shape, names, next_cursor=next_cursor, seq=0).body
+    done = time.perf_counter()
+    return fetched - started, done - fetched, len(body), next_cursor
+
+def summarize(samples, limit):
+    scale = 1000 / limit * 1000
+    fetch = [sample[0] * scale for sample in samples]
+    encode = [sample[1] * scale for sample in samples]
+    return {
+        "fetch_ms_per_1000": round(statistics.median(fetch), 2),
+        "serialize_ms_per_1000": round(statistics.median(encode), 2),
+        "total_ms_per_1000": round(statistics.median(f + e for f, e in zip(fetch, encode)), 2),
+        "bytes_per_1000": round(statistics.median(sample[2] for sample in samples) * 1000 / limit),
+    }
+
+async def run(args, path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    samples = {"orm + pydantic": [], "lean full": [], "lean compact": []}
+    async with Session() as db:
+        cursor = None
+        for _ in range(args.pages):
+            samples["orm + pydantic"].append(await orm_page(db, cursor, args.page_size))
+            samples["lean compact"].append((await lean_page(db, cursor, args.page_size, serializers.COMPACT))[:3])
+            *sample, cursor = await lean_page(db, cursor, args.page_size, serializers.FULL)
+            samples["lean full"].append(sample)
+            if cursor is None:
+                break
+    await engine.dispose()
+    return {name: summarize(values, args.page_size) for name, values in samples.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--expenses", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        apply_sqlite_profile(engine, "wal")
+        Base.metadata.create_all(bind=engine)
+        populate(engine, args.expenses, 50, 500, 365, np.random.default_rng(args.seed))
+        engine.dispose()
+        report = asyncio.run(run(args, path))
+
+    print(f"{'path':<16} {'fetch [ms]':>11} {'serialize [ms]':>15} {'total [ms]':>11} {'bytes':>9}   (per 1000 expenses)")
+    for name, row in report.items():
+        print(f"{name:<16} {row['fetch_ms_per_1000']:>11.2f} {row['serialize_ms_per_1000']:>15.2f} {row['total_ms_per_1000']:>11.2f} {row['bytes_per_1000']:>9}")
+
+if __name__ == "__main__":
+    main()
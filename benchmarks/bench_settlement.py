@@ -0,0 +1,45 @@
+import argparse
+import time
+import numpy as np
+from backend import settlement
+
+# Porównanie solvera zachłannego i dokładnego na syntetycznych grupach
+# Uruchomienie: python -m benchmarks.bench_settlement
+
+def synthetic_group(users: int, shares: int, rng: np.random.Generator) -> np.ndarray:
+    payers = rng.integers(0, users, size=shares)
+    debtors = rng.integers(0, users, size=shares)
+    amounts = rng.integers(100, 20000, size=shares)
+    net = np.bincount(payers, weights=amounts, minlength=users) - np.bincount(debtors, weights=amounts, minlength=users)
+    return net.astype(np.int64)
+
+def timed(solver, cents, repeat):
+    best = float("inf")
+    transfers = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transfers = solver(cents)
+        best = min(best, time.perf_counter() - start)
+    return best, len(transfers)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--shares-per-user", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'users':>6} {'solver':>7} {'transfers':>10} {'time [ms]':>10}")
+    for users in args.sizes:
+        cents = synthetic_group(users, users * args.shares_per_user, rng)
+        for name, solver in (("greedy", settlement.greedy_transfers), ("exact", settlement.exact_transfers)):
+            if name == "exact" and np.count_nonzero(cents) > settlement.EXACT_MAX_PARTICIPANTS:
+                print(f"{users:>6} {name:>7} {'-':>10} {'skipped':>10}  (> {settlement.EXACT_MAX_PARTICIPANTS} participants)")
+                continue
+            elapsed, count = timed(solver, cents, args.repeat)
+            print(f"{users:>6} {name:>7} {count:>10} {elapsed * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from backend import models
+from backend.database import Base, SQLITE_PROFILES, apply_sqlite_profile
+
+# Przepustowość zapisu wydatków i wiadomości czatu dla każdego profilu SQLite.
+# Każdy zapis to osobna transakcja (jak w endpointach), zapisujący działają równolegle w wątkach.
+# Uruchomienie: python -m benchmarks.bench_sqlite_profiles
+
+def writer(Session, kind, user_ids, count, stats, lock):
+    done = locked = 0
+    for i in range(count):
+        db = Session()
+        try:
+            if kind == "expense":
+                db.add(models.Expense(
+                    payer_id=user_ids[0], amount_minor=3000, description=f"bench {i}",
+                    shares=[models.ExpenseShare(debtor_id=uid, amount_owed_minor=1000) for uid in user_ids[1:]],
+                ))
+            else:
+                db.add(models.Message(user_id=user_ids[i % len(user_ids)], content=f"bench message {i}"))
+            db.commit()
+            done += 1
+        except OperationalError:
+            db.rollback()
+            locked += 1
+        finally:
+            db.close()
+    with lock:
+        stats[kind]["writes"] += done
+        stats[kind]["locked"] += locked
+
+def run_profile(profile, writers, writes_per_writer):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", connect_args={"check_same_thread": False})
+        apply_sqlite_profile(engine, profile)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        db = Session()
+        users = [models.User(username=f"user{i}", hashed_password="x") for i in range(3)]
+        db.add_all(users)
+        db.commit()
+        user_ids = [u.id for u in users]
+        db.close()
+
+        stats = {"expense": {"writes": 0, "locked": 0}, "message": {"writes": 0, "locked": 0}}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=writer, args=(Session, "expense" if i % 2 == 0 else "message", user_ids, writes_per_writer, stats, lock))
+            for i in range(writers)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+    return stats, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", nargs="+", default=list(SQLITE_PROFILES))
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200, help="transactions per writer thread")
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':>8} {'kind':>8} {'writes/s':>10} {'locked':>7}")
+    for profile in args.profiles:
+        stats, elapsed = run_profile(profile, args.writers, args.writes)
+        for kind, values in stats.items():
+            print(f"{profile:>8} {kind:>8} {values['writes'] / elapsed:>10.1f} {values['locked']:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+import httpx
+from .bench_async_load import free_port
+
+# Zimny start workera: czas importu backend.main (python -X importtime, z podziałem na pakiety),
+# czas od uruchomienia procesu uvicorn do pierwszej obsłużonej odpowiedzi i pierwszego żądania
+# z zapytaniem do bazy. Każdy pomiar w świeżym procesie; wynik to mediana i minimum z --runs.
+# Uruchomienie (z katalogu głównego repozytorium): python -m benchmarks.bench_startup [--output start.json]
+#                                                 python -m benchmarks.bench_startup --baseline start.json
+
+READY_POLL_INTERVAL = 0.005
+
+# Czas interpretera bez importów aplikacji (odejmowany od czasu procesu)
+def interpreter_seconds(env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - started
+
+# Jeden import w nowym procesie: czas całego procesu i wynik -X importtime
+def import_profile(env: dict, module: str = "backend.main"):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - started
+    packages = defaultdict(int)
+    total = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+        if name.strip() == module:
+            total = int(cumulative_us)
+    return elapsed, total / 1e6, packages
+
+# Od uruchomienia uvicorn do pierwszej odpowiedzi (dowolny status) i do pierwszego żądania czytającego bazę
+def first_requests(env: dict, timeout: float = 60.0):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            deadline = started + timeout
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited during startup: {server.stderr.read().decode()[-2000:]}")
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("Server did not start")
+                try:
+                    client.get("/users/me")
+                    break
+                except httpx.TransportError:
+                    time.sleep(READY_POLL_INTERVAL)
+            ready = time.perf_counter() - started
+            # Nieznany użytkownik - zapytanie do bazy bez kosztu bcrypt
+            before = time.perf_counter()
+            client.post("/token", data={"username": "bench-startup-nobody", "password": "x"})
+            first_query = time.perf_counter() - before
+    finally:
+        server.terminate()
+        server.wait()
+    return ready, first_query
+
+def summary(values) -> dict:
+    ms = [value * 1000 for value in values]
+    return {"median_ms": round(statistics.median(ms), 1), "min_ms": round(min(ms), 1), "runs": len(ms)}
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="packages with the largest import time to report")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase of a median")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'expenses.db')}", LOG_FILE="", MQTT_ENABLED="0")
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "backend.manage", "migrate"], env=env, check=True, stdout=subprocess.DEVNULL)
+        migrate = time.perf_counter() - started
+
+        interpreter, process, imports, ready, first_query = [], [], [], [], []
+        packages = defaultdict(list)
+        for _ in range(args.runs):
+            interpreter.append(interpreter_seconds(env))
+            elapsed, total, per_package = import_profile(env)
+            process.append(elapsed)
+            imports.append(total)
+            for name, self_us in per_package.items():
+                packages[name].append(self_us)
+            server_ready, query = first_requests(env)
+            ready.append(server_ready)
+            first_query.append(query)
+
+    metrics = {
+        "interpreter": summary(interpreter),
+        "import backend.main": summary(imports),
+        "python -c 'import backend.main'": summary(process),
+        "spawn -> first response": summary(ready),
+        "first DB request": summary(first_query),
+    }
+    top = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))[:args.top]
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "migrate_seconds": round(migrate, 2),
+        },
+        "metrics": metrics,
+        "import_by_package_ms": {name: round(statistics.median(values) / 1000, 1) for name, values in top},
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    previous = (baseline or {}).get("metrics", {})
+    print(f"{'metric':<34} {'median [ms]':>12} {'min [ms]':>10} {'vs baseline':>12}")
+    for name, row in metrics.items():
+        before = previous.get(name, {}).get("median_ms")
+        change = f"{(row['median_ms'] / before - 1) * 100:+.1f}%" if before else ""
+        print(f"{name:<34} {row['median_ms']:>12.1f} {row['min_ms']:>10.1f} {change:>12}")
+    print("import time by package (self, median):")
+    for name, value in report["import_by_package_ms"].items():
+        print(f"  {name:<32} {value:>10.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        regressions = [
+            f"{name}: {previous[name]['median_ms']} -> {row['median_ms']} ms"
+            for name, row in metrics.items()
+            if name in previous and row["median_ms"] > previous[name]["median_ms"] * (1 + args.tolerance)
+        ]
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from backend.realtime import ConnectionManager
+
+# Opóźnienie rozgłaszania (broadcast -> dostarczenie do ostatniego klienta) dla 1k i 10k
+# symulowanych klientów, z częścią wolnych klientów. Porównanie z dawną pętlą szeregową.
+# Uruchomienie: python -m benchmarks.bench_ws_fanout
+
+class FakeWebSocket:
+    def __init__(self, delay: float, deliveries: list):
+        self.delay = delay
+        self.deliveries = deliveries
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.deliveries.append(time.perf_counter())
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+# Dawna implementacja: await send_text po kolei dla każdego połączenia
+async def serial_broadcast(sockets, payload):
+    for websocket in sockets:
+        await websocket.send_text(payload)
+
+async def run_case(clients: int, slow_fraction: float, slow_delay: float, messages: int, mode: str):
+    deliveries: list = []
+    slow_count = int(clients * slow_fraction)
+    sockets = [FakeWebSocket(slow_delay if i < slow_count else 0.0, deliveries) for i in range(clients)]
+
+    manager = ConnectionManager(queue_size=messages + 1, send_timeout=slow_delay * 10 + 1)
+    for websocket in sockets:
+        await manager.connect(websocket)
+
+    latencies = []
+    for i in range(messages):
+        deliveries.clear()
+        payload = json.dumps({"event": "chat", "user": "bench", "msg": f"message {i}"})
+        start = time.perf_counter()
+        if mode == "serial":
+            await serial_broadcast(sockets, payload)
+        else:
+            await manager.broadcast(payload)
+        # Czekamy, aż wszyscy szybcy klienci dostaną wiadomość
+        while len(deliveries) < clients - slow_count:
+            await asyncio.sleep(0)
+        latencies.append(max(deliveries) - start)
+
+    await manager.close_all()
+    ms = np.array(latencies) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p99_ms": round(float(np.percentile(ms, 99)), 2)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow-fraction", type=float, default=0.01)
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds per send for slow clients")
+    args = parser.parse_args(argv)
+
+    print(f"{'clients':>8} {'mode':>8} {'p50 [ms]':>10} {'p99 [ms]':>10}")
+    for clients in args.clients:
+        for mode in ("serial", "queued"):
+            result = asyncio.run(run_case(clients, args.slow_fraction, args.slow_delay, args.messages, mode))
+            print(f"{clients:>8} {mode:>8} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
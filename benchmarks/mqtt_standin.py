@@ -0,0 +1,53 @@
+import json
+import threading
+from typing import Dict, List, Optional
+from backend.protocols import MQTTHandler
+
+# Lokalny zamiennik brokera MQTT i MQTTHandler do testów i benchmarków (bez sieci i paho).
+# Publikacja trafia synchronicznie do wszystkich podłączonych handlerów subskrybujących temat.
+
+class InMemoryBroker:
+    def __init__(self):
+        self._subscribers: Dict[str, List["StandInMQTTHandler"]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, topic: str, handler: "StandInMQTTHandler"):
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: bytes):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+            self.published += 1
+        for handler in subscribers:
+            handler.dispatch(topic, payload)
+
+class StandInMQTTHandler(MQTTHandler):
+    def __init__(self, broker: InMemoryBroker, origin: str, topics=("expenses/events", "chat/messages")):
+        super().__init__(origin=origin, enabled=True)
+        self.broker = broker
+        self.published: List[dict] = []
+        for topic in topics:
+            broker.subscribe(topic, self)
+        self.connected = True
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def publish(self, message: dict, topic: str = "expenses/events", outbox_id: Optional[int] = None) -> bool:
+        if not self.connected:
+            return False
+        envelope = self.envelope(message, outbox_id)
+        self.published.append(envelope)
+        self.broker.publish(topic, json.dumps(envelope).encode())
+        return True
+
+    def publish_expense_event(self, event_type: str, expense_id: int, **kwargs) -> bool:
+        return self.publish({"event": event_type, "expense_id": expense_id, **kwargs})
+
+    def publish_chat_message(self, username: str, content: str) -> bool:
+        return self.publish({"event": "chat", "user": username, "msg": content}, "chat/messages")
@@ -1,6 +1,7 @@
 const API_URL = "http://localhost:8000";
 let token = localStorage.getItem("token");
 let currentUser = localStorage.getItem("username");
+let currentUserId = null;
 let ws = null;
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -88,6 +89,16 @@ async function logout() {
     showAuth();
 }
 
+function sessionExpired() {
+    localStorage.removeItem("token");
+    localStorage.removeItem("username");
+    token = null;
+    currentUser = null;
+    ws = null;
+    showAuth();
+    alert("Sesja wygasła - zaloguj się ponownie.");
+}
+
 function showAuth() {
     document.getElementById('auth-view').classList.remove('hidden');
     document.getElementById('dashboard-view').classList.add('hidden');
@@ -104,61 +115,167 @@ function showDashboard() {
     initWebSocket();
 }
 
-async function loadChatHistory() {
+// Historia czatu: najnowsze wiadomości, wcześniejsze doczytywane kursorem ("Starsze wiadomości")
+let chatCursor = null;
+
+async function loadChatHistory(cursor = null) {
     try {
-        const response = await fetch(`${API_URL}/chat/history`, {
+        const params = new URLSearchParams();
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_URL}/chat/history?${params}`, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         if (response.ok) {
-            const messages = await response.json();
+            const page = await response.json();
             const container = document.getElementById('chat-messages');
-            container.innerHTML = '';
-            messages.forEach(msg => {
-                const time = new Date(msg.timestamp).toLocaleTimeString();
-                const username = msg.user ? msg.user.username : 'Unknown';
-                addChatMessage(username, msg.content, time, msg.id);
-            });
+            if (cursor) {
+                const first = container.querySelector('.message');
+                const previousHeight = container.scrollHeight;
+                page.items.forEach(msg => container.insertBefore(createChatMessage(msg.user ? msg.user.username : 'Unknown', msg.content, new Date(msg.timestamp).toLocaleTimeString(), msg.id), first));
+                container.scrollTop += container.scrollHeight - previousHeight;
+            } else {
+                container.querySelectorAll('.message').forEach(el => el.remove());
+                page.items.forEach(msg => {
+                    const time = new Date(msg.timestamp).toLocaleTimeString();
+                    const username = msg.user ? msg.user.username : 'Unknown';
+                    addChatMessage(username, msg.content, time, msg.id);
+                });
+            }
+            chatCursor = page.next_cursor;
+            document.getElementById('load-older-messages').classList.toggle('hidden', !chatCursor);
         }
     } catch (e) {
         console.error("Failed to load chat history", e);
     }
 }
 
-// Pobieranie danych przez REST API (GET /expenses)
-async function loadExpenses(search = "") {
-    let url = `${API_URL}/expenses/`;
-    if (search) url += `?search=${search}`;
+function loadOlderMessages() {
+    if (chatCursor) loadChatHistory(chatCursor);
+}
+
+// Pobieranie danych przez REST API (GET /expenses), strona po stronie
+let expensesCursor = null;
+// Numer ostatniej zmiany wydatków uwzględnionej na liście (GET /expenses/changes?since=...)
+let expensesSeq = 0;
+
+async function loadExpenses(search = "", cursor = null) {
+    const params = new URLSearchParams();
+    if (search) params.set('search', search);
+    if (cursor) params.set('cursor', cursor);
+    const url = `${API_URL}/expenses/?${params}`;
 
     const response = await fetch(url, {
         headers: { 'Authorization': `Bearer ${token}` }
     });
-    const expenses = await response.json();
-    renderExpenses(expenses);
-    calculateDebt(expenses);
+    const page = await response.json();
+    if (!cursor && page.seq !== null) expensesSeq = page.seq;
+    expensesCursor = page.next_cursor;
+    renderExpenses(page.items, Boolean(cursor));
+    document.getElementById('load-more-expenses').classList.toggle('hidden', !expensesCursor);
+    if (!cursor) loadBalances();
+}
+
+function loadMoreExpenses() {
+    if (expensesCursor) loadExpenses(document.getElementById('search-input').value, expensesCursor);
 }
 
-function renderExpenses(expenses) {
+function renderExpenses(expenses, append = false) {
     const list = document.getElementById('expense-list');
-    list.innerHTML = '';
+    if (!append) list.innerHTML = '';
 
-    expenses.forEach(exp => {
-        const div = document.createElement('div');
-        div.className = 'expense-item';
-        div.innerHTML = `
-            <div class="expense-details">
-                <strong>${exp.description}</strong> - ${exp.amount} PLN <br>
-                <small>Paid by: ${exp.payer ? exp.payer.username : 'Unknown'} | Date: ${new Date(exp.timestamp).toLocaleString()}</small>
-            </div>
-            <div class="expense-actions">
-                ${exp.payer && exp.payer.username === currentUser ? `<button onclick="deleteExpense(${exp.id})">Delete</button>` : ''}
-            </div>
-        `;
-        list.appendChild(div);
-    });
+    expenses.forEach(exp => list.appendChild(renderExpenseItem(exp)));
+}
+
+function renderExpenseItem(exp) {
+    const div = document.createElement('div');
+    div.className = 'expense-item';
+    div.dataset.expenseId = exp.id;
+    div.dataset.sortKey = expenseSortKey(exp);
+    div.innerHTML = `
+        <div class="expense-details">
+            <strong>${exp.description}</strong> - ${exp.amount} ${exp.currency || 'PLN'} <br>
+            <small>Paid by: ${exp.payer ? exp.payer.username : 'Unknown'} | Date: ${new Date(exp.timestamp).toLocaleString()}</small>
+        </div>
+        <div class="expense-actions">
+            <button onclick="showReceipts(${exp.id})">Receipts</button>
+            ${exp.payer && exp.payer.username === currentUser ? `<button onclick="attachReceipt(${exp.id})">Attach receipt</button>` : ''}
+            ${exp.payer && exp.payer.username === currentUser ? `<button onclick="deleteExpense(${exp.id})">Delete</button>` : ''}
+        </div>
+    `;
+    return div;
+}
+
+// Klucz kolejności listy (timestamp, id) - taki sam jak przy stronicowaniu na serwerze
+function expenseSortKey(exp) {
+    return `${new Date(exp.timestamp).getTime().toString().padStart(15, '0')}-${String(exp.id).padStart(12, '0')}`;
+}
+
+// Nanosi jedną zmianę wydatku na wyświetloną listę (op: created / updated / deleted)
+function applyExpenseChange(op, expenseId, expense) {
+    const list = document.getElementById('expense-list');
+    const existing = list.querySelector(`[data-expense-id="${expenseId}"]`);
+    if (existing) existing.remove();
+    if (op === 'deleted' || !expense) return;
+
+    const item = renderExpenseItem(expense);
+    const next = Array.from(list.children).find(el => el.dataset.sortKey < item.dataset.sortKey);
+    if (next) list.insertBefore(item, next);
+    else if (!expensesCursor) list.appendChild(item);
+    // Starsze niż wczytane strony - pojawi się po "Load more"
+}
+
+// Pobiera zmiany po expensesSeq i nanosi je na listę zamiast wczytywać ją od nowa
+let expensesSyncing = false;
+let expensesSyncAgain = false;
+
+async function syncExpenses() {
+    const search = document.getElementById('search-input').value;
+    if (search) return loadExpenses(search);
+    if (expensesSyncing) {
+        expensesSyncAgain = true;
+        return;
+    }
+    expensesSyncing = true;
+    try {
+        do {
+            expensesSyncAgain = false;
+            let hasMore = true;
+            while (hasMore) {
+                const response = await fetch(`${API_URL}/expenses/changes?since=${expensesSeq}`, {
+                    headers: { 'Authorization': `Bearer ${token}` }
+                });
+                if (!response.ok) return;
+                const feed = await response.json();
+                if (feed.reset) return loadExpenses();
+                feed.changes.forEach(change => applyExpenseChange(change.op, change.expense_id, change.expense));
+                if (feed.changes.length) expensesSeq = feed.changes[feed.changes.length - 1].seq;
+                hasMore = feed.has_more;
+            }
+        } while (expensesSyncAgain);
+        loadBalances();
+    } finally {
+        expensesSyncing = false;
+    }
+}
+
+const EXPENSE_EVENT_OPS = { new_expense: 'created', update_expense: 'updated', delete_expense: 'deleted' };
+
+// Zdarzenie z numerem zmiany: kolejna zmiana jest nanoszona od razu, przy luce - synchronizacja
+function handleExpenseEvent(data) {
+    if (data.seq <= expensesSeq) return;
+    const op = EXPENSE_EVENT_OPS[data.event];
+    const complete = op && (op === 'deleted' || data.expense);
+    if (complete && data.seq === expensesSeq + 1 && !expensesSyncing && !document.getElementById('search-input').value) {
+        applyExpenseChange(op, data.expense_id, data.expense);
+        expensesSeq = data.seq;
+        loadBalances();
+    } else {
+        syncExpenses();
+    }
 }
 
 async function addExpense() {
-    const amount = parseFloat(document.getElementById('exp-amount').value);
+    const amount = document.getElementById('exp-amount').value.trim();
     const description = document.getElementById('exp-desc').value;
 
     const checkboxes = document.querySelectorAll('input[name="split-user"]:checked');
@@ -166,13 +283,10 @@ async function addExpense() {
 
     if (!amount || !description) return alert("Fill all fields");
 
-    const totalPeople = selectedUserIds.length + 1;
-    const splitAmount = amount / totalPeople;
-
-    const shares = selectedUserIds.map(uid => ({
-        debtor_id: uid,
-        amount_owed: splitAmount
-    }));
+    // Podział po równo liczy serwer (w groszach, reszta rozdzielana deterministycznie);
+    // udział płacącego nie zmienia sald, ale dzieli kwotę na właściwą liczbę osób
+    const participants = currentUserId !== null ? [currentUserId, ...selectedUserIds] : selectedUserIds;
+    const shares = participants.map(uid => ({ debtor_id: uid }));
 
     try {
         const response = await fetch(`${API_URL}/expenses/`, {
@@ -184,6 +298,7 @@ async function addExpense() {
             body: JSON.stringify({
                 amount,
                 description,
+                split: shares.length ? 'equal' : null,
                 shares
             })
         });
@@ -204,28 +319,57 @@ async function deleteExpense(id) {
     });
 }
 
-function calculateDebt(expenses) {
-    let iOwe = 0;
-    let owedToMe = 0;
-
-    expenses.forEach(exp => {
-        if (exp.payer && exp.payer.username === currentUser) {
-            exp.shares.forEach(share => {
-                if (share.debtor && share.debtor.username !== currentUser) {
-                    owedToMe += share.amount_owed;
-                }
-            });
-        }
-        else if (exp.payer && exp.payer.username !== currentUser) {
-            exp.shares.forEach(share => {
-                if (share.debtor && share.debtor.username === currentUser) {
-                    iOwe += share.amount_owed;
-                }
-            });
+// Paragon wysyłany jako surowe ciało żądania (obraz albo PDF)
+function attachReceipt(expenseId) {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = 'image/jpeg,image/png,image/webp,application/pdf';
+    input.onchange = async () => {
+        const file = input.files[0];
+        if (!file) return;
+        const response = await fetch(`${API_URL}/expenses/${expenseId}/receipts?filename=${encodeURIComponent(file.name)}`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': file.type || 'application/octet-stream' },
+            body: file
+        });
+        if (response.ok) {
+            showNotification('Paragon dodany');
+        } else {
+            const error = await response.json();
+            alert(error.detail);
         }
+    };
+    input.click();
+}
+
+// Paragony wydatku otwierane w nowych kartach (uwierzytelnienie ciasteczkiem)
+async function showReceipts(expenseId) {
+    const response = await fetch(`${API_URL}/expenses/${expenseId}/receipts`, {
+        headers: { 'Authorization': `Bearer ${token}` }
     });
+    const receipts = await response.json();
+    if (!receipts.length) {
+        showNotification('Brak paragonów');
+        return;
+    }
+    receipts.forEach(receipt => window.open(`${API_URL}/receipts/${receipt.id}`, '_blank'));
+}
+
+// Pobieranie salda z serwera (GET /balances)
+async function loadBalances() {
+    const response = await fetch(`${API_URL}/balances/`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+    });
+    if (!response.ok) return;
+    const summary = await response.json();
+    calculateDebt(summary);
+}
+
+function calculateDebt(summary) {
+    const iOwe = summary.i_owe;
+    const owedToMe = summary.owed_to_me;
 
-    const net = owedToMe - iOwe;
+    const net = summary.net;
     const container = document.getElementById('debt-summary');
 
     let html = `<p>Jesteś winien innym: <strong>${iOwe.toFixed(2)} PLN</strong></p>`;
@@ -247,14 +391,21 @@ function debounceSearch() {
 // Połączenie z WebSocket dla czatu w czasie rzeczywistym
 function initWebSocket() {
     if (ws) ws.close();
-    ws = new WebSocket(`ws://localhost:8000/ws`);
+    const socket = new WebSocket(`ws://localhost:8000/ws`);
+    ws = socket;
+
+    // 1008 - serwer nie przyjął sesji (brak lub wygasłe ciasteczko): powrót do logowania
+    socket.onclose = (event) => {
+        if (event.code === 1008 && ws === socket) sessionExpired();
+    };
 
     // Odbieranie wiadomości WebSocket (event listener)
     ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
 
         if (data.event === 'chat') {
-            addChatMessage(data.user, data.msg, data.time, data.message_id);
+            const time = data.timestamp ? new Date(data.timestamp).toLocaleTimeString() : data.time;
+            addChatMessage(data.user, data.msg, time, data.message_id);
         } else if (data.event === 'delete_message') {
             const msgEl = document.querySelector(`[data-message-id="${data.message_id}"]`);
             if (msgEl) msgEl.remove();
@@ -264,6 +415,11 @@ function initWebSocket() {
                 const contentEl = msgEl.querySelector('.msg-content');
                 if (contentEl) contentEl.textContent = data.content;
             }
+        } else if (data.event === 'new_user' || data.event === 'delete_user') {
+            loadUsers();
+        } else if (typeof data.seq === 'number') {
+            showNotification(`Zdarzenie: ${data.event}`);
+            handleExpenseEvent(data);
         } else {
             showNotification(`Zdarzenie: ${data.event}`);
             loadExpenses(document.getElementById('search-input').value);
@@ -288,6 +444,12 @@ function sendChat() {
 }
 
 function addChatMessage(user, msg, time, messageId = null) {
+    const container = document.getElementById('chat-messages');
+    container.appendChild(createChatMessage(user, msg, time, messageId));
+    container.scrollTop = container.scrollHeight;
+}
+
+function createChatMessage(user, msg, time, messageId = null) {
     const div = document.createElement('div');
     div.className = 'message';
     if (messageId) div.dataset.messageId = messageId;
@@ -301,9 +463,7 @@ function addChatMessage(user, msg, time, messageId = null) {
         <span class="msg-content">${msg}</span>
         ${actionBtns}
     `;
-    const container = document.getElementById('chat-messages');
-    container.appendChild(div);
-    container.scrollTop = container.scrollHeight;
+    return div;
 }
 
 async function editMessage(messageId) {
@@ -421,7 +581,10 @@ async function loadUsers() {
     container.innerHTML = '';
 
     users.forEach(user => {
-        if (user.username === currentUser) return;
+        if (user.username === currentUser) {
+            currentUserId = user.id;
+            return;
+        }
 
         const div = document.createElement('div');
         div.className = 'user-select-item';
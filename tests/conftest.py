@@ -0,0 +1,37 @@
+import os
+import tempfile
+import pytest
+
+# Środowisko testów ustawiane przed importem backend (moduły czytają je przy imporcie):
+# tymczasowa baza migrowana przy starcie aplikacji, bez MQTT, logi tylko na konsolę
+# Uruchomienie (z katalogu głównego repozytorium): python -m pytest
+_tmp = tempfile.mkdtemp(prefix="expenses-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("RECEIPTS_DIR", os.path.join(_tmp, "receipts"))
+os.environ.setdefault("AUTO_MIGRATE", "1")
+os.environ.setdefault("MQTT_ENABLED", "0")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("ACCESS_LOG", "0")
+
+from fastapi.testclient import TestClient
+
+USERS = ("alice", "bob", "carol")
+PASSWORD = "secret-password"
+
+# Jedna aplikacja na całą sesję testów - pisarz czatu i backplane są singletonami związanymi z pętlą zdarzeń
+@pytest.fixture(scope="session")
+def client():
+    from backend.main import app
+    with TestClient(app) as client:
+        for username in USERS:
+            client.post("/users/", json={"username": username, "password": PASSWORD})
+        yield client
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    token = client.post("/token", data={"username": USERS[0], "password": PASSWORD}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture(scope="session")
+def user_ids(client, auth_headers):
+    return [user["id"] for user in client.get("/users/", headers=auth_headers).json()]
@@ -0,0 +1,71 @@
+from datetime import datetime
+from backend import changelog, models
+from backend.database import SessionLocal
+
+def _create(client, auth_headers, user_ids, description, amount=10):
+    response = client.post("/expenses/", headers=auth_headers, json={
+        "amount": amount, "description": description, "split": "equal",
+        "shares": [{"debtor_id": user_id} for user_id in user_ids[:2]],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _changes(client, auth_headers, since, **params):
+    response = client.get("/expenses/changes", headers=auth_headers, params={"since": since, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_changes_since_returns_changes_in_order(client, auth_headers, user_ids):
+    since = _changes(client, auth_headers, 0, limit=1)["latest_seq"]
+    expense = _create(client, auth_headers, user_ids, "changelog order")
+    client.put(f"/expenses/{expense['id']}", headers=auth_headers, json={
+        "amount": 12, "description": "changelog order (edited)", "split": "equal", "shares": [{"debtor_id": user_ids[0]}],
+    }).raise_for_status()
+    assert client.delete(f"/expenses/{expense['id']}", headers=auth_headers).status_code == 200
+
+    feed = _changes(client, auth_headers, since)
+    assert [(change["op"], change["expense_id"]) for change in feed["changes"]] == [
+        (changelog.CREATED, expense["id"]), (changelog.UPDATED, expense["id"]), (changelog.DELETED, expense["id"]),
+    ]
+    assert feed["changes"][1]["expense"]["description"] == "changelog order (edited)"
+    assert feed["latest_seq"] == feed["changes"][-1]["seq"] and not feed["reset"]
+
+    page = _changes(client, auth_headers, since, limit=2)
+    assert page["has_more"] and len(page["changes"]) == 2
+    rest = _changes(client, auth_headers, page["changes"][-1]["seq"])
+    assert [change["op"] for change in rest["changes"]] == [changelog.DELETED]
+
+# Z kilku zmian wydatku zostaje ostatnia, przeterminowane usunięcia przesuwają horyzont -
+# klient z numerem sprzed horyzontu dostaje reset i wczytuje listę od nowa
+def test_compact_keeps_latest_change_and_resets_below_horizon(client, auth_headers, user_ids):
+    since = _changes(client, auth_headers, 0, limit=1)["latest_seq"]
+    removed = _create(client, auth_headers, user_ids, "compact removed")
+    assert client.delete(f"/expenses/{removed['id']}", headers=auth_headers).status_code == 200
+    kept = _create(client, auth_headers, user_ids, "compact kept")
+    for amount in (11, 12):
+        client.put(f"/expenses/{kept['id']}", headers=auth_headers, json={
+            "amount": amount, "description": f"compact kept {amount}", "split": "equal", "shares": [{"debtor_id": user_ids[1]}],
+        }).raise_for_status()
+
+    db = SessionLocal()
+    try:
+        db.query(models.ExpenseChange).filter(
+            models.ExpenseChange.expense_id == removed["id"], models.ExpenseChange.op == changelog.DELETED,
+        ).update({models.ExpenseChange.timestamp: datetime(2000, 1, 1)})
+        db.commit()
+        latest = changelog.latest_seq(db)
+        superseded, expired = changelog.compact(db, retention_days=30)
+        assert superseded >= 3 and expired >= 1
+        horizon = changelog.horizon(db)
+        assert since < horizon <= latest
+        assert changelog.latest_seq(db) == latest
+    finally:
+        db.close()
+
+    stale = _changes(client, auth_headers, since)
+    assert stale["reset"] and stale["changes"] == [] and stale["latest_seq"] == latest
+    feed = _changes(client, auth_headers, horizon)
+    assert not feed["reset"]
+    mine = [change for change in feed["changes"] if change["expense_id"] in (kept["id"], removed["id"])]
+    assert [(change["op"], change["expense_id"]) for change in mine] == [(changelog.UPDATED, kept["id"])]
+    assert mine[0]["expense"]["description"] == "compact kept 12"
@@ -0,0 +1,38 @@
+import pytest
+from backend import metrics
+
+EXPENSES = 60
+
+@pytest.fixture(scope="module")
+def seeded(client, auth_headers, user_ids):
+    for index in range(EXPENSES):
+        response = client.post("/expenses/", headers=auth_headers, json={
+            "amount": 10 + index,
+            "description": f"expense {index}",
+            "split": "equal",
+            "shares": [{"debtor_id": user_id} for user_id in user_ids],
+        })
+        assert response.status_code == 200, response.text
+    # Rozgrzewa pamięć podręczną tokenów - następne żądania nie sprawdzają użytkownika w bazie
+    client.get("/users/me", headers=auth_headers)
+
+def _queries(client, auth_headers, params: dict):
+    before = metrics.DB_QUERIES.value
+    response = client.get("/expenses/", headers=auth_headers, params=params)
+    assert response.status_code == 200, response.text
+    return metrics.DB_QUERIES.value - before, response.json()
+
+# Liczba zapytań strony listy nie zależy od liczby wydatków na stronie (udziały i płatnik ładowane razem, bez N+1)
+def test_expense_list_query_count_is_constant(client, auth_headers, seeded):
+    counts = {}
+    for limit in (1, 5, 25, 50):
+        counts[limit], page = _queries(client, auth_headers, {"limit": limit})
+        assert len(page["items"]) == limit
+        assert all(len(item["shares"]) == 3 for item in page["items"])
+    assert len(set(counts.values())) == 1, counts
+
+def test_next_page_query_count_matches_first_page(client, auth_headers, seeded):
+    first, page = _queries(client, auth_headers, {"limit": 20})
+    following, next_page = _queries(client, auth_headers, {"limit": 20, "cursor": page["next_cursor"]})
+    assert following == first
+    assert {item["id"] for item in page["items"]}.isdisjoint(item["id"] for item in next_page["items"])
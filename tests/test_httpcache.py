@@ -0,0 +1,28 @@
+from backend import httpcache, models
+from backend.database import AsyncSessionLocal
+
+# ETag zależy tylko od wersji w bazie - worker z innym licznikiem w pamięci odpowiada 304 na ten sam ETag
+def test_etag_is_shared_between_workers(client, auth_headers):
+    first = client.get("/users/", headers=auth_headers)
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"users.')
+    httpcache.versions.bump(httpcache.USERS)
+    assert client.get("/users/", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+    again = client.get("/users/", headers=auth_headers)
+    assert again.headers["etag"] == etag and again.json() == first.json()
+
+# Zapis w innym workerze (osobna sesja, bez licznika w tym procesie) zmienia ETag i unieważnia odpowiedź
+def test_write_in_another_worker_invalidates(client, auth_headers):
+    first = client.get("/users/", headers=auth_headers)
+
+    async def other_worker():
+        async with AsyncSessionLocal() as db:
+            db.add(models.User(username="other-worker", hashed_password="x"))
+            await httpcache.versions.stage(db, httpcache.USERS)
+            await db.commit()
+    client.portal.call(other_worker)
+
+    response = client.get("/users/", headers={**auth_headers, "If-None-Match": first.headers["etag"]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != first.headers["etag"]
+    assert "other-worker" in [user["username"] for user in response.json()]
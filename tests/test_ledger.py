@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import pytest
+from backend import ledger
+
+PREFIX = "ledger round-trip"
+
+@pytest.fixture(scope="module")
+def originals(client, auth_headers, user_ids):
+    descriptions = [f"{PREFIX} plain", f'{PREFIX} "quoted", with comma', f"{PREFIX} multi\nline", f"{PREFIX} zażółć"]
+    created = set()
+    for index, description in enumerate(descriptions):
+        response = client.post("/expenses/", headers=auth_headers, json={
+            "amount": f"{10 + index}.01", "description": description, "split": "equal",
+            "shares": [{"debtor_id": user_id} for user_id in user_ids[:index % 3 + 1]],
+        })
+        assert response.status_code == 200, response.text
+        created.add(response.json()["id"])
+    return created
+
+def _export(client, auth_headers, fmt: str) -> str:
+    response = client.get("/expenses/export", headers=auth_headers, params={"format": fmt})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith(ledger.MEDIA_TYPES[fmt])
+    return response.text
+
+# Wydatki z eksportu jako porównywalne krotki (id, kwota, waluta, opis, czas, udziały)
+def _parse(text: str, fmt: str) -> list:
+    if fmt == ledger.NDJSON:
+        rows = [json.loads(line) for line in text.splitlines() if line]
+        return [(row["id"], row["amount_minor"], row["currency"], row["description"], row["timestamp"],
+                 tuple((share["debtor_id"], share["amount_owed_minor"]) for share in row["shares"])) for row in rows]
+    rows = list(csv.DictReader(io.StringIO(text)))
+    return [(int(row["id"]), row["amount"], row["currency"], row["description"], row["timestamp"], row["shares"]) for row in rows]
+
+# Wybrane wydatki bez id (i płacącego - przy imporcie płaci importujący)
+def _records(text: str, fmt: str, selected) -> list:
+    return sorted(record[1:] for record in _parse(text, fmt) if selected(record[0]))
+
+def _import(client, auth_headers, fmt: str, body: str):
+    response = client.post("/expenses/import", headers={**auth_headers, "Content-Type": ledger.MEDIA_TYPES[fmt]}, content=body.encode())
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.mark.parametrize("fmt", [ledger.CSV, ledger.NDJSON])
+def test_export_import_round_trip(client, auth_headers, originals, fmt):
+    exported = _export(client, auth_headers, fmt)
+    expected = _records(exported, fmt, originals.__contains__)
+    assert len(expected) == len(originals)
+
+    if fmt == ledger.NDJSON:
+        body = "".join(line + "\n" for line in exported.splitlines() if json.loads(line)["id"] in originals)
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        rows = list(csv.reader(io.StringIO(exported)))
+        writer.writerow(rows[0])
+        writer.writerows(row for row in rows[1:] if int(row[0]) in originals)
+        body = buffer.getvalue()
+
+    before = max(record[0] for record in _parse(exported, fmt))
+    summary = _import(client, auth_headers, fmt, body)
+    assert (summary["created"], summary["failed"], summary["errors"]) == (len(originals), 0, [])
+    assert _records(_export(client, auth_headers, fmt), fmt, lambda expense_id: expense_id > before) == expected
+
+def test_import_rejects_invalid_rows_per_item(client, auth_headers, user_ids):
+    good = {"amount": "5.00", "description": f"{PREFIX} valid", "shares": [{"debtor_id": user_ids[1], "amount_owed": "5.00"}]}
+    lines = [
+        json.dumps(good),
+        "{not json",
+        json.dumps({**good, "amount": "-1.00"}),
+        json.dumps({**good, "shares": [{"debtor_id": 999999, "amount_owed": "5.00"}]}),
+        json.dumps({"description": "no amount"}),
+        json.dumps({**good, "description": f"{PREFIX} valid again"}),
+    ]
+    summary = _import(client, auth_headers, ledger.NDJSON, "\n".join(lines) + "\n")
+    assert (summary["created"], summary["failed"]) == (2, 4)
+    errors = {error["index"]: " ".join(error["errors"]) for error in summary["errors"]}
+    assert sorted(errors) == [2, 3, 4, 5]
+    assert "invalid JSON" in errors[2]
+    assert "must not be negative" in errors[3]
+    assert "user 999999 does not exist" in errors[4]
+    assert "amount or amount_minor is required" in errors[5]
+
+    csv_body = "amount,description,shares\n7.50,csv valid,{0}:7.50\nabc,csv bad amount,{0}:1\n3,csv bad shares,{0}-3\n".format(user_ids[0])
+    summary = _import(client, auth_headers, ledger.CSV, csv_body)
+    assert (summary["created"], summary["failed"]) == (1, 2)
+    assert [error["index"] for error in summary["errors"]] == [3, 4]
+
+def test_import_requires_known_format(client, auth_headers):
+    response = client.post("/expenses/import", headers={**auth_headers, "Content-Type": "text/plain"}, content=b"x")
+    assert response.status_code == 415
+    response = client.post("/expenses/import", headers={**auth_headers, "Content-Type": "text/csv"}, content=b"description\nx\n")
+    assert response.status_code == 400
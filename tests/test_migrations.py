@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from backend import balances, migrations, models
+from backend.manage import migrate_database
+
+# Schemat bazy sprzed migracji (pierwsza wersja aplikacji: kwoty jako FLOAT, bez sald i zestawień)
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, hashed_password VARCHAR, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE TABLE expenses (id INTEGER NOT NULL, payer_id INTEGER, amount FLOAT, description VARCHAR, timestamp DATETIME, "
+    "PRIMARY KEY (id), FOREIGN KEY(payer_id) REFERENCES users (id))",
+    "CREATE TABLE expense_shares (id INTEGER NOT NULL, expense_id INTEGER, debtor_id INTEGER, amount_owed FLOAT, "
+    "PRIMARY KEY (id), FOREIGN KEY(expense_id) REFERENCES expenses (id), FOREIGN KEY(debtor_id) REFERENCES users (id))",
+    "CREATE TABLE messages (id INTEGER NOT NULL, user_id INTEGER, content VARCHAR, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+]
+
+BASELINE_DATA = [
+    "INSERT INTO users (id, username, hashed_password) VALUES (1, 'ala', 'x'), (2, 'bolek', 'x'), (3, 'cezary', 'x')",
+    "INSERT INTO expenses (id, payer_id, amount, description, timestamp) VALUES "
+    "(1, 1, 30.0, 'Pizza', '2026-02-04 00:11:52.377158'), (2, 2, 10.01, 'Kawa', '2026-02-05 08:00:00.000000')",
+    "INSERT INTO expense_shares (id, expense_id, debtor_id, amount_owed) VALUES "
+    "(1, 1, 1, 10.0), (2, 1, 2, 10.0), (3, 1, 3, 10.0), (4, 2, 1, 5.01), (5, 2, 2, 5.0)",
+    "INSERT INTO messages (id, user_id, content) VALUES (1, 1, 'cześć')",
+]
+
+def _baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA + BASELINE_DATA:
+            conn.execute(text(statement))
+    return engine
+
+def test_migrating_baseline_database_backfills_balances(tmp_path):
+    engine = _baseline_engine(tmp_path)
+    try:
+        applied, rebuilt = migrate_database(engine)
+        assert applied == [migration.revision for migration in migrations.MIGRATIONS]
+        assert "Balances" in rebuilt
+        with Session(engine) as db:
+            stored = {(b.user_id, b.counterparty_id): b.amount_minor for b in db.query(models.Balance)}
+            assert stored == {(1, 2): 499, (2, 1): -499, (1, 3): 1000, (3, 1): -1000}
+            assert balances.rebuild_balances(db) == 0
+            # Czas wiadomości z CURRENT_TIMESTAMP (bez części ułamkowej) uzupełniony przez 0006
+            assert len(db.execute(text("SELECT timestamp FROM messages WHERE id = 1")).scalar()) == 26
+        # Kolejne migrate niczego nie przelicza
+        assert migrate_database(engine) == ([], [])
+    finally:
+        engine.dispose()
@@ -0,0 +1,86 @@
+import itertools
+import pytest
+from pydantic import ValidationError
+from backend import money, schemas
+
+def _shares(*values, field="weight"):
+    return [schemas.ExpenseShareCreate(debtor_id=debtor_id, **{field: value}) for debtor_id, value in values]
+
+def test_to_minor_rounds_half_up_from_shortest_decimal():
+    assert money.to_minor(0.285) == 29
+    assert money.to_minor("12.345") == 1235
+    assert money.to_minor("-0.005") == -1
+    assert money.to_minor(7, "JPY") == 7 and money.to_minor("1.2345", "KWD") == 1235
+    with pytest.raises(ValueError):
+        money.to_minor("NaN")
+
+def test_allocate_sums_to_total():
+    for total, count in itertools.product((0, 1, 2, 99, 100, 1001, 10 ** 9 + 7), range(1, 8)):
+        parts = money.allocate(total, [1] * count)
+        assert sum(parts) == total
+        assert max(parts) - min(parts) <= 1
+    for weights in ([1, 2, 3], ["0.5", "0.25", "0.25"], [3, 0, 7], ["1.1", "2.2", "3.3", "0.01"]):
+        assert sum(money.allocate(1001, weights)) == 1001
+
+# Pozostałe jednostki trafiają do największych reszt, przy równych resztach - w kolejności order
+def test_allocate_remainder_order_is_stable():
+    assert money.allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert money.allocate(100, [1, 1, 1], order=[3, 2, 1]) == [33, 33, 34]
+    assert money.allocate(200, [1, 1, 1], order=[2, 3, 1]) == [67, 66, 67]
+    # 142.86, 285.71, 571.43 - dwie brakujące jednostki dostają reszty .86 i .71, nie .43
+    assert money.allocate(1000, [1, 2, 4]) == [143, 286, 571]
+
+def test_allocate_negative_total_mirrors_positive():
+    assert money.allocate(-100, [1, 1, 1]) == [-34, -33, -33]
+
+def test_allocate_zero_and_negative_weights():
+    assert money.allocate(100, [0, 1, 1]) == [0, 50, 50]
+    with pytest.raises(ValueError):
+        money.allocate(100, [0, 0])
+    with pytest.raises(ValueError):
+        money.allocate(100, [2, -1])
+    with pytest.raises(ValueError):
+        money.allocate(100, [])
+
+def test_split_equal_orders_remainder_by_debtor_id():
+    shares = _shares((9, None), (2, None), (5, None))
+    assert money.split(money.EQUAL, 100, shares) == [33, 34, 33]
+    assert sum(money.split(money.EQUAL, 1, shares)) == 1
+
+def test_split_weight():
+    assert money.split(money.WEIGHT, 1000, _shares((1, 1), (2, 3))) == [250, 750]
+    with pytest.raises(ValueError, match="every share needs weight"):
+        money.split(money.WEIGHT, 1000, _shares((1, 1), (2, None)))
+
+def test_split_exact_must_match_total():
+    shares = _shares((1, 600), (2, 400), field="amount_owed_minor")
+    assert money.split(money.EXACT, 1000, shares) == [600, 400]
+    with pytest.raises(ValueError, match="add up to 1000, expected 999"):
+        money.split(money.EXACT, 999, shares)
+    with pytest.raises(ValueError, match="every share needs amount_owed"):
+        money.split(money.EXACT, 1000, _shares((1, 1000), (2, None), field="amount_owed_minor"))
+
+def test_split_rejects_duplicate_debtors_and_unknown_method():
+    with pytest.raises(ValueError, match="only once"):
+        money.split(money.EQUAL, 100, _shares((1, None), (1, None)))
+    with pytest.raises(ValueError, match="split must be one of"):
+        money.split("random", 100, _shares((1, None)))
+
+def test_expense_validator_applies_split():
+    expense = schemas.ExpenseCreate(amount="10.00", description="x", split="equal", shares=[{"debtor_id": 2}, {"debtor_id": 1}, {"debtor_id": 3}])
+    assert expense.amount_minor == 1000
+    assert [share.amount_owed_minor for share in expense.shares] == [333, 334, 333]
+
+def test_expense_validator_rejects_exact_shares_not_matching_total():
+    with pytest.raises(ValidationError, match="add up to 900, expected 1000"):
+        schemas.ExpenseCreate(amount="10.00", description="x", split="exact", shares=[
+            {"debtor_id": 1, "amount_owed": "4.50"}, {"debtor_id": 2, "amount_owed": "4.50"},
+        ])
+
+def test_create_expense_with_mismatched_exact_split_is_rejected(client, auth_headers, user_ids):
+    response = client.post("/expenses/", headers=auth_headers, json={
+        "amount": 10, "description": "x", "split": "exact",
+        "shares": [{"debtor_id": user_ids[0], "amount_owed": 3}, {"debtor_id": user_ids[1], "amount_owed": 3}],
+    })
+    assert response.status_code == 422
+    assert "add up to 600, expected 1000" in response.text
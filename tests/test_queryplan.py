@@ -0,0 +1,16 @@
+from backend import queryplan
+
+# Gorące ścieżki na nowej bazie z migracji: bez pełnych skanów, indeksów tymczasowych i sortowania stron
+def test_hot_paths_use_indexes():
+    results = queryplan.check()
+    assert {path for path, _, _, _ in results} == {path.name for path in queryplan.HOT_PATHS}
+    problems = [(path, " ".join(statement.split()), found) for path, statement, _, found in results if found]
+    assert problems == []
+
+def test_plan_problems_flags_full_scan_and_sort():
+    plan = ["SCAN expenses", "USE TEMP B-TREE FOR ORDER BY"]
+    assert queryplan.plan_problems(plan, ordered=True) == [
+        "full table scan: SCAN expenses",
+        "sort instead of index order: USE TEMP B-TREE FOR ORDER BY",
+    ]
+    assert queryplan.plan_problems(plan, allow_scan=("expenses",)) == []
@@ -0,0 +1,100 @@
+import asyncio
+import json
+from backend.protocols import MQTT_TOPIC_CHAT, MQTTHandler
+from backend.publisher import MQTTPublisher
+from backend.realtime import InProcessBackplane, MQTTBackplane
+
+# Handler bez brokera: publikacje są zapisywane, zdarzenia innych workerów podaje test przez dispatch()
+class FakeHandler(MQTTHandler):
+    def __init__(self, origin: str, enabled: bool = True):
+        super().__init__(origin=origin, enabled=enabled)
+        self.published = []
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def publish(self, message: dict, topic: str = MQTT_TOPIC_CHAT, outbox_id=None) -> bool:
+        self.published.append(self.envelope(message, outbox_id))
+        return True
+
+class FakeManager:
+    def __init__(self):
+        self.broadcasts = []
+
+    async def broadcast(self, message):
+        self.broadcasts.append(message)
+
+def _deliver(handler: MQTTHandler, envelope: dict):
+    handler.dispatch(MQTT_TOPIC_CHAT, json.dumps(envelope).encode())
+
+# Uruchamia scenariusz z backplane workera "local"; zwraca (backplane, rozesłane, zdarzenia listenera)
+def _run(scenario):
+    async def main():
+        handler = FakeHandler("local")
+        backplane = MQTTBackplane(handler, MQTTPublisher(handler, retry_interval=0))
+        manager = FakeManager()
+        heard = []
+        backplane.remote_listeners.append(heard.append)
+        await backplane.start(manager)
+        try:
+            await scenario(backplane, handler)
+            await asyncio.sleep(0.01)
+        finally:
+            await backplane.stop()
+        return backplane, manager.broadcasts, heard
+    return asyncio.run(main())
+
+def test_redelivered_message_is_relayed_once():
+    async def scenario(backplane, handler):
+        envelope = FakeHandler("worker-b").envelope({"event": "chat", "msg": "hi"})
+        _deliver(handler, envelope)
+        _deliver(handler, envelope)
+
+    backplane, broadcasts, heard = _run(scenario)
+    assert broadcasts == [{"event": "chat", "msg": "hi"}]
+    assert heard == broadcasts
+    assert (backplane.relayed, backplane.duplicates) == (1, 1)
+
+def test_outbox_replay_from_another_worker_is_relayed_once():
+    async def scenario(backplane, handler):
+        message = {"event": "new_expense", "expense_id": 7}
+        _deliver(handler, FakeHandler("worker-b").envelope(message, outbox_id=42))
+        # Ten sam wiersz outboksu wysłany ponownie przez inny worker - inne origin i origin_seq
+        _deliver(handler, FakeHandler("worker-c").envelope(message, outbox_id=42))
+        _deliver(handler, FakeHandler("worker-b").envelope(message, outbox_id=43))
+
+    backplane, broadcasts, _ = _run(scenario)
+    assert broadcasts == [{"event": "new_expense", "expense_id": 7}] * 2
+    assert (backplane.relayed, backplane.duplicates) == (2, 1)
+
+def test_own_outbox_event_replayed_elsewhere_is_not_relayed():
+    async def scenario(backplane, handler):
+        message = {"event": "delete_expense", "expense_id": 3}
+        await backplane.publish(message, MQTT_TOPIC_CHAT, outbox_id=5)
+        _deliver(handler, FakeHandler("worker-b").envelope(message, outbox_id=5))
+        # Własne wiadomości (to samo origin) odrzuca już handler
+        _deliver(handler, handler.envelope(message))
+
+    backplane, broadcasts, heard = _run(scenario)
+    assert broadcasts == [] and heard == []
+    assert backplane.duplicates == 1
+
+# Bez MQTT zdarzenia nie trafiają do MQTTPublisher (wcześniej każde liczone jako nieudana publikacja)
+def test_disabled_mqtt_skips_publisher():
+    async def main():
+        handler = FakeHandler("local", enabled=False)
+        backplane = InProcessBackplane(handler, MQTTPublisher(handler, retry_interval=0))
+        await backplane.start(FakeManager())
+        try:
+            for index in range(10):
+                await backplane.publish({"event": "chat", "msg": str(index)}, MQTT_TOPIC_CHAT)
+            await asyncio.sleep(0.01)
+        finally:
+            await backplane.stop()
+        return backplane.publisher.stats(), handler.published
+
+    stats, published = asyncio.run(main())
+    assert (stats["submitted"], stats["failed"], published) == (0, 0, [])
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from backend import balances, models, settlement
+from backend.database import SessionLocal
+
+def _expense(client, auth_headers, user_ids, amount):
+    response = client.post("/expenses/", headers=auth_headers, json={
+        "amount": amount,
+        "description": "settlement",
+        "split": "equal",
+        "shares": [{"debtor_id": user_id} for user_id in user_ids],
+    })
+    assert response.status_code == 200, response.text
+
+# Przeliczenie sald bez zmiany wydatków (manage rebuild-balances) unieważnia zapamiętany plan
+def test_rebuild_balances_invalidates_cached_plan(client, auth_headers, user_ids):
+    _expense(client, auth_headers, user_ids, 90)
+    db = SessionLocal()
+    try:
+        # Salda rozjechane z wydatkami - plan liczony z błędnych sald jest zapamiętany
+        db.query(models.Balance).filter(models.Balance.amount_minor > 0).update({models.Balance.amount_minor: 1})
+        db.query(models.Balance).filter(models.Balance.amount_minor < 0).update({models.Balance.amount_minor: -1})
+        db.commit()
+        stale = settlement.settle_up(db, "greedy")
+        assert settlement.settle_up(db, "greedy") is stale
+
+        before = balances.version(db)
+        assert balances.rebuild_balances(db) > 0
+        assert balances.version(db) == before + 1
+        plan = settlement.settle_up(db, "greedy")
+        assert plan != stale
+        settlement._cache.clear()
+        assert settlement.settle_up(db, "greedy") == plan
+    finally:
+        db.close()
+
+def _settled(cents, transfers) -> bool:
+    remaining = np.array(cents, dtype=np.int64)
+    for debtor, creditor, amount in transfers:
+        assert amount > 0 and remaining[debtor] < 0 < remaining[creditor]
+        remaining[debtor] += amount
+        remaining[creditor] -= amount
+    return not remaining.any()
+
+BALANCE_SETS = [
+    [],
+    [0, 0, 0],
+    [500, -500],
+    [1000, -300, -700],
+    [700, 400, -400, -700],
+    [600, 500, -500, -600, 0],
+    [100, 200, 300, -150, -150, -300],
+]
+
+def test_transfers_settle_every_balance():
+    rng = np.random.default_rng(7)
+    cases = [np.array(cents, dtype=np.int64) for cents in BALANCE_SETS]
+    for _ in range(50):
+        cents = rng.integers(-5000, 5000, size=int(rng.integers(2, 9)))
+        cents[-1] -= cents.sum()
+        cases.append(cents)
+    for cents in cases:
+        greedy = settlement.greedy_transfers(cents)
+        exact = settlement.exact_transfers(cents)
+        assert _settled(cents, greedy), cents
+        assert _settled(cents, exact), cents
+        assert len(exact) <= len(greedy) <= max(np.count_nonzero(cents) - 1, 0)
+
+# -500 i 500 rozliczają się osobno - dokładny solver potrzebuje 3 przelewów, zachłanny 4
+def test_exact_solver_finds_independent_groups():
+    cents = np.array([-600, -500, 200, 400, 500], dtype=np.int64)
+    assert len(settlement.exact_transfers(cents)) == 3
+    assert len(settlement.greedy_transfers(cents)) == 4
+
+def test_greedy_above_exact_participant_limit():
+    limit = settlement.EXACT_MAX_PARTICIPANTS
+    small = np.array([1] * (limit - 1) + [-(limit - 1)], dtype=np.int64)
+    large = np.array([1] * limit + [-limit], dtype=np.int64)
+    assert settlement.choose_method(small) == "exact"
+    assert settlement.choose_method(large) == "greedy"
+    with pytest.raises(ValueError):
+        settlement.exact_transfers(large)
+    assert _settled(large, settlement.greedy_transfers(large))
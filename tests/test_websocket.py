@@ -0,0 +1,29 @@
+import json
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from backend import auth
+from tests.conftest import PASSWORD, USERS
+
+# Bez sesji serwer przyjmuje połączenie i zamyka je kodem 1008 (frontend wraca wtedy do logowania)
+def test_websocket_without_session_closes_with_policy_violation(client, auth_headers):
+    token = auth_headers["Authorization"].removeprefix("Bearer ")
+    jar = dict(client.cookies)
+    client.cookies.clear()
+    try:
+        for path in ("/ws", f"/ws?token={token}"):
+            with client.websocket_connect(path) as ws:
+                with pytest.raises(WebSocketDisconnect) as closed:
+                    ws.receive_text()
+                assert closed.value.code == 1008
+    finally:
+        client.cookies.update(jar)
+
+# Ciasteczko z /token żyje tak długo jak token i wystarcza do uwierzytelnienia /ws
+def test_login_cookie_authenticates_websocket(client):
+    response = client.post("/token", data={"username": USERS[1], "password": PASSWORD})
+    cookie = response.headers["set-cookie"]
+    assert "HttpOnly" in cookie and f"Max-Age={auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60}" in cookie
+    with client.websocket_connect("/ws") as ws:
+        ws.send_text(json.dumps({"event": "chat", "msg": "cookie session"}))
+        message = json.loads(ws.receive_text())
+    assert (message["user"], message["msg"]) == (USERS[1], "cookie session")